@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import logging
+from sql_connection import POOL_SIZE, PoolExhaustedError
+
+logger = logging.getLogger(__name__)
+
+# Admission control in front of the connection pool.
+#
+# Every request that needs the database is admitted here before it may check
+# out a connection. In-flight DB work is capped, requests over the cap queue
+# briefly and are rejected with 503 + Retry-After once their deadline passes.
+# Checkout traffic may use the whole capacity and is served first; other
+# classes leave CHECKOUT_RESERVED slots free for it and yield to queued
+# checkouts.
+
+CHECKOUT = 'checkout'
+WRITE = 'write'
+READ = 'read'
+REPORT = 'report'
+
+CAPACITY = int(os.environ.get('ADMISSION_CAPACITY', str(POOL_SIZE)))
+CHECKOUT_RESERVED = int(os.environ.get('ADMISSION_CHECKOUT_RESERVED', '2'))
+RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', '1'))  # seconds
+
+# How long a request of each class may queue for admission (seconds)
+QUEUE_TIMEOUTS = {
+    CHECKOUT: float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_CHECKOUT', '2')),
+    WRITE: float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_WRITE', '1')),
+    READ: float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_READ', '0.5')),
+    REPORT: float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_REPORT', '0.5')),
+}
+
+# MySQL max_execution_time applied to SELECTs of each class (ms, 0 = no limit)
+STATEMENT_TIMEOUTS_MS = {
+    CHECKOUT: int(os.environ.get('STATEMENT_TIMEOUT_MS_CHECKOUT', '2000')),
+    WRITE: int(os.environ.get('STATEMENT_TIMEOUT_MS_WRITE', '5000')),
+    READ: int(os.environ.get('STATEMENT_TIMEOUT_MS_READ', '5000')),
+    REPORT: int(os.environ.get('STATEMENT_TIMEOUT_MS_REPORT', '0')),
+}
+
+# Endpoints whose class can't be derived from the HTTP method
+ROUTE_CLASSES = {
+    'insert_order': CHECKOUT,
+    'process_payment': CHECKOUT,
+    'check_stock': CHECKOUT,
+    'get_products_by_barcodes_route': CHECKOUT,
+    'get_product_by_barcode_route': CHECKOUT,
+    'get_all_orders': REPORT,
+    'get_reorder_suggestions': REPORT,
+    'export_dataset': REPORT,
+}
+
+
+class OverCapacityError(PoolExhaustedError):
+    """Raised when a request could not be admitted before its deadline."""
+
+    def __init__(self, message, retry_after=RETRY_AFTER):
+        super().__init__(msg=message)
+        self.retry_after = retry_after
+
+
+def check_route_classes(endpoints):
+    """Raise ValueError if ROUTE_CLASSES names an endpoint that is not among `endpoints`."""
+    unknown = sorted(set(ROUTE_CLASSES) - set(endpoints))
+    if unknown:
+        raise ValueError(f"ROUTE_CLASSES names unknown endpoints: {', '.join(unknown)}")
+
+
+def classify(endpoint, method):
+    """Return the admission class of a request."""
+    if endpoint in ROUTE_CLASSES:
+        return ROUTE_CLASSES[endpoint]
+    return READ if method in ('GET', 'HEAD') else WRITE
+
+
+class AdmissionController:
+    def __init__(self, capacity, checkout_reserved):
+        self.capacity = capacity
+        self.checkout_reserved = min(checkout_reserved, max(capacity - 1, 0))
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._checkouts_waiting = 0
+        self._admitted = 0
+        self._rejected = {CHECKOUT: 0, WRITE: 0, READ: 0, REPORT: 0}
+
+    def _can_admit(self, route_class):
+        if route_class == CHECKOUT:
+            return self._in_flight < self.capacity
+        return (self._checkouts_waiting == 0
+                and self._in_flight < self.capacity - self.checkout_reserved)
+
+    def acquire(self, route_class, timeout=None):
+        """Block until the request is admitted or raise OverCapacityError."""
+        timeout = QUEUE_TIMEOUTS[route_class] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            is_checkout = route_class == CHECKOUT
+            if is_checkout:
+                self._checkouts_waiting += 1
+            try:
+                while not self._can_admit(route_class):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected[route_class] += 1
+                        logger.warning(f"Shedding {route_class} request: {self._in_flight} in flight.")
+                        raise OverCapacityError(f"Over capacity ({self._in_flight}/{self.capacity} in flight).")
+                    self._cond.wait(remaining)
+            finally:
+                if is_checkout:
+                    self._checkouts_waiting -= 1
+            self._in_flight += 1
+            self._admitted += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'capacity': self.capacity,
+                'checkout_reserved': self.checkout_reserved,
+                'in_flight': self._in_flight,
+                'checkouts_waiting': self._checkouts_waiting,
+                'admitted': self._admitted,
+                'rejected': dict(self._rejected),
+            }
+
+
+admission_controller = AdmissionController(CAPACITY, CHECKOUT_RESERVED)
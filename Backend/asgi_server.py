@@ -0,0 +1,373 @@
+import datetime
+import json
+import logging
+import uuid
+
+from quart import Quart, Response, g, jsonify, request
+from quart_cors import cors
+
+import async_dao
+import orders_dao
+from async_sql_connection import get_async_connection, close_pool, async_pool_stats
+from logging_config import setup_logging, request_id_var
+from sql_connection import PoolExhaustedError
+
+# Asyncio-native serving mode for the tills: the catalog, barcode, stock,
+# order, product and payment routes of server.py, with the same responses,
+# backed by async DAO variants and an aiomysql pool, so one process can hold
+# many concurrent till sessions while they wait on the database. The
+# back-office routes (/goodsReceipt, /getStockMovements, /importProducts,
+# /export, /getSalesSummary, /getReorderSuggestions and /metrics) are only
+# served by server.py.
+#
+#   hypercorn asgi_server:app --bind 0.0.0.0:3000
+
+setup_logging()
+app = Quart(__name__)
+app = cors(app, allow_origin="*")
+
+logger = logging.getLogger('asgi_app')
+
+MAX_ORDERS_PAGE_SIZE = 500
+
+
+class LazyAsyncConnection:
+    """Request-scoped connection checked out of the async pool on first use."""
+
+    def __init__(self):
+        self._context = None
+        self._connection = None
+
+    async def _checkout(self):
+        if self._connection is None:
+            self._context = get_async_connection()
+            self._connection = await self._context.__aenter__()
+        return self._connection
+
+    def cursor(self, *args):
+        return _LazyCursor(self, args)
+
+    async def begin(self):
+        await (await self._checkout()).begin()
+
+    async def commit(self):
+        await (await self._checkout()).commit()
+
+    async def rollback(self):
+        await (await self._checkout()).rollback()
+
+    async def release(self):
+        if self._context is not None:
+            context, self._context, self._connection = self._context, None, None
+            await context.__aexit__(None, None, None)
+
+
+class _LazyCursor:
+    def __init__(self, lazy_connection, args):
+        self._lazy_connection = lazy_connection
+        self._args = args
+        self._cursor = None
+
+    async def __aenter__(self):
+        connection = await self._lazy_connection._checkout()
+        self._cursor = await connection.cursor(*self._args)
+        return self._cursor
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._cursor.close()
+
+
+def get_db():
+    if 'db_connection' not in g:
+        g.db_connection = LazyAsyncConnection()
+    return g.db_connection
+
+
+@app.before_request
+async def assign_request_id():
+    request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+
+
+@app.after_request
+async def add_request_id(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+
+@app.teardown_request
+async def teardown_request(exception):
+    connection = g.pop('db_connection', None)
+    if connection is not None:
+        await connection.release()
+
+
+@app.after_serving
+async def shutdown():
+    await close_pool()
+
+
+def error_response(message, status_code=500):
+    """Create a JSON error response."""
+    return jsonify({"error": message}), status_code
+
+
+def validate_fields(request_payload, required_fields):
+    """Check if all required fields are present in the request payload."""
+    for field in required_fields:
+        if field not in request_payload:
+            return error_response(f'{field.replace("_", " ").title()} is required', 400)
+    return None
+
+
+@app.errorhandler(PoolExhaustedError)
+async def handle_overload(error):
+    logger.warning(f"Rejecting {request.path}: {str(error)}")
+    response = jsonify({"error": 'Database is busy, please retry shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@app.route('/getPoolStats', methods=['GET'])
+async def get_pool_stats():
+    return jsonify(async_pool_stats()), 200
+
+
+@app.route('/getUOMs', methods=['GET'])
+async def get_uoms():
+    return jsonify(await async_dao.get_uoms(get_db())), 200
+
+
+@app.route('/checkStock', methods=['POST'])
+async def check_stock():
+    request_payload = await request.get_json()
+    if not request_payload or 'order_details' not in request_payload:
+        return error_response('Order details are required to check stock', 400)
+
+    requested = {}
+    for item in request_payload['order_details']:
+        product_id = item.get('product_id')
+        quantity = item.get('quantity')
+        if not product_id or quantity is None:
+            return error_response('Both product_id and quantity are required for stock checking', 400)
+        requested.setdefault(product_id, quantity)
+
+    levels = await async_dao.get_stock_levels(get_db(), list(requested))
+    results = []
+    for product_id, quantity in requested.items():
+        available_stock = levels.get(product_id)
+        if available_stock is None:
+            results.append({'product_id': product_id, 'available': False, 'message': 'Product not found'})
+        elif available_stock >= quantity:
+            results.append({'product_id': product_id, 'available': True, 'available_stock': available_stock})
+        else:
+            results.append({
+                'product_id': product_id,
+                'available': False,
+                'message': f'Insufficient stock. Available: {available_stock}, Required: {quantity}'
+            })
+    return jsonify(results), 200
+
+
+@app.route('/getProducts', methods=['GET'])
+async def get_products():
+    return jsonify(await async_dao.get_all_products(get_db()))
+
+
+@app.route('/getProduct/<int:product_id>', methods=['GET'])
+async def get_product_by_id(product_id):
+    product = await async_dao.fetch_product_by_id(get_db(), product_id)
+    if product is None:
+        return jsonify({'error': 'Product not found'}), 404
+    return jsonify(product), 200
+
+
+@app.route('/insertOrder', methods=['POST'])
+async def insert_order():
+    request_payload = await request.get_json()
+    if not request_payload or not isinstance(request_payload.get('order_details'), list):
+        return error_response('Order details are required and should be a list', 400)
+    try:
+        order_id = await async_dao.insert_order(get_db(), request_payload)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    return jsonify({'message': 'Order added successfully', 'order_id': order_id}), 201
+
+
+@app.route('/updateProduct/<int:product_id>', methods=['PUT'])
+async def update_product(product_id):
+    request_payload = await request.get_json()
+    validation_error = validate_fields(request_payload, ['product_name', 'uom_id', 'price_per_unit'])
+    if validation_error:
+        return validation_error
+
+    connection = get_db()
+    if await async_dao.fetch_product_by_id(connection, product_id) is None:
+        return error_response('Product not found', 404)
+    update_result = await async_dao.update_product(connection, product_id, request_payload)
+    if update_result['status'] == 'success':
+        return jsonify({'message': 'Product updated successfully'}), 200
+    return error_response(update_result['message'], 400)
+
+
+@app.route('/deleteProduct/<int:product_id>', methods=['DELETE'])
+async def delete_product(product_id):
+    product_deleted, stock_deleted = await async_dao.delete_product(get_db(), product_id)
+    if not product_deleted:
+        return jsonify({'error': 'Product not found'}), 404
+    if stock_deleted:
+        return jsonify({'message': f'Product with ID {product_id} and its stock deleted successfully'}), 200
+    return jsonify({'message': f'Product with ID {product_id} deleted, but no associated stock found.'}), 200
+
+
+@app.route('/getStock', methods=['GET'])
+async def get_stock():
+    return jsonify(await async_dao.get_stock(get_db())), 200
+
+
+@app.route('/updateStock/<int:product_id>', methods=['PUT'])
+async def update_stock(product_id):
+    request_payload = await request.get_json()
+    if 'quantity_in_stock' not in request_payload:
+        return error_response('Quantity in stock is required to update', 400)
+    if await async_dao.update_stock(get_db(), product_id, request_payload['quantity_in_stock']):
+        return jsonify({'message': 'Stock updated successfully'}), 200
+    return error_response('Failed to update stock, product may not exist', 404)
+
+
+@app.route('/getProductByBarcode', methods=['GET'])
+async def get_product_by_barcode_route():
+    barcode = request.args.get('barcode', '').strip()
+    if not barcode:
+        return error_response('Barcode is required', 400)
+    product = (await async_dao.get_products_by_barcodes(get_db(), [barcode])).get(barcode)
+    if product is None:
+        return error_response('Product not found for the given barcode', 404)
+    return jsonify(product), 200
+
+
+@app.route('/getProductsByBarcodes', methods=['POST'])
+async def get_products_by_barcodes_route():
+    request_payload = await request.get_json(silent=True) or {}
+    barcodes = request_payload.get('barcodes')
+    if not isinstance(barcodes, list) or not barcodes:
+        return error_response('Barcodes are required and should be a non-empty list', 400)
+
+    barcodes = list(dict.fromkeys(str(barcode).strip() for barcode in barcodes if str(barcode).strip()))
+    resolved = await async_dao.get_products_by_barcodes(get_db(), barcodes)
+    return jsonify({
+        'products': {barcode: product for barcode, product in resolved.items() if product is not None},
+        'not_found': [barcode for barcode, product in resolved.items() if product is None]
+    }), 200
+
+
+def parse_int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}: {value}')
+
+
+def parse_date_arg(name, end_of_day=False):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name} date: {value}')
+    if end_of_day and len(value) == 10:
+        parsed += datetime.timedelta(days=1)
+    return parsed
+
+
+@app.route('/getAllOrders', methods=['GET'])
+async def get_all_orders():
+    """Stream orders; accepts the same from/to/limit/cursor arguments as server.py."""
+    try:
+        date_from = parse_date_arg('from')
+        date_to = parse_date_arg('to', end_of_day=True)
+        after = orders_dao.decode_orders_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = parse_int_arg('limit')
+        if limit is not None and not 0 < limit <= MAX_ORDERS_PAGE_SIZE:
+            raise ValueError(f'Limit must be between 1 and {MAX_ORDERS_PAGE_SIZE}')
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    # The stream outlives the request context, so it owns its connection
+    async def generate():
+        async with get_async_connection() as connection:
+            orders = async_dao.iter_orders(connection, date_from, date_to, after,
+                                           limit + 1 if limit is not None else None)
+            yield '[' if limit is None else '{"orders": ['
+            last = None
+            index = 0
+            async for order in orders:
+                if limit is not None and index == limit:
+                    break
+                yield (',' if index else '') + json.dumps(order, default=str)
+                last = order
+                index += 1
+            else:
+                last = None
+            await orders.aclose()
+            if limit is None:
+                yield ']'
+            else:
+                next_cursor = orders_dao.encode_orders_cursor(last) if last is not None else None
+                yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(generate(), status=200, mimetype='application/json')
+
+
+@app.route('/insertProduct', methods=['POST'])
+async def insert_product():
+    request_payload = await request.get_json()
+    validation_error = validate_fields(request_payload, ['product_name', 'uom_id', 'price_per_unit', 'quantity_in_stock'])
+    if validation_error:
+        return validation_error
+
+    result = await async_dao.insert_product(get_db(), request_payload)
+    if result['status'] != 'success':
+        return error_response(result['message'], 400)
+    return jsonify({'message': 'Product inserted successfully', 'product_id': result['product_id']}), 201
+
+
+def validate_upi_payment(request_payload):
+    # Placeholder function for UPI payment validation
+    return True  # Always returns True for testing
+
+
+@app.route('/processPayment', methods=['POST'])
+async def process_payment():
+    request_payload = await request.get_json()
+    validation_error = validate_fields(request_payload, ['payment_mode', 'order_id', 'customer_name', 'grandTotal', 'order_details'])
+    if validation_error:
+        return validation_error
+
+    payment_mode = request_payload['payment_mode']
+    order_id = request_payload['order_id']
+
+    if payment_mode.lower() == 'upi':
+        if not validate_upi_payment(request_payload):
+            return error_response('UPI payment failed, please try again.', 400)
+        message = 'UPI payment successful, order confirmed.'
+    elif payment_mode.lower() == 'cash':
+        message = 'Cash payment confirmed, order completed.'
+    else:
+        return error_response('Invalid payment mode provided.', 400)
+
+    payment_id = await async_dao.insert_payment(get_db(), order_id, payment_mode, request_payload['grandTotal'],
+                                                request_payload['customer_name'], payment_status='Paid')
+    return jsonify({'message': message, 'payment_id': payment_id}), 200
+
+
+@app.route('/payment/<payment_id>', methods=['GET'])
+async def get_payment_details(payment_id):
+    payment_details = await async_dao.get_payment_details(get_db(), payment_id)
+    if payment_details:
+        return jsonify({'payment_details': payment_details}), 200
+    return error_response('Payment not found.', 404)
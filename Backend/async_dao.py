@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime
+from typing import Dict, List, Union
+
+import aiomysql
+
+from catalog_cache import catalog_cache
+from products_dao import CATALOG_QUERY, product_from_row
+from orders_dao import ORDERS_BATCH_SIZE, parse_order_lines, build_order_details_insert, build_orders_query, fold_order_rows
+from payments_dao import canonical_payment_mode
+from sql_connection import batch_size
+from stock_dao import RESERVATION_ATTEMPTS, RESERVATION_BACKOFF, InsufficientStockError, stock_levels_query
+from stock_ledger import BALANCE, CORRECTION, INITIAL, SALE, build_balances, build_lock_stock, build_movements, build_withdraw
+from storage import backend, is_lock_conflict
+import sales_dao
+
+logger = logging.getLogger(__name__)
+
+# Async variants of the DAO functions used by the ASGI app (asgi_server.py).
+#
+# They share SQL, row mapping and the catalog cache with the synchronous DAO
+# modules, so both apps answer identically. Connections come from
+# async_sql_connection and run in autocommit mode: read functions need no
+# transaction, and write functions wrap their statements in begin/commit.
+
+
+async def get_uoms(connection):
+    """Fetches all units of measurement (UOMs) from the database."""
+    async with connection.cursor() as cursor:
+        await cursor.execute("SELECT uom_id, uom_name FROM uom")
+        return [{'uom_id': uom_id, 'uom_name': uom_name} for uom_id, uom_name in await cursor.fetchall()]
+
+
+async def _refresh_stale_stock(connection) -> None:
+    """Async counterpart of products_dao.refresh_stale_stock."""
+    marks = catalog_cache.stale_stock()
+    if not marks:
+        return
+    params = list(marks)
+    size = batch_size(len(params))
+    params += params[-1:] * (size - len(params))
+    async with connection.cursor() as cursor:
+        await cursor.execute(stock_levels_query(size), tuple(params))
+        catalog_cache.refresh_stock(marks, dict(await cursor.fetchall()))
+
+
+async def get_all_products(connection) -> List[Dict[str, Union[str, int]]]:
+    """Fetch all products along with their stock and UOM details, through the catalog cache."""
+    await _refresh_stale_stock(connection)
+    products = catalog_cache.get_all()
+    if products is not None:
+        return products
+
+    version = catalog_cache.begin_load()
+    async with connection.cursor() as cursor:
+        await cursor.execute(CATALOG_QUERY)
+        products = [product_from_row(row) for row in await cursor.fetchall()]
+    catalog_cache.install(version, products)
+    return products
+
+
+async def get_products_by_barcodes(connection, barcodes: List[str]) -> Dict[str, Union[Dict, None]]:
+    """Resolve a batch of barcodes through the in-memory barcode index."""
+    await _refresh_stale_stock(connection)
+    resolved = catalog_cache.lookup_barcodes(barcodes)
+    if resolved is None:
+        await get_all_products(connection)
+        resolved = catalog_cache.lookup_barcodes(barcodes)
+    if resolved is None:
+        resolved = {barcode: None for barcode in barcodes}
+        placeholders = ', '.join(['%s'] * len(resolved))
+        async with connection.cursor() as cursor:
+            await cursor.execute(CATALOG_QUERY + f" WHERE p.barcode IN ({placeholders})", tuple(resolved))
+            for row in await cursor.fetchall():
+                resolved[row[3]] = product_from_row(row)
+    return resolved
+
+
+async def fetch_product_by_id(connection, product_id: int):
+    """Fetch a product by its ID, or None if it does not exist."""
+    async with connection.cursor() as cursor:
+        await cursor.execute(f"""
+            SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, p.uom_id, u.uom_name, {BALANCE}
+            FROM products p
+            LEFT JOIN uom u ON p.uom_id = u.uom_id
+            LEFT JOIN stock s ON p.product_id = s.product_id
+            WHERE p.product_id = %s
+        """, (product_id,))
+        result = await cursor.fetchone()
+    if result is None:
+        return None
+    return {
+        'product_id': result[0],
+        'product_name': result[1],
+        'price_per_unit': float(result[2]) if result[2] is not None else None,
+        'barcode': result[3],
+        'uom_id': result[4],
+        'uom_name': result[5] if result[5] is not None else 'N/A',
+        'quantity_in_stock': result[6] if result[6] is not None else 0
+    }
+
+
+async def get_stock_levels(connection, product_ids: List[int]) -> Dict[int, int]:
+    """Fetch the stock quantities of several products with one query."""
+    if not product_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    async with connection.cursor() as cursor:
+        await cursor.execute(f"SELECT s.product_id, {BALANCE} FROM stock s WHERE s.product_id IN ({placeholders})",
+                             tuple(product_ids))
+        return {row[0]: row[1] for row in await cursor.fetchall()}
+
+
+async def get_stock(connection) -> List[Dict]:
+    """Fetch current stock information."""
+    async with connection.cursor() as cursor:
+        await cursor.execute(f"""
+            SELECT s.product_id, p.product_name, {BALANCE}
+            FROM stock s
+            JOIN products p ON s.product_id = p.product_id
+        """)
+        return [
+            {'product_id': row[0], 'product_name': row[1], 'quantity_in_stock': row[2]}
+            for row in await cursor.fetchall()
+        ]
+
+
+async def update_stock(connection, product_id: int, quantity: int) -> bool:
+    """Add `quantity` (negative to remove) to a product's stock, as a correction in the stock ledger."""
+    await connection.begin()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute("SELECT product_id FROM stock WHERE product_id = %s", (product_id,))
+            updated = await cursor.fetchone() is not None
+            if updated:
+                await _record_movements(cursor, [(product_id, quantity, CORRECTION, None, None)])
+        await connection.commit()
+    except Exception:
+        await connection.rollback()
+        raise
+    if updated:
+        catalog_cache.stock_changed([product_id])
+    return updated
+
+
+async def insert_order(connection, order):
+    """Insert an order with set-based statements in a single transaction.
+
+    Stock is reserved as in stock_dao.reserve_stock, and the transaction is
+    retried as in stock_dao.retry_on_lock_conflict.
+    """
+    quantities = parse_order_lines(order)
+
+    for attempt in range(1, RESERVATION_ATTEMPTS + 1):
+        try:
+            order_id = await _insert_order(connection, order, quantities)
+            break
+        except aiomysql.Error as e:
+            if not is_lock_conflict(e) or attempt == RESERVATION_ATTEMPTS:
+                raise
+            delay = RESERVATION_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"Lock conflict ({e}); retrying in {delay * 1000:.0f} ms "
+                           f"(attempt {attempt + 1} of {RESERVATION_ATTEMPTS})")
+            await asyncio.sleep(delay)
+
+    catalog_cache.stock_changed(quantities)
+    return order_id
+
+
+async def _insert_order(connection, order, quantities):
+    await connection.begin()
+    try:
+        async with connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(quantities))
+            await cursor.execute(f"SELECT product_id, price_per_unit FROM products WHERE product_id IN ({placeholders})",
+                                 tuple(quantities))
+            prices = {row[0]: float(row[1]) for row in await cursor.fetchall()}
+            if any(product_id not in prices for product_id in quantities):
+                raise ValueError("Product not found")
+
+            ordered_at = datetime.now()
+            await cursor.execute("INSERT INTO orders (customer_name, total, datetime) VALUES (%s, %s, %s)",
+                                 (order['customer_name'], order['total'], ordered_at))
+            order_id = cursor.lastrowid
+
+            available = await _lock_stock_balances(cursor, quantities)
+            shortages = {product_id: available.get(product_id) for product_id, quantity in quantities.items()
+                         if available.get(product_id) is None or available[product_id] < quantity}
+            if shortages:
+                raise InsufficientStockError(shortages)
+            await _record_movements(cursor, [(product_id, -quantity, SALE, order_id, None)
+                                             for product_id, quantity in sorted(quantities.items())])
+            await cursor.execute(*build_order_details_insert(order_id, quantities, prices))
+            for statement in sales_dao.build_order_rollup(ordered_at.date(), order['total'], quantities, prices):
+                await cursor.execute(*statement)
+        await connection.commit()
+        return order_id
+    except Exception as e:
+        logger.error("Error inserting order: %s", str(e))
+        await connection.rollback()
+        raise
+
+
+async def _lock_stock_balances(cursor, product_ids) -> Dict[int, int]:
+    """Async counterpart of stock_dao.lock_stock_balances."""
+    await cursor.execute(*build_lock_stock(product_ids))
+    withdrawn = dict(await cursor.fetchall())
+    if not withdrawn:
+        return {}
+    await cursor.execute(*build_balances(withdrawn))
+    return {product_id: balance - (withdrawn[product_id] - seen) for product_id, seen, balance in await cursor.fetchall()}
+
+
+async def _record_movements(cursor, movements) -> None:
+    """Async counterpart of stock_dao.record_movements."""
+    withdrawn = {}
+    for product_id, quantity, *_ in movements:
+        if quantity < 0:
+            withdrawn[product_id] = withdrawn.get(product_id, 0) - quantity
+    if withdrawn:
+        await cursor.execute(*build_withdraw(withdrawn))
+    if movements:
+        await cursor.execute(*build_movements(movements))
+
+
+async def _set_stock_levels(cursor, levels: Dict[int, float]) -> None:
+    """Async counterpart of stock_dao.set_stock_levels."""
+    balances = await _lock_stock_balances(cursor, levels)
+    missing = [product_id for product_id in sorted(levels) if product_id not in balances]
+    if missing:
+        await cursor.execute(backend.upsert('stock', ('product_id', 'quantity_in_stock'), ('product_id',),
+                                            rows=len(missing), add=('quantity_in_stock',)),
+                             tuple(value for product_id in missing for value in (product_id, 0)))
+    await _record_movements(cursor, [(product_id, level - balances.get(product_id, 0),
+                                      CORRECTION if product_id in balances else INITIAL, None, None)
+                                     for product_id, level in sorted(levels.items())
+                                     if level != balances.get(product_id, 0)])
+
+
+async def iter_orders(connection, date_from=None, date_to=None, after=None, limit=None):
+    """Async counterpart of orders_dao.iter_orders, streaming from a server-side cursor."""
+    async with connection.cursor(aiomysql.SSCursor) as cursor:
+        await cursor.execute(*build_orders_query(date_from, date_to, after, limit))
+        current = None
+        while True:
+            rows = await cursor.fetchmany(ORDERS_BATCH_SIZE)
+            if not rows:
+                break
+            completed, current = fold_order_rows(rows, current)
+            for order in completed:
+                yield order
+        if current is not None:
+            yield current
+
+
+async def insert_product(connection, product_data: Dict) -> Dict[str, str]:
+    """Insert a new product and return its ID, or update its price if it already exists.
+
+    The product's stock is written in the same transaction, as in
+    products_dao.insert_product: a new product starts at quantity_in_stock,
+    an existing one gets it added.
+    """
+    product_name = str(product_data['product_name']).strip()
+    if product_name == '':
+        return {'status': 'fail', 'message': 'Product name cannot be empty.'}
+
+    await connection.begin()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute("SELECT product_id FROM products WHERE product_name = %s AND uom_id = %s",
+                                 (product_name, product_data['uom_id']))
+            existing_product = await cursor.fetchone()
+            if existing_product:
+                product_id = existing_product[0]
+                await cursor.execute("UPDATE products SET price_per_unit = %s WHERE product_id = %s",
+                                     (product_data['price_per_unit'], product_id))
+            else:
+                await cursor.execute("INSERT INTO products (product_name, price_per_unit, uom_id) VALUES (%s, %s, %s)",
+                                     (product_name, product_data['price_per_unit'], product_data['uom_id']))
+                product_id = cursor.lastrowid
+
+            balance = (await _lock_stock_balances(cursor, [product_id])).get(product_id, 0) if existing_product else 0
+            await _set_stock_levels(cursor, {product_id: balance + product_data['quantity_in_stock']})
+        await connection.commit()
+    except Exception as e:
+        await connection.rollback()
+        logger.error(f"Error inserting product: {str(e)}")
+        return {'status': 'fail', 'message': 'Database error occurred'}
+
+    catalog_cache.invalidate()
+    return {'status': 'success', 'product_id': product_id}
+
+
+async def update_product(connection, product_id: int, product_data: Dict) -> Dict[str, str]:
+    """Update a product's fields and, if provided, its absolute stock level."""
+    fields_to_update = []
+    params = []
+    for field in ('product_name', 'price_per_unit', 'uom_id', 'barcode'):
+        if field in product_data:
+            fields_to_update.append(f"{field} = %s")
+            params.append(product_data[field])
+
+    await connection.begin()
+    try:
+        async with connection.cursor() as cursor:
+            if fields_to_update:
+                await cursor.execute(f"UPDATE products SET {', '.join(fields_to_update)} WHERE product_id = %s",
+                                     tuple(params) + (product_id,))
+            if 'quantity_in_stock' in product_data:
+                balance = (await _lock_stock_balances(cursor, [product_id])).get(product_id)
+                if balance is not None and balance != product_data['quantity_in_stock']:
+                    await _record_movements(
+                        cursor, [(product_id, product_data['quantity_in_stock'] - balance, CORRECTION, None, None)])
+        await connection.commit()
+    except Exception as e:
+        await connection.rollback()
+        logger.error(f"Error updating product {product_id}: {str(e)}")
+        return {'status': 'fail', 'message': str(e)}
+
+    catalog_cache.invalidate()
+    return {'status': 'success'}
+
+
+async def delete_product(connection, product_id: int):
+    """Delete a product and its stock row. Returns (product_deleted, stock_deleted)."""
+    await connection.begin()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+            product_deleted = cursor.rowcount > 0
+            stock_deleted = False
+            if product_deleted:
+                await cursor.execute("DELETE FROM stock WHERE product_id = %s", (product_id,))
+                stock_deleted = cursor.rowcount > 0
+        await connection.commit()
+    except Exception:
+        await connection.rollback()
+        raise
+
+    if product_deleted:
+        catalog_cache.remove(product_id)
+    return product_deleted, stock_deleted
+
+
+async def insert_payment(connection, order_id, payment_mode, grand_total=None, customer_name=None, payment_status='Pending'):
+    """Insert a payment and return its generated ID; 'Paid' payments also update the rollups."""
+    payment_id = str(uuid.uuid4())
+    payment_mode = canonical_payment_mode(payment_mode)
+    await connection.begin()
+    try:
+        async with connection.cursor() as cursor:
+            await cursor.execute("""
+                INSERT INTO payments (payment_id, order_id, payment_mode, payment_status, grand_total, customer_name)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (payment_id, order_id, payment_mode, payment_status, grand_total, customer_name))
+            if payment_status == 'Paid':
+                await cursor.execute(*sales_dao.build_payment_rollup(payment_id))
+        await connection.commit()
+    except Exception:
+        await connection.rollback()
+        raise
+    return payment_id
+
+
+async def get_payment_details(connection, payment_id):
+    async with connection.cursor() as cursor:
+        await cursor.execute("SELECT * FROM payments WHERE payment_id = %s", (payment_id,))
+        return await cursor.fetchone()
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import logging
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+from sql_connection import DB_CONFIG, POOL_TIMEOUT, POOL_MAX_AGE, PoolExhaustedError
+
+logger = logging.getLogger(__name__)
+
+# Async counterpart of sql_connection for the ASGI app. Connections run in
+# autocommit mode; DAO functions that write open an explicit transaction, so
+# reads never leave a transaction (or a stale snapshot) on a pooled connection.
+
+ASYNC_POOL_MIN_SIZE = int(os.environ.get('DB_ASYNC_POOL_MIN_SIZE', '2'))
+ASYNC_POOL_SIZE = int(os.environ.get('DB_ASYNC_POOL_SIZE', '20'))
+
+connection_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def get_pool():
+    """Return the event loop's connection pool, creating it on first use."""
+    global connection_pool
+    if connection_pool is None:
+        async with _pool_lock:
+            if connection_pool is None:
+                connection_pool = await aiomysql.create_pool(
+                    minsize=ASYNC_POOL_MIN_SIZE,
+                    maxsize=ASYNC_POOL_SIZE,
+                    pool_recycle=int(POOL_MAX_AGE),
+                    autocommit=True,
+                    host=DB_CONFIG['host'],
+                    port=DB_CONFIG['port'],
+                    user=DB_CONFIG['user'],
+                    password=DB_CONFIG['password'],
+                    db=DB_CONFIG['database'],
+                )
+                logger.info(f"Async connection pool initialized (size={ASYNC_POOL_SIZE}).")
+    return connection_pool
+
+
+async def close_pool():
+    """Close the pool and wait for its connections to be released."""
+    global connection_pool
+    if connection_pool is not None:
+        connection_pool.close()
+        await connection_pool.wait_closed()
+        connection_pool = None
+
+
+@asynccontextmanager
+async def get_async_connection(timeout=POOL_TIMEOUT):
+    """Check out a connection for the duration of the `async with` block.
+
+    Raises PoolExhaustedError if no connection frees up within `timeout`.
+    """
+    pool = await get_pool()
+    try:
+        connection = await asyncio.wait_for(pool.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise PoolExhaustedError(f"No connection available within {timeout}s ({pool.size} open).")
+    try:
+        yield connection
+    finally:
+        if connection.get_transaction_status():
+            await connection.rollback()
+        pool.release(connection)
+
+
+def async_pool_stats():
+    """Return live statistics of the async pool."""
+    if connection_pool is None:
+        return {'size': 0, 'in_use': 0, 'idle': 0, 'maxsize': ASYNC_POOL_SIZE}
+    return {
+        'size': connection_pool.size,
+        'in_use': connection_pool.size - connection_pool.freesize,
+        'idle': connection_pool.freesize,
+        'maxsize': connection_pool.maxsize,
+    }
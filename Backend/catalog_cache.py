@@ -0,0 +1,253 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# In-process cache of the product catalog served by /getProducts.
+#
+# The catalog is loaded with a single query and then kept current by the DAO
+# writers: product writes drop the cached catalog, stock writes mark the
+# affected products' stock stale, and readers re-read just those stock levels
+# (refresh_stock) before serving them. Every change bumps the version so a
+# load that raced with a write is discarded instead of being installed over
+# newer data.
+#
+# Stock writes are not applied as deltas: a load that ran after the write
+# committed but before it reached the cache already holds the new level, and
+# the delta would count it twice. A stale mark can be applied any number of
+# times; each carries the version it was made at, and a refresh only clears
+# marks that were not renewed while it was reading.
+#
+# A barcode index is built alongside the catalog so scans resolve with a dict
+# lookup. While the catalog is loaded it is complete, so a barcode missing
+# from the index is a cached negative answer and needs no query either.
+#
+# When the app runs in several preforked worker processes, each worker holds
+# its own copy. enable_shared_generation() (called in the master before
+# forking) sets up two things in shared memory:
+#
+#   - a generation counter that every product write bumps; a worker that sees
+#     a generation it did not produce drops its copy, so a price change made
+#     through one worker is never served stale by another
+#   - a ring of the product ids whose stock changed; every worker marks them
+#     stale in its own copy, so a sale costs the others one small stock read
+#     instead of a catalog reload. A worker that fell more than
+#     CATALOG_STOCK_RING_SIZE ids behind drops its copy.
+#
+# Writes that do not go through a process sharing this memory (the ASGI app,
+# the product_import and sales_dao command lines, another app host) are not
+# seen by it, so a loaded catalog is also dropped CATALOG_CACHE_TTL seconds
+# after it was loaded (default 30, 0: never): that bounds how long a price
+# changed elsewhere can be served, at one catalog query per interval.
+
+Product = Dict[str, Union[str, int, float, None]]
+
+STOCK_RING_SIZE = int(os.environ.get('CATALOG_STOCK_RING_SIZE', '4096'))
+CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '30'))
+
+
+class CatalogCache:
+    def __init__(self, ttl: float = CACHE_TTL):
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._version = 0
+        self._products: Optional[Dict[int, Product]] = None
+        self._loaded_at = 0.0
+        self._by_barcode: Dict[str, int] = {}
+        self._snapshot: Optional[List[Product]] = None
+        # product_id -> version at which its cached stock went stale
+        self._stale: Dict[int, int] = {}
+        self._shared_generation = None
+        self._shared_lock = None
+        self._seen_generation = 0
+        self._stock_ring = None
+        self._stock_written = None
+        self._seen_stock = 0
+
+    def enable_shared_generation(self) -> None:
+        """Share invalidations and stock changes with processes forked after this call."""
+        self._shared_generation = multiprocessing.RawValue('Q', 0)
+        self._shared_lock = multiprocessing.Lock()
+        self._seen_generation = 0
+        self._stock_ring = multiprocessing.RawArray('q', STOCK_RING_SIZE)
+        self._stock_written = multiprocessing.RawValue('Q', 0)
+        self._seen_stock = 0
+
+    def _drop(self) -> None:
+        self._version += 1
+        self._products = None
+        self._by_barcode = {}
+        self._snapshot = None
+        self._stale = {}
+
+    def _sync(self) -> None:
+        """Catch up with the catalog and stock changes of other processes. Lock held."""
+        if self._products is not None and self._ttl > 0 and time.monotonic() - self._loaded_at > self._ttl:
+            self._drop()
+        if self._shared_generation is None:
+            return
+        if self._shared_generation.value != self._seen_generation:
+            self._seen_generation = self._shared_generation.value
+            self._drop()
+        if self._stock_written.value != self._seen_stock:
+            with self._shared_lock:
+                written = self._stock_written.value
+                product_ids = [self._stock_ring[index % STOCK_RING_SIZE]
+                               for index in range(max(self._seen_stock, written - STOCK_RING_SIZE), written)]
+                overrun = written - self._seen_stock > STOCK_RING_SIZE
+            self._seen_stock = written
+            if overrun:
+                self._drop()
+            else:
+                self._mark_stale(product_ids)
+
+    def _mark_stale(self, product_ids: Iterable[int]) -> None:
+        """Mark products' cached stock stale, discarding loads in flight. Lock held."""
+        self._version += 1
+        if self._products is None:
+            return
+        for product_id in product_ids:
+            if product_id in self._products:
+                self._stale[product_id] = self._version
+
+    def _bump(self) -> None:
+        """Record a local change, publishing it to other processes. Lock held."""
+        self._version += 1
+        if self._shared_generation is None:
+            return
+        with self._shared_lock:
+            previous = self._shared_generation.value
+            self._shared_generation.value = previous + 1
+        if previous != self._seen_generation:
+            # Another process changed the catalog since we last looked
+            self._drop()
+        self._seen_generation = previous + 1
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def begin_load(self) -> int:
+        """Return the version a caller must pass to install() after loading."""
+        with self._lock:
+            self._sync()
+            return self._version
+
+    def install(self, version: int, products: List[Product]) -> bool:
+        """Install a freshly loaded catalog unless a write happened meanwhile."""
+        with self._lock:
+            self._sync()
+            if version != self._version:
+                logger.debug("Discarding catalog load for version %s (now %s)", version, self._version)
+                return False
+            self._products = {product['product_id']: product for product in products}
+            self._loaded_at = time.monotonic()
+            self._by_barcode = {
+                str(product['barcode']): product['product_id']
+                for product in products if product.get('barcode')
+            }
+            self._snapshot = None
+            self._stale = {}
+            return True
+
+    def get_all(self) -> Optional[List[Product]]:
+        """Return the cached catalog, or None if it has to be loaded."""
+        with self._lock:
+            self._sync()
+            if self._products is None:
+                return None
+            if self._snapshot is None:
+                self._snapshot = list(self._products.values())
+            return self._snapshot
+
+    def get(self, product_id: int) -> Optional[Product]:
+        with self._lock:
+            self._sync()
+            if self._products is None:
+                return None
+            return self._products.get(product_id)
+
+    def lookup_barcodes(self, barcodes: List[str]) -> Optional[Dict[str, Optional[Product]]]:
+        """Resolve barcodes against the index.
+
+        Returns None if the catalog is not loaded. Otherwise every barcode maps
+        to its product, or to None if no product carries it.
+        """
+        with self._lock:
+            self._sync()
+            if self._products is None:
+                return None
+            resolved = {}
+            for barcode in barcodes:
+                product_id = self._by_barcode.get(barcode)
+                resolved[barcode] = self._products.get(product_id) if product_id is not None else None
+            return resolved
+
+    def invalidate(self) -> None:
+        """Drop the whole catalog; the next read reloads it."""
+        with self._lock:
+            self._bump()
+            self._drop()
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            self._bump()
+            if self._products is None:
+                return
+            product = self._products.pop(product_id, None)
+            if product is not None:
+                if product.get('barcode'):
+                    self._by_barcode.pop(str(product['barcode']), None)
+                self._snapshot = None
+
+    def stock_changed(self, product_ids: Iterable[int]) -> None:
+        """Mark products whose stock changed in the database; call after the commit."""
+        product_ids = list(product_ids)
+        with self._lock:
+            self._sync()
+            self._mark_stale(product_ids)
+            if self._stock_ring is None:
+                return
+            with self._shared_lock:
+                written = self._stock_written.value
+                for index, product_id in enumerate(product_ids, written):
+                    self._stock_ring[index % STOCK_RING_SIZE] = product_id
+                self._stock_written.value = written + len(product_ids)
+            if written == self._seen_stock:
+                # Nothing from other processes in between: skip our own ids
+                self._seen_stock = written + len(product_ids)
+
+    def stale_stock(self) -> Dict[int, int]:
+        """Return the products whose cached stock must be re-read, with their marks."""
+        with self._lock:
+            self._sync()
+            return dict(self._stale)
+
+    def refresh_stock(self, marks: Dict[int, int], levels: Dict[int, int]) -> None:
+        """Install stock `levels` read after stale_stock() returned `marks`.
+
+        Products marked again in the meantime stay stale; products missing
+        from `levels` have no stock row and get 0.
+        """
+        with self._lock:
+            self._sync()
+            if self._products is None:
+                return
+            for product_id, mark in marks.items():
+                product = self._products.get(product_id)
+                if self._stale.get(product_id) != mark or product is None:
+                    continue
+                # Copy on write so a response that is still serializing the
+                # old snapshot never sees a half-applied change.
+                patched = dict(product)
+                patched['quantity_in_stock'] = levels.get(product_id, 0)
+                self._products[product_id] = patched
+                del self._stale[product_id]
+                self._snapshot = None
+
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,92 @@
+from flask import g, request
+from sql_connection import get_sql_connection, PoolExhaustedError
+import admission
+from admission import admission_controller
+
+
+class LazyConnection:
+    """Stand-in for a pooled connection that checks it out on first use.
+
+    DAO functions receive this object like a regular connection; the pool slot
+    is only taken when one of them actually talks to the database, so requests
+    answered from in-process caches never touch the pool. The checkout goes
+    through admission control for the request's route class, and the class's
+    statement time limit is applied to the connection.
+    """
+
+    def __init__(self, route_class):
+        self.route_class = route_class
+        self._connection = None
+        self._admitted = False
+
+    @property
+    def checked_out(self):
+        return self._connection is not None
+
+    def _checkout(self):
+        if self._connection is None:
+            try:
+                admission_controller.acquire(self.route_class)
+                self._admitted = True
+                self._connection = get_sql_connection()
+                self._connection.set_statement_timeout(admission.STATEMENT_TIMEOUTS_MS[self.route_class])
+            except PoolExhaustedError as err:
+                # Handlers tend to swallow DAO errors; remember the rejection
+                # so the response can still be turned into a 503.
+                g.db_rejection = err
+                self.release()
+                raise
+            except Exception:
+                self.release()
+                raise
+        return self._connection
+
+    def __getattr__(self, name):
+        return getattr(self._checkout(), name)
+
+    def release(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._admitted:
+            self._admitted = False
+            admission_controller.release()
+
+
+def get_db():
+    """Return the connection for the current request.
+
+    The same connection is reused by every DAO call in the request, so a
+    request holds at most one pool slot, and requests that never reach the
+    database (CORS preflights, cached reads) hold none.
+    """
+    if 'db_connection' not in g:
+        g.db_connection = LazyConnection(admission.classify(request.endpoint, request.method))
+    return g.db_connection
+
+
+def open_stream_connection():
+    """Check out a connection owned by a streamed response body.
+
+    Flask tears the request down (and close_db() releases get_db()'s
+    connection) as soon as the view returns, before a streamed body is
+    generated, so a generator that reads from the database must not use
+    get_db(). This connection is admitted and checked out right away, so an
+    overload still becomes a 503 before any header is sent; the generator
+    calls release() in its finally block.
+    """
+    connection = LazyConnection(admission.classify(request.endpoint, request.method))
+    connection._checkout()
+    return connection
+
+
+def db_rejection():
+    """The admission or pool error that kept this request from the database, if any."""
+    return g.get('db_rejection')
+
+
+def close_db(exception=None):
+    """Return the request's connection to the pool, if one was checked out."""
+    connection = g.pop('db_connection', None)
+    if connection is not None:
+        connection.release()
@@ -0,0 +1,235 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import sys
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterator, List, Tuple
+
+from stock_ledger import BALANCE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Streaming exports of orders (one row per order line), stock and products as
+# CSV, NDJSON or Parquet, for /export/<dataset> and the command line:
+#
+#   python exports.py orders --format parquet --from 2024-01-01 -o orders.parquet
+#
+# Rows come from an unbuffered cursor EXPORT_BATCH_SIZE at a time and every
+# batch is encoded and handed on before the next is fetched, so memory stays
+# flat whatever the table size. The export runs in a read-only consistent
+# snapshot transaction: it sees one point in time and takes no row locks, so
+# checkout writes are never blocked by it.
+
+EXPORT_BATCH_SIZE = 2000
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# dataset -> (query, [(column, type)]); types are 'int', 'float', 'string' or 'timestamp'
+DATASETS = {
+    'orders': ("""
+        SELECT o.order_id, o.customer_name, o.datetime, o.total,
+               od.product_id, p.product_name, od.quantity, od.total_price
+        FROM orders o
+        JOIN order_details od ON o.order_id = od.order_id
+        LEFT JOIN products p ON od.product_id = p.product_id
+    """, [('order_id', 'int'), ('customer_name', 'string'), ('datetime', 'timestamp'), ('total', 'float'),
+          ('product_id', 'int'), ('product_name', 'string'), ('quantity', 'float'), ('total_price', 'float')]),
+    'stock': (f"""
+        SELECT s.product_id, p.product_name, {BALANCE}
+        FROM stock s
+        LEFT JOIN products p ON s.product_id = p.product_id
+    """, [('product_id', 'int'), ('product_name', 'string'), ('quantity_in_stock', 'int')]),
+    'products': ("""
+        SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, p.uom_id, u.uom_name
+        FROM products p
+        LEFT JOIN uom u ON p.uom_id = u.uom_id
+    """, [('product_id', 'int'), ('product_name', 'string'), ('price_per_unit', 'float'), ('barcode', 'string'),
+          ('uom_id', 'int'), ('uom_name', 'string')]),
+}
+
+
+def check_export(dataset: str, fmt: str) -> None:
+    """Raise ValueError if the dataset or format cannot be exported here."""
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset: {dataset} (expected one of {', '.join(DATASETS)})")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt} (expected one of {', '.join(FORMATS)})")
+    if fmt == 'parquet' and pa is None:
+        raise ValueError('Parquet export needs pyarrow installed')
+
+
+def begin_snapshot(connection) -> None:
+    """Start a read-only transaction that sees a single point in time."""
+    if connection.in_transaction:
+        connection.rollback()
+    connection.start_transaction(consistent_snapshot=True, readonly=True)
+
+
+def build_export_query(dataset: str, date_from=None, date_to=None) -> Tuple[str, tuple]:
+    """Return the export query; orders can be limited to [date_from, date_to)."""
+    query, _ = DATASETS[dataset]
+    conditions, params = [], []
+    if dataset == 'orders':
+        if date_from is not None:
+            conditions.append("o.datetime >= %s")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("o.datetime < %s")
+            params.append(date_to)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    order_by = "o.order_id, od.product_id" if dataset == 'orders' else "1"
+    return query + f" ORDER BY {order_by}", tuple(params)
+
+
+def iter_batches(connection, dataset: str, date_from=None, date_to=None) -> Iterator[List[tuple]]:
+    """Yield the export rows in batches from an unbuffered cursor."""
+    cursor = connection.cursor(buffered=False)
+    exhausted = False
+    try:
+        cursor.execute(*build_export_query(dataset, date_from, date_to))
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield [tuple(float(value) if isinstance(value, Decimal) else value for value in row) for row in rows]
+        exhausted = True
+    finally:
+        if not exhausted:
+            connection.consume_results()
+        cursor.close()
+
+
+def _encode_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _encode_ndjson(columns, batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects what the Parquet writer produces until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _encode_parquet(schema, batches):
+    arrow_types = {'int': pa.int64(), 'float': pa.float64(), 'string': pa.string(), 'timestamp': pa.timestamp('us')}
+    arrow_schema = pa.schema([(name, arrow_types[kind]) for name, kind in schema])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, arrow_schema)
+    try:
+        # One row group per batch; each is written out as soon as it is encoded
+        for batch in batches:
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, arrow_schema)],
+                schema=arrow_schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_export(connection, dataset: str, fmt: str, date_from=None, date_to=None) -> Iterator:
+    """Yield the encoded export chunk by chunk: str for CSV/NDJSON, bytes for Parquet.
+
+    The caller opens the snapshot with begin_snapshot first; it is ended when
+    the stream is exhausted or closed.
+    """
+    schema = DATASETS[dataset][1]
+    batches = iter_batches(connection, dataset, date_from, date_to)
+    try:
+        if fmt == 'csv':
+            yield from _encode_csv([name for name, _ in schema], batches)
+        elif fmt == 'ndjson':
+            yield from _encode_ndjson([name for name, _ in schema], batches)
+        else:
+            yield from _encode_parquet(schema, batches)
+    finally:
+        batches.close()
+        connection.rollback()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export orders, stock or products.')
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('--format', default='csv', choices=FORMATS)
+    parser.add_argument('--from', dest='date_from', type=datetime.fromisoformat, help='orders on or after (ISO)')
+    parser.add_argument('--to', dest='date_to', type=datetime.fromisoformat, help='orders before (ISO)')
+    parser.add_argument('-o', '--output', help='output file (default: standard output)')
+    args = parser.parse_args(argv)
+
+    try:
+        check_export(args.dataset, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    from sql_connection import get_sql_connection
+
+    logging.basicConfig(level=logging.INFO)
+
+    binary = args.format == 'parquet'
+    if args.output:
+        output = open(args.output, 'wb' if binary else 'w', newline='' if not binary else None)
+    else:
+        output = sys.stdout.buffer if binary else sys.stdout
+    connection = get_sql_connection()
+    try:
+        started = datetime.now()
+        begin_snapshot(connection)
+        for chunk in stream_export(connection, args.dataset, args.format, args.date_from, args.date_to):
+            output.write(chunk)
+        logger.info(f"Exported {args.dataset} in {(datetime.now() - started).total_seconds():.1f}s")
+    finally:
+        connection.close()
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,243 @@
-import logging
-
-def setup_logging():
-    logging.basicConfig(level=logging.INFO,
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows, where gunicorn does not run: one process writes the file
+    fcntl = None
+
+# Non-blocking, structured logging for the backend.
+#
+# Loggers only put records on an in-memory queue; a listener thread formats
+# them as JSON lines and writes them to a rotating file and the console, so
+# request threads never wait on file I/O. When the queue is full, records are
+# dropped and counted rather than blocking the caller.
+#
+# Under gunicorn every worker writes the same file. Each write holds an
+# exclusive lock on LOG_FILE.lock (fcntl, so POSIX only), reopens the file if
+# another process has rotated it and checks its size on disk, so whichever
+# worker crosses LOG_MAX_BYTES rotates it, exactly once. LOG_MAX_BYTES=0
+# leaves rotation to logrotate, which the same reopen check follows.
+#
+# Tunables (environment):
+#   LOG_LEVEL         root level (default INFO)
+#   LOG_LEVELS        per-logger levels, e.g. "sql_connection=DEBUG,werkzeug=WARNING"
+#   LOG_SAMPLING      keep rate for records below WARNING, per logger,
+#                     e.g. "sql_connection=0.01" keeps 1% of pool debug lines
+#   LOG_FILE          log file (default flask_app.log; empty disables it)
+#   LOG_MAX_BYTES     rotate the file at this size (default 50 MB, 0: never)
+#   LOG_BACKUP_COUNT  rotated files to keep (default 10)
+#   LOG_CONSOLE       also log to stderr (default 1)
+#   LOG_QUEUE_SIZE    records buffered before dropping (default 10000)
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('LOG_FILE', 'flask_app.log')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '10'))
+LOG_CONSOLE = os.environ.get('LOG_CONSOLE', '1') == '1'
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+# Id of the request being served by the current thread or task
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+
+def _parse_mapping(value):
+    """Parse "name=value,name=value" into a dict."""
+    mapping = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, setting = item.split('=', 1)
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+LOG_LEVELS = {name: level.upper() for name, level in _parse_mapping(os.environ.get('LOG_LEVELS')).items()}
+LOG_SAMPLING = {name: float(rate) for name, rate in _parse_mapping(os.environ.get('LOG_SAMPLING')).items()}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Tag records with the current request id, and sample high-volume loggers.
+
+    Runs on the thread that logs, before the record is queued. Records at
+    WARNING and above are always kept.
+    """
+
+    def __init__(self, sampling):
+        super().__init__()
+        self.sampling = sampling
+
+    def _rate(self, name):
+        while name:
+            if name in self.sampling:
+                return self.sampling[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and self.sampling:
+            rate = self._rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, while the arguments are
+        # still valid; the listener thread does the JSON formatting.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler for a file that several processes append to."""
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        # Opened per process: flock locks are shared by inherited descriptors
+        self._lock_file = open(self.baseFilename + '.lock', 'a') if fcntl else None
+
+    def _reopen_if_rotated(self):
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(self.stream.fileno()) if self.stream else None
+        if current is None or opened is None or (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            if self.stream:
+                self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record):
+        if self._lock_file is None:
+            return super().emit(record)
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                super().emit(record)
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        with self.lock:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+        super().close()
+
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+_listener_pid = None
+
+
+def _output_handlers():
+    formatter = JsonFormatter()
+    handlers = []
+    if LOG_FILE:
+        handlers.append(SharedRotatingFileHandler(LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT))
+    if LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def setup_logging():
+    """Route all logging through the queue; safe to call more than once.
+
+    Also call it after forking: the listener thread does not survive a fork,
+    so a new one (with a fresh queue) is started in the child.
+    """
+    global _handler, _listener, _listener_pid
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return _handler
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        if _handler is None:
+            _handler = DroppingQueueHandler(log_queue)
+            _handler.addFilter(ContextFilter(LOG_SAMPLING))
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_handler)
+            root.setLevel(LOG_LEVEL)
+            for name, level in LOG_LEVELS.items():
+                logging.getLogger(name).setLevel(level)
+            atexit.register(stop_logging)
+        else:
+            _handler.queue = log_queue
+
+        _listener = QueueListener(log_queue, *_output_handlers(), respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        return _handler
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+
+
+def logging_stats():
+    """Return queue depth and the number of records dropped so far."""
+    if _handler is None:
+        return {'queued': 0, 'dropped': 0}
+    return {'queued': _handler.queue.qsize(), 'dropped': _handler.dropped}
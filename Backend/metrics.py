@@ -0,0 +1,234 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+
+from flask import g, request
+
+import sql_connection
+from admission import admission_controller
+from logging_config import logging_stats
+
+# Request and database metrics in Prometheus text format, served on /metrics.
+#
+# init_app(app) times every request by route template (never by raw URL, to
+# keep the number of series bounded) and counts the statements, database time
+# and pool wait it caused, through the listeners in sql_connection. Pool,
+# admission and logging state are read when the metrics are scraped.
+#
+# Values are kept per process. Under gunicorn every series carries a `worker`
+# label with the process id, so sum() across workers in PromQL.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# Database activity of the request being served by this thread or task
+_request_db = contextvars.ContextVar('request_db', default=None)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, extra):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labels, key, extra)} {_format_value(value)}'
+                                for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, extra):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ('le',), key + (_format_value(bound),), extra)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key, extra)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key, extra)} {count}')
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests by route, method and status.',
+                   ('route', 'method', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by route.', ('route', 'method'))
+IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being served.')
+DB_QUERIES = Histogram('http_request_db_queries', 'Database statements executed per request.', ('route',),
+                       QUERY_COUNT_BUCKETS)
+DB_TIME = Histogram('http_request_db_seconds', 'Time spent executing database statements per request.',
+                    ('route',))
+POOL_WAIT = Histogram('http_request_pool_wait_seconds', 'Time a request waited for a pooled connection.',
+                      ('route',), POOL_WAIT_BUCKETS)
+
+REGISTRY = [REQUESTS, LATENCY, IN_FLIGHT, DB_QUERIES, DB_TIME, POOL_WAIT]
+
+IN_FLIGHT.set(value=0)
+_in_flight_lock = threading.Lock()
+_in_flight = 0
+
+
+def _on_query(statement, seconds, rowcount):
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += seconds
+
+
+def _on_checkout(wait_seconds):
+    stats = _request_db.get()
+    if stats is not None:
+        stats[2] += wait_seconds
+        stats[3] = True
+
+
+def _adjust_in_flight(delta):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+        IN_FLIGHT.set(value=_in_flight)
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    # [statements, db seconds, pool wait seconds, checked out]
+    g.metrics_db = [0, 0.0, 0.0, False]
+    _request_db.set(g.metrics_db)
+    _adjust_in_flight(1)
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exception):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    _adjust_in_flight(-1)
+    _request_db.set(None)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.pop('metrics_status', 500)
+    queries, db_seconds, pool_wait, checked_out = g.pop('metrics_db')
+
+    REQUESTS.inc(route, request.method, str(status))
+    LATENCY.observe(route, request.method, value=time.perf_counter() - started)
+    DB_QUERIES.observe(route, value=queries)
+    DB_TIME.observe(route, value=db_seconds)
+    if checked_out:
+        POOL_WAIT.observe(route, value=pool_wait)
+
+
+def init_app(app):
+    """Instrument a Flask app; registers request hooks and the database listeners."""
+    sql_connection.add_query_listener(_on_query)
+    sql_connection.add_checkout_listener(_on_checkout)
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+
+
+def _state_lines(extra):
+    """Gauges and counters read from the pool, admission control and logging."""
+    pool = sql_connection.pool_stats()
+    admission = admission_controller.stats()
+    log = logging_stats()
+    lines = []
+
+    def metric(name, kind, help_text, value, labels=()):
+        lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}',
+                      f'{name}{_format_labels((), (), tuple(labels) + extra)} {_format_value(value)}'])
+
+    metric('db_pool_size', 'gauge', 'Maximum connections in the pool.', pool['size'])
+    metric('db_pool_in_use', 'gauge', 'Connections checked out.', pool['in_use'])
+    metric('db_pool_idle', 'gauge', 'Idle open connections.', pool['idle'])
+    metric('db_pool_checkouts_total', 'counter', 'Connection checkouts.', pool['checkouts'])
+    metric('db_pool_exhausted_total', 'counter', 'Checkouts that timed out.', pool['exhausted'])
+
+    lines.extend(['# HELP db_pool_wait_seconds Checkout wait time.', '# TYPE db_pool_wait_seconds histogram'])
+    for bound, count in pool['wait_ms_histogram'].items():
+        le = '+Inf' if bound == '+Inf' else _format_value(float(bound) / 1000)
+        lines.append(f'db_pool_wait_seconds_bucket{_format_labels(("le",), (le,), extra)} {count}')
+    lines.append(f'db_pool_wait_seconds_sum{_format_labels((), (), extra)} {_format_value(pool["wait_seconds_sum"])}')
+    lines.append(f'db_pool_wait_seconds_count{_format_labels((), (), extra)} {pool["checkouts"]}')
+
+    metric('admission_in_flight', 'gauge', 'Requests admitted to the database.', admission['in_flight'])
+    lines.extend(['# HELP admission_rejected_total Requests rejected by admission control.',
+                  '# TYPE admission_rejected_total counter'])
+    for route_class, count in admission['rejected'].items():
+        lines.append(f'admission_rejected_total{_format_labels(("class",), (route_class,), extra)} {count}')
+
+    metric('log_records_dropped_total', 'counter', 'Log records dropped because the queue was full.',
+           log['dropped'])
+    return lines
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    extra = (('worker', os.getpid()),)
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(extra))
+    lines.extend(_state_lines(extra))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,231 @@
+import argparse
+import logging
+import os
+import re
+import sys
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import orders_dao
+import products_dao
+import sales_dao
+import stock_dao
+from sql_connection import get_sql_connection
+from storage import backend
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema migrations on top of Database/GSMS.sql and the other
+# table scripts.
+#
+#   python migrate.py status        # applied and pending migrations
+#   python migrate.py up            # apply every pending migration
+#   python migrate.py down --to 1   # revert the migrations above version 1
+#   python migrate.py check         # fail if a hot query plans a full scan
+#
+# A migration is a pair of files in Database/migrations,
+# NNNN_<name>.up.sql and NNNN_<name>.down.sql, applied in version order. A
+# NNNN_<name>.<engine>.up.sql or .down.sql file replaces the generic one on
+# that storage engine (DB_ENGINE, see storage.py). Applied versions are
+# recorded in schema_version. On SQLite a migration and its version row
+# commit together; MySQL commits every DDL statement on its own, so a failed
+# migration there may have to be finished or undone by hand.
+#
+# check EXPLAINs the lookups the tills run on every scan and checkout and
+# exits with status 1 if any of them would read a whole table. The optimizer
+# may prefer a scan on a handful of rows, so run it against a database of
+# realistic size, such as the one Benchmarks/seed.py builds.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Database', 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+?)\.(?:(mysql|sqlite)\.)?(up|down)\.sql$')
+
+VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+      version int NOT NULL PRIMARY KEY,
+      name varchar(255) NOT NULL,
+      applied_at datetime NOT NULL
+    )
+"""
+
+# (name, query, params, aliases that must be read through an index)
+HOT_QUERIES = [
+    ('products by barcode', products_dao.CATALOG_QUERY + " WHERE p.barcode IN (%s, %s)",
+     ('8901764052279', '8901063012721'), ('p',)),
+    ('product by name and unit', "SELECT product_id FROM products WHERE product_name = %s AND uom_id = %s",
+     ('Rice', 1), ('products',)),
+    ('product prices', "SELECT product_id, price_per_unit FROM products WHERE product_id IN (%s, %s)",
+     (2, 4), ('products',)),
+    ('stock levels', stock_dao.stock_levels_query(2), (2, 4), ('s', 'm')),
+    ('stock history', "SELECT movement_id, quantity, reason FROM stock_movements WHERE product_id = %s "
+                      "ORDER BY movement_id DESC LIMIT %s", (2, 100), ('stock_movements',)),
+    ('order history page', *orders_dao.build_orders_query(limit=100), ('orders', 'order_details')),
+    ('order history by date', *orders_dao.build_orders_query(date_from=datetime(2024, 10, 1),
+                                                            date_to=datetime(2024, 11, 1), limit=100),
+     ('orders', 'order_details')),
+    ('order details', "SELECT quantity, total_price, product_id FROM order_details WHERE order_id = %s",
+     (11,), ('order_details',)),
+    ('payment', "SELECT * FROM payments WHERE payment_id = %s", ('3',), ('payments',)),
+    ('daily sales', sales_dao.DAILY_SALES_QUERY, (date(2024, 10, 1), date(2024, 10, 31)) * 2,
+     ('daily_sales', 'daily_sales_deltas')),
+]
+
+
+class MigrationError(Exception):
+    """Raised when the migrations on disk and the recorded versions do not line up."""
+
+
+class Migration:
+    def __init__(self, version: int, name: str):
+        self.version = version
+        self.name = name
+        self.scripts = {}
+
+    def script(self, direction: str) -> str:
+        """Path of the up or down script for the current storage engine."""
+        path = self.scripts.get((direction, backend.name)) or self.scripts.get((direction, None))
+        if path is None:
+            raise MigrationError(f"Migration {self.version:04d}_{self.name} has no {direction} script")
+        return path
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """The migrations in `directory`, ordered by version."""
+    migrations = {}
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match is None:
+            continue
+        version, name, engine, direction = int(match.group(1)), match.group(2), match.group(3), match.group(4)
+        migration = migrations.setdefault(version, Migration(version, name))
+        if migration.name != name:
+            raise MigrationError(f"Version {version:04d} is used by both {migration.name} and {name}")
+        migration.scripts[(direction, engine)] = os.path.join(directory, filename)
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def split_statements(script: str) -> List[str]:
+    """Split a migration script into statements, dropping comment lines."""
+    statements = []
+    for statement in script.split(';\n'):
+        lines = [line for line in statement.splitlines() if line.strip() and not line.strip().startswith('--')]
+        if lines:
+            statements.append('\n'.join(lines).strip().rstrip(';'))
+    return statements
+
+
+def applied_versions(connection) -> Dict[int, str]:
+    """Map of applied migration versions to their names, creating schema_version if needed."""
+    with connection.cursor() as cursor:
+        cursor.execute(VERSION_TABLE)
+        connection.commit()
+        cursor.execute("SELECT version, name FROM schema_version ORDER BY version")
+        return {version: name for version, name in cursor.fetchall()}
+
+
+def _run(connection, migration: Migration, direction: str) -> None:
+    with open(migration.script(direction), encoding='utf-8') as script:
+        statements = split_statements(script.read())
+    try:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            if direction == 'up':
+                cursor.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (%s, %s, %s)",
+                               (migration.version, migration.name, datetime.now()))
+            else:
+                cursor.execute("DELETE FROM schema_version WHERE version = %s", (migration.version,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    logger.info(f"Migrated {direction}: {migration!r}")
+
+
+def migrate(connection, target: Optional[int] = None, directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """Apply pending migrations up to `target` (default: all); returns those applied."""
+    applied = applied_versions(connection)
+    pending = [migration for migration in discover(directory)
+               if migration.version not in applied and (target is None or migration.version <= target)]
+    if pending and applied and pending[0].version < max(applied):
+        raise MigrationError(f"Migration {pending[0]!r} is older than the applied version {max(applied):04d}; "
+                             f"revert to it first")
+    for migration in pending:
+        _run(connection, migration, 'up')
+    return pending
+
+
+def rollback(connection, target: int, directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """Revert applied migrations above version `target`, newest first; returns those reverted."""
+    applied = applied_versions(connection)
+    migrations = {migration.version: migration for migration in discover(directory)}
+    reverted = []
+    for version in sorted(applied, reverse=True):
+        if version <= target:
+            break
+        if version not in migrations:
+            raise MigrationError(f"Applied version {version:04d} ({applied[version]}) has no scripts on disk")
+        _run(connection, migrations[version], 'down')
+        reverted.append(migrations[version])
+    return reverted
+
+
+def full_scans(connection, queries=HOT_QUERIES) -> List[str]:
+    """Describe every hot query whose plan reads one of its indexed tables in full."""
+    problems = []
+    with connection.cursor() as cursor:
+        for name, query, params, indexed in queries:
+            scanned = [alias for alias in backend.full_scans(cursor, query, params) if alias in indexed]
+            if scanned:
+                problems.append(f"{name}: full scan of {', '.join(scanned)}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply, revert and check schema migrations.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='list applied and pending migrations')
+    up_parser = commands.add_parser('up', help='apply pending migrations')
+    up_parser.add_argument('--to', type=int, help='stop after this version')
+    down_parser = commands.add_parser('down', help='revert migrations')
+    down_parser.add_argument('--to', type=int, help='revert every version above this one (default: the latest only)')
+    commands.add_parser('check', help='fail if a hot query would scan a whole table')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    connection = get_sql_connection()
+    try:
+        if args.command == 'status':
+            applied = applied_versions(connection)
+            for migration in discover():
+                state = 'applied' if migration.version in applied else 'pending'
+                print(f"{migration!r:<40} {state}")
+        elif args.command == 'up':
+            applied = migrate(connection, args.to)
+            logger.info(f"{len(applied)} migration(s) applied.")
+        elif args.command == 'down':
+            target = args.to
+            if target is None:
+                applied = sorted(applied_versions(connection))
+                target = applied[-2] if len(applied) > 1 else 0
+            reverted = rollback(connection, target)
+            logger.info(f"{len(reverted)} migration(s) reverted.")
+        else:
+            problems = full_scans(connection)
+            for problem in problems:
+                logger.error(problem)
+            if problems:
+                return 1
+            logger.info(f"All {len(HOT_QUERIES)} hot queries use an index.")
+    except MigrationError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
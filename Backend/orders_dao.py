@@ -2,86 +2,145 @@ from datetime import datetime
 from sql_connection import get_sql_connection
 import stock_dao  # Import stock_dao to manage stock
 import logging  # Import logging for better error tracking
-from products_dao import get_product_price
+from products_dao import get_product_prices
+from catalog_cache import catalog_cache
+import sales_dao
+import stock_ledger
 
+logger = logging.getLogger(__name__)
 
-def insert_order(connection, order):
-    """Insert a new order and order details, and update stock."""
-    logging.debug("Inserting Order: %s", order)
 
+def parse_order_lines(order):
+    """Validate an order payload and return its quantities keyed by product ID.
+
+    Repeated lines for the same product are merged, as the unique
+    (order_id, product_id) key on order_details requires.
+    """
     if 'customer_name' not in order or 'order_details' not in order:
-        logging.error("Required fields are missing in the order: %s", order)
+        logger.error("Required fields are missing in the order: %s", order)
         raise ValueError("Missing required fields")
 
     # Map grandTotal to total
     order['total'] = float(order.pop('grandTotal', 0))
 
     if not order['order_details']:
-        logging.error("Order details are missing or invalid: %s", order)
+        logger.error("Order details are missing or invalid: %s", order)
         raise ValueError("Invalid order details")
 
+    quantities = {}
+    for order_detail_record in order['order_details']:
+        product_id = int(order_detail_record.get('product_id', 0))  # Use 'product_id'
+        quantity = float(order_detail_record.get('quantity', 0))  # Use 'quantity'
+        if product_id <= 0 or quantity <= 0:
+            logger.error("Invalid order line: %s", order_detail_record)
+            raise ValueError("Invalid order details")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    return quantities
+
+def build_order_details_insert(order_id, quantities, prices):
+    """Build the multi-row INSERT for an order's details."""
+    order_details_data = []
+    for product_id, quantity in quantities.items():
+        total_price = prices[product_id] * quantity  # Calculate total price
+        order_details_data.extend((order_id, product_id, quantity, total_price))
+
+    order_details_query = ("INSERT INTO order_details "
+                           "(order_id, product_id, quantity, total_price) VALUES " +
+                           ", ".join(["(%s, %s, %s, %s)"] * len(quantities)))
+    return order_details_query, tuple(order_details_data)
+
+def insert_order(connection, order):
+    """Insert a new order and order details, and update stock.
+
+    Prices every line with one query, reserves the basket's stock with
+    stock_dao.reserve_stock, which records the sale in the stock ledger, and
+    commits the order, its details and the stock movements in a single
+    transaction, so the number of round trips does not
+    depend on the basket size. The transaction is retried if it loses a lock
+    race with another till.
+    """
+    logger.debug("Inserting Order: %s", order)
+    quantities = parse_order_lines(order)
+
+    order_id = stock_dao.retry_on_lock_conflict(connection, lambda: _insert_order(connection, order, quantities))
+
+    catalog_cache.stock_changed(quantities)
+    return order_id
+
+def _insert_order(connection, order, quantities):
     with connection.cursor() as cursor:
         try:
+            prices = get_product_prices(connection, list(quantities))
+            missing = [product_id for product_id in quantities if product_id not in prices]
+            if missing:
+                logger.error("Unknown product IDs in order: %s", missing)
+                raise ValueError("Product not found")
+
+            ordered_at = datetime.now()
             order_query = ("INSERT INTO orders (customer_name, total, datetime) VALUES (%s, %s, %s)")
-            order_data = (order['customer_name'], order['total'], datetime.now())
+            order_data = (order['customer_name'], order['total'], ordered_at)
             cursor.execute(order_query, order_data)
             order_id = cursor.lastrowid
-            
-            order_details_query = ("INSERT INTO order_details "
-                                   "(order_id, product_id, quantity, total_price) "
-                                   "VALUES (%s, %s, %s, %s) "
-                                   "ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity), "
-                                   "total_price = total_price + VALUES(total_price)")
-
-            order_details_data = []
-            for order_detail_record in order['order_details']:
-                product_id = int(order_detail_record.get('product_id', 0))  # Use 'product_id'
-                quantity = float(order_detail_record['quantity'])  # Use 'quantity'
-                
-                # Fetch product price
-                product_price = get_product_price(connection, product_id)
-                total_price = product_price * quantity  # Calculate total price
-
-                if not stock_dao.is_stock_available(connection, product_id, quantity):
-                    logging.error("Insufficient stock for product ID: %s", product_id)
-                    raise ValueError("Insufficient stock")
-
-                stock_dao.update_stock(connection, product_id, -quantity)
-                order_details_data.append((order_id, product_id, quantity, total_price))
-
-            cursor.executemany(order_details_query, order_details_data)
+
+            try:
+                stock_dao.reserve_stock(connection, quantities, order_id)
+            except stock_dao.InsufficientStockError as e:
+                logger.error("Insufficient stock for order lines: %s", e.shortages)
+                raise
+
+            cursor.execute(*build_order_details_insert(order_id, quantities, prices))
+            sales_dao.apply_statements(cursor, sales_dao.build_order_rollup(
+                ordered_at.date(), order['total'], quantities, prices))
+
             connection.commit()
             return order_id
 
         except Exception as e:
-            logging.error("Error inserting order: %s", str(e))
+            logger.error("Error inserting order: %s", str(e))
             connection.rollback()
             raise  # Propagate the exception
 
 def delete_order(connection, order_id):
-    """Delete an order and restore stock."""
+    """Delete an order, restore its stock and remove it from the sales rollups."""
     with connection.cursor() as cursor:
         try:
-            # Get order details to restore stock
-            order_details = get_order_details(connection, order_id)
-            for detail in order_details:
-                product_id = detail['product_id']
-                quantity = detail['quantity']
-                stock_dao.increase_stock(connection, product_id, quantity)
+            cursor.execute("SELECT total, datetime FROM orders WHERE order_id = %s FOR UPDATE", (order_id,))
+            order = cursor.fetchone()
+            if order is None:
+                logger.warning("Order with ID %s not found.", order_id)
+                return None
+            total, ordered_at = order
+
+            quantities = {}
+            prices = {}
+            for detail in get_order_details(connection, order_id):
+                quantities[detail['product_id']] = detail['quantity']
+                prices[detail['product_id']] = detail['total_price'] / detail['quantity'] if detail['quantity'] else 0
+
+            stock_dao.record_movements(connection, [(product_id, quantity, stock_ledger.SALE_REVERSAL, order_id, None)
+                                                    for product_id, quantity in sorted(quantities.items())])
+            sales_dao.apply_statements(cursor, sales_dao.build_order_rollup(
+                ordered_at.date(), total, quantities, prices, sign=-1))
+            # Its payments go with it (ON DELETE CASCADE), and with them their rollup
+            cursor.execute(*sales_dao.build_order_payments_rollup(order_id))
 
             # Delete from order_details and orders
             cursor.execute("DELETE FROM order_details WHERE order_id = %s", (order_id,))
             cursor.execute("DELETE FROM orders WHERE order_id = %s", (order_id,))
 
             connection.commit()
-            logging.info("Order with ID %s deleted successfully.", order_id)
-            return order_id
+            logger.info("Order with ID %s deleted successfully.", order_id)
 
         except Exception as e:
             connection.rollback()  # Rollback in case of error
-            logging.error("Error deleting order: %s", str(e), exc_info=True)
+            logger.error("Error deleting order: %s", str(e), exc_info=True)
             return None
 
+    catalog_cache.stock_changed(quantities)
+    sales_dao.rollups_rewritten(ordered_at.date())
+    return order_id
+
 def get_order_details(connection, order_id):
     """Fetch order details for a given order."""
     with connection.cursor() as cursor:
@@ -103,48 +162,122 @@ def get_order_details(connection, order_id):
             'price_per_unit': record[5]
         } for record in records]
 
+ORDERS_BATCH_SIZE = 500
+CURSOR_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def encode_orders_cursor(order):
+    """Build the opaque keyset cursor that resumes after the given order."""
+    return f"{order['datetime'].replace(' ', 'T')}_{order['order_id']}"
+
+def decode_orders_cursor(cursor_value):
+    """Split a keyset cursor into its (datetime, order_id) position."""
+    try:
+        dt, order_id = cursor_value.rsplit('_', 1)
+        return datetime.strptime(dt, CURSOR_DATETIME_FORMAT), int(order_id)
+    except (AttributeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def build_orders_query(date_from=None, date_to=None, after=None, limit=None):
+    """Build the ordered order/detail join read by iter_orders."""
+    conditions = []
+    params = []
+    if date_from is not None:
+        conditions.append("datetime >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("datetime < %s")
+        params.append(date_to)
+    if after is not None:
+        after_dt, after_id = after
+        conditions.append("(datetime < %s OR (datetime = %s AND order_id < %s))")
+        params.extend([after_dt, after_dt, after_id])
+
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %s"
+        params.append(int(limit))
+
+    query = ("SELECT o.order_id, o.customer_name, o.total, o.datetime, "
+             "order_details.product_id, order_details.quantity, order_details.total_price, "
+             "products.product_name, products.price_per_unit "
+             "FROM (SELECT order_id, customer_name, total, datetime FROM orders "
+             f"{where}ORDER BY datetime DESC, order_id DESC {limit_clause}) o "
+             "LEFT JOIN order_details ON o.order_id = order_details.order_id "
+             "LEFT JOIN products ON order_details.product_id = products.product_id "
+             "ORDER BY o.datetime DESC, o.order_id DESC")
+    return query, tuple(params)
+
+def fold_order_rows(rows, current):
+    """Group a batch of ordered join rows into orders.
+
+    `current` is the order still being assembled from the previous batch.
+    Returns the orders completed by this batch and the new `current`.
+    """
+    completed = []
+    for row in rows:
+        order_id, customer_name, total, dt, product_id, quantity, total_price, product_name, price_per_unit = row
+        if current is None or current['order_id'] != order_id:
+            if current is not None:
+                completed.append(current)
+            current = {
+                'order_id': order_id,
+                'customer_name': customer_name,
+                'total': total,
+                'datetime': dt.strftime("%Y-%m-%d %H:%M:%S"),
+                'order_details': []
+            }
+        if product_id:
+            current['order_details'].append({
+                'product_id': product_id,
+                'quantity': quantity,
+                'total_price': total_price,
+                'product_name': product_name,
+                'price_per_unit': float(price_per_unit) if price_per_unit is not None else None
+            })
+    return completed, current
+
+def iter_orders(connection, date_from=None, date_to=None, after=None, limit=None):
+    """Yield orders with their details, newest first, without materializing them.
+
+    Orders are ordered by (datetime, order_id) descending. `after` is a
+    (datetime, order_id) keyset position to resume from, `date_from` is
+    inclusive and `date_to` exclusive. Rows are streamed from an unbuffered
+    cursor in batches and grouped into one dict per order as they arrive.
+    """
+    cursor = connection.cursor(buffered=False)
+    exhausted = False
+    try:
+        cursor.execute(*build_orders_query(date_from, date_to, after, limit))
+        current = None
+        while True:
+            rows = cursor.fetchmany(ORDERS_BATCH_SIZE)
+            if not rows:
+                break
+            completed, current = fold_order_rows(rows, current)
+            yield from completed
+        exhausted = True
+        if current is not None:
+            yield current
+    finally:
+        if not exhausted:
+            # The consumer stopped early; drain the unbuffered result so the
+            # connection can be reused.
+            connection.consume_results()
+        cursor.close()
+
 def get_all_orders(connection):
     """Fetch all orders and their details."""
-    with connection.cursor() as cursor:
-        query = ("SELECT orders.order_id, orders.customer_name, orders.total, orders.datetime, "
-                 "order_details.product_id, order_details.quantity, order_details.total_price, "
-                 "products.product_name, products.price_per_unit "
-                 "FROM orders "
-                 "LEFT JOIN order_details ON orders.order_id = order_details.order_id "
-                 "LEFT JOIN products ON order_details.product_id = products.product_id")
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
-
-        response = {}
-        for row in rows:
-            order_id, customer_name, total, dt, product_id, quantity, total_price, product_name, price_per_unit = row
-            if order_id not in response:
-                response[order_id] = {
-                    'order_id': order_id,
-                    'customer_name': customer_name,
-                    'total': total,
-                    'datetime': dt.strftime("%Y-%m-%d %H:%M:%S"),
-                    'order_details': []
-                }
-            if product_id:
-                response[order_id]['order_details'].append({
-                    'product_id': product_id,
-                    'quantity': quantity,
-                    'total_price': total_price,
-                    'product_name': product_name,
-                    'price_per_unit': price_per_unit
-                })
-
-        return list(response.values())
+    return list(iter_orders(connection))
 
 if __name__ == '__main__':
     connection = get_sql_connection()
     logging.basicConfig(level=logging.DEBUG)
     try:
         orders = get_all_orders(connection)
-        logging.info("Retrieved all orders: %s", orders)
+        logger.info("Retrieved all orders: %s", orders)
     except Exception as e:
-        logging.error("Failed to retrieve orders: %s", str(e), exc_info=True)
+        logger.error("Failed to retrieve orders: %s", str(e), exc_info=True)
     finally:
         connection.close()
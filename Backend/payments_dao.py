@@ -1,4 +1,17 @@
 import uuid
+import sales_dao
+
+# payments.payment_mode values. MySQL's ENUM matches them case-insensitively
+# and SQLite's CHECK does not, so modes are stored in this spelling, which
+# also keeps the daily_payment_sales keys consistent.
+PAYMENT_MODES = ('UPI', 'Cash', 'Credit Card')
+
+def canonical_payment_mode(payment_mode):
+    """Return the stored spelling of a payment mode, matched case-insensitively."""
+    for mode in PAYMENT_MODES:
+        if str(payment_mode).strip().lower() == mode.lower():
+            return mode
+    raise ValueError(f"Invalid payment mode: {payment_mode}")
 
 class PaymentsDAO:
     def __init__(self, connection):
@@ -8,6 +21,7 @@ class PaymentsDAO:
     def insert_payment(self, order_id, payment_mode, grand_total=None, customer_name=None):
         try:
             payment_id = str(uuid.uuid4())  # Generate a unique payment ID
+            payment_mode = canonical_payment_mode(payment_mode)
             payment_status = 'Pending'  # Initial payment status can be set to 'Pending'
             
             # Modified to insert grand_total and customer_name
@@ -37,6 +51,10 @@ class PaymentsDAO:
                 if cursor.rowcount == 0:
                     raise ValueError("Payment ID not found.")
 
+                if new_status == 'Paid':
+                    # Count the payment in the rollups in the same transaction
+                    cursor.execute(*sales_dao.build_payment_rollup(payment_id))
+
                 self.connection.commit()  # Commit the transaction
 
         except Exception as e:
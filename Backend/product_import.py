@@ -0,0 +1,149 @@
+import csv
+import io
+import json
+import logging
+import math
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+import products_dao
+import uom_dao
+
+logger = logging.getLogger(__name__)
+
+# Bulk catalog import for /importProducts.
+#
+# The upload is read as a stream, one record at a time, and upserted in
+# chunks of IMPORT_CHUNK_SIZE rows, each with a handful of multi-row
+# statements in its own transaction (products_dao.upsert_products). A record
+# that fails validation is reported by line number while the rest of the load
+# carries on. A chunk the database rejects is split in halves and retried
+# until the rows it rejects are isolated, so only those are reported.
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# Column limits of products and stock (GSMS.sql)
+MAX_NAME_LENGTH = 255
+MAX_BARCODE_LENGTH = 255
+MAX_PRICE = 99999999.99  # decimal(10,2)
+MAX_QUANTITY = 2 ** 31 - 1  # int
+
+FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(content_type: str, requested: Optional[str] = None) -> str:
+    """Pick the upload format from an explicit `format` argument or the Content-Type."""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f'Unsupported format: {requested}')
+        return requested
+    if 'csv' in (content_type or ''):
+        return 'csv'
+    if 'ndjson' in (content_type or '') or 'jsonl' in (content_type or ''):
+        return 'ndjson'
+    raise ValueError('Upload must be text/csv or application/x-ndjson')
+
+
+def iter_records(stream, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (line, record, error) for every record of a binary upload stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, {key: value for key, value in record.items() if key and value != ''}, None
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {str(e)}'
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, 'Each line must be a JSON object'
+                continue
+            yield line_number, record, None
+
+
+def clean_record(record: Dict, uom_ids: Set[int]) -> Dict:
+    """Validate and convert one import record; raises ValueError with a readable message."""
+    product_name = str(record.get('product_name') or '').strip()
+    if not product_name:
+        raise ValueError('Product name is required')
+    if len(product_name) > MAX_NAME_LENGTH:
+        raise ValueError(f'Product name is longer than {MAX_NAME_LENGTH} characters')
+    if 'price_per_unit' not in record or 'uom_id' not in record:
+        raise ValueError('Price per unit and UOM id are required')
+    try:
+        price = float(record['price_per_unit'])
+        uom_id = int(record['uom_id'])
+        quantity = int(record['quantity_in_stock']) if record.get('quantity_in_stock') is not None else None
+    except (TypeError, ValueError):
+        raise ValueError('Price, UOM id and quantity must be numbers')
+    if price < 0 or (quantity is not None and quantity < 0):
+        raise ValueError('Price and quantity cannot be negative')
+    if not math.isfinite(price) or round(price, 2) > MAX_PRICE:
+        raise ValueError(f'Price must be at most {MAX_PRICE}')
+    if quantity is not None and quantity > MAX_QUANTITY:
+        raise ValueError(f'Quantity must be at most {MAX_QUANTITY}')
+    if uom_id not in uom_ids:
+        raise ValueError(f'Unknown UOM id {uom_id}')
+    barcode = str(record['barcode']).strip() if record.get('barcode') not in (None, '') else None
+    if barcode is not None and len(barcode) > MAX_BARCODE_LENGTH:
+        raise ValueError(f'Barcode is longer than {MAX_BARCODE_LENGTH} characters')
+    return {
+        'product_name': product_name,
+        'price_per_unit': price,
+        'uom_id': uom_id,
+        'barcode': barcode,
+        'quantity_in_stock': quantity,
+    }
+
+
+def import_products(connection, stream, fmt: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """Import a product upload chunk by chunk and summarize the outcome."""
+    uom_ids = {uom['uom_id'] for uom in uom_dao.get_uoms(connection)}
+    summary = {'rows': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def fail(line_number, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line_number, 'error': message})
+
+    def flush(chunk):
+        try:
+            counts = products_dao.upsert_products(connection, [row for _, row in chunk])
+        except Exception as e:
+            if len(chunk) == 1:
+                logger.warning(f"Error importing product at line {chunk[0][0]}: {str(e)}")
+                fail(chunk[0][0], f'Database error: {str(e)}')
+                return
+            # Retry the halves in order, so a later duplicate still wins
+            logger.info(f"Retrying products at lines {chunk[0][0]}-{chunk[-1][0]} in halves: {str(e)}")
+            middle = len(chunk) // 2
+            flush(chunk[:middle])
+            flush(chunk[middle:])
+            return
+        summary['inserted'] += counts['inserted']
+        summary['updated'] += counts['updated']
+
+    chunk = []
+    for line_number, record, error in iter_records(stream, fmt):
+        summary['rows'] += 1
+        if error is None:
+            try:
+                chunk.append((line_number, clean_record(record, uom_ids)))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            fail(line_number, error)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    logger.info(f"Imported products: {summary['rows']} rows, {summary['inserted']} inserted, "
+                 f"{summary['updated']} updated, {summary['failed']} failed.")
+    return summary
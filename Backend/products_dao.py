@@ -1,26 +1,48 @@
 from typing import Dict, Union, List
+import functools
 import logging
-from sql_connection import get_sql_connection  # Use your connection from sql_connection.py
-import mysql.connector
 import decimal  # Import decimal to handle Decimal type
-from stock_dao import get_initial_stock
+from storage import backend, DatabaseError
+from sql_connection import batch_size, execute_prepared
+from stock_dao import get_initial_stock, get_stock_levels, lock_stock_balances, set_stock_levels
+from stock_ledger import BALANCE
+from catalog_cache import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Catalog rows as served by /getProducts; append a WHERE clause to filter
+CATALOG_QUERY = f"""
+    SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, u.uom_name, {BALANCE}
+    FROM products p
+    LEFT JOIN uom u ON p.uom_id = u.uom_id
+    LEFT JOIN stock s ON p.product_id = s.product_id
+"""
+PRODUCT_EXISTS_QUERY = "SELECT COUNT(*) FROM products WHERE barcode = %s"
+PRODUCT_PRICE_QUERY = "SELECT price_per_unit FROM products WHERE product_id = %s"
+
+@functools.lru_cache(maxsize=None)
+def barcodes_query(size: int) -> str:
+    """Catalog rows of `size` barcodes; one prepared shape per batch size."""
+    return CATALOG_QUERY + f" WHERE p.barcode IN ({', '.join(['%s'] * size)})"
+
+@functools.lru_cache(maxsize=None)
+def prices_query(size: int) -> str:
+    """Prices of `size` product IDs; one prepared shape per batch size."""
+    return f"SELECT product_id, price_per_unit FROM products WHERE product_id IN ({', '.join(['%s'] * size)})"
 
 def product_exists(connection, barcode: str) -> bool:
     """Check if a product with the given barcode already exists."""
-    cursor = connection.cursor()
-    try:
-        query = "SELECT COUNT(*) FROM products WHERE barcode = %s"
-        cursor.execute(query, (barcode,))
-        count = cursor.fetchone()[0]
-        return count > 0  # Return True if a product exists, otherwise False
-    finally:
-        cursor.close()
+    rows, _ = execute_prepared(connection, PRODUCT_EXISTS_QUERY, (barcode,))
+    return rows[0][0] > 0  # Return True if a product exists, otherwise False
 
 def insert_product(connection, product_data: Dict) -> Dict[str, str]:
-    """Insert a new product and return its ID, or update if it already exists."""
+    """Insert a new product and return its ID, or update if it already exists.
+
+    The product's stock is written in the same transaction: a new product
+    starts at quantity_in_stock, an existing one gets it added.
+    """
     try:
-        # Logging the incoming product data for debugging purposes
-        logging.info(f"Received product data: {product_data}")
+        logger.debug(f"Inserting product {product_data.get('product_name')!r}")
 
         # Validate the presence of required fields
         required_fields = ['product_name', 'price_per_unit', 'uom_id', 'quantity_in_stock']
@@ -48,7 +70,7 @@ def insert_product(connection, product_data: Dict) -> Dict[str, str]:
                 WHERE product_id = %s
                 """
                 cursor.execute(update_product_query, (product_data['price_per_unit'], product_id))
-                logging.info(f"Updated existing product ID: {product_id}")
+                logger.info(f"Updated existing product ID: {product_id}")
 
             else:
                 # Insert new product
@@ -57,49 +79,128 @@ def insert_product(connection, product_data: Dict) -> Dict[str, str]:
                 VALUES (%s, %s, %s)
                 """
                 cursor.execute(insert_product_query, (product_name, product_data['price_per_unit'], product_data['uom_id']))
-                new_product_id = cursor.lastrowid
-                logging.info(f"Inserted new product with ID: {new_product_id}")
+                product_id = cursor.lastrowid
+                logger.info(f"Inserted new product with ID: {product_id}")
+
+            balance = lock_stock_balances(connection, [product_id]).get(product_id, 0) if existing_product else 0
+            set_stock_levels(connection, {product_id: balance + product_data['quantity_in_stock']})
 
             connection.commit()  # Commit changes
-            return {'status': 'success', 'product_id': existing_product[0] if existing_product else new_product_id}
+            catalog_cache.invalidate()
+            return {'status': 'success', 'product_id': product_id}
 
-    except mysql.connector.Error as db_err:
+    except DatabaseError as db_err:
         connection.rollback()
-        logging.error(f"Database error inserting product: {str(db_err)}")
+        logger.error(f"Database error inserting product: {str(db_err)}")
         return {'status': 'fail', 'message': 'Database error occurred'}
 
     except Exception as e:
         connection.rollback()
-        logging.error(f"General error inserting product: {str(e)}")
+        logger.error(f"General error inserting product: {str(e)}")
         return {'status': 'fail', 'message': str(e)}
 
-def update_stock(product_id: int, quantity: int) -> Dict[str, str]:
-    """Update the stock for a given product."""
+def _find_product_ids(cursor, keys) -> Dict:
+    """Map (product_name, uom_id) keys to product IDs.
+
+    The rows the database matches are keyed by backend.name_key, which folds
+    names the way the products.product_name collation compares them.
+    """
+    placeholders = ', '.join(['(%s, %s)'] * len(keys))
+    cursor.execute(f"""
+        SELECT product_id, product_name, uom_id FROM products
+        WHERE (product_name, uom_id) IN ({placeholders})
+        ORDER BY product_id
+    """, tuple(value for key in keys for value in key))
+    found = {}
+    for product_id, product_name, uom_id in cursor.fetchall():
+        found.setdefault((backend.name_key(product_name), uom_id), product_id)
+    return found
+
+def upsert_products(connection, rows: List[Dict]) -> Dict[str, int]:
+    """Insert or update a chunk of products and their stock in one transaction.
+
+    Rows need product_name, price_per_unit and uom_id, and may carry barcode and
+    quantity_in_stock. They are matched to existing products on (product_name,
+    uom_id) like insert_product, a later duplicate in the chunk wins. A given
+    quantity_in_stock sets the stock level; new products without one start at
+    get_initial_stock. Raises on database errors after rolling back.
+    """
+    chunk = {}
+    for row in rows:
+        chunk[(backend.name_key(row['product_name']), row['uom_id'])] = row
+    keys = [(row['product_name'], row['uom_id']) for row in chunk.values()]
+
     try:
-        connection = get_sql_connection()  # Get connection
         with connection.cursor() as cursor:
-            update_stock_query = """
-            UPDATE stock 
-            SET quantity_in_stock = %s 
-            WHERE product_id = %s
-            """
-            cursor.execute(update_stock_query, (quantity, product_id))
-            if cursor.rowcount > 0:
-                connection.commit()
-                logging.info(f"Stock updated successfully for product ID {product_id}")
-                return {'status': 'success', 'message': f'Stock updated for product ID {product_id}'}
+            existing = _find_product_ids(cursor, keys)
+            new_rows = [row for key, row in chunk.items() if key not in existing]
+            updated_rows = [row for key, row in chunk.items() if key in existing]
+
+            if new_rows:
+                cursor.execute(
+                    "INSERT INTO products (product_name, price_per_unit, uom_id, barcode) VALUES "
+                    + ', '.join(['(%s, %s, %s, %s)'] * len(new_rows)),
+                    tuple(value for row in new_rows
+                          for value in (row['product_name'], row['price_per_unit'], row['uom_id'], row.get('barcode'))))
+                # Multi-row inserts only report the first ID, so look the new ones up
+                product_ids = _find_product_ids(cursor, keys)
             else:
-                logging.warning(f"No stock entry found for product ID {product_id}.")
-                return {'status': 'fail', 'message': 'No stock entry found for this product.'}
+                product_ids = existing
+
+            if updated_rows:
+                derived = ' UNION ALL '.join(['SELECT %s AS product_id, %s AS price_per_unit, %s AS barcode']
+                                             * len(updated_rows))
+                cursor.execute(backend.update_from(
+                    'products', 'p', derived, 'p.product_id = d.product_id',
+                    {'price_per_unit': 'd.price_per_unit', 'barcode': 'COALESCE(d.barcode, p.barcode)'}
+                ), tuple(value for row in updated_rows
+                         for value in (existing[(backend.name_key(row['product_name']), row['uom_id'])],
+                                       row['price_per_unit'], row.get('barcode'))))
+
+            unmatched = [row['product_name'] for key, row in chunk.items() if key not in product_ids]
+            if unmatched:
+                raise ValueError(f"Products not found after insert: {', '.join(unmatched)}")
+
+            levels = {}
+            for key, row in chunk.items():
+                if row.get('quantity_in_stock') is not None:
+                    levels[product_ids[key]] = row['quantity_in_stock']
+                elif key not in existing:
+                    levels[product_ids[key]] = get_initial_stock(row['uom_id'])
+            set_stock_levels(connection, levels)
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    catalog_cache.invalidate()
+    return {'inserted': len(new_rows), 'updated': len(updated_rows)}
+
+def update_stock(connection, product_id: int, quantity: int) -> Dict[str, str]:
+    """Set the stock level of a given product, as a correction in the stock ledger."""
+    try:
+        if product_id in set_stock_levels(connection, {product_id: quantity}):
+            connection.commit()
+            catalog_cache.stock_changed([product_id])
+            logger.info(f"Stock updated successfully for product ID {product_id}")
+            return {'status': 'success', 'message': f'Stock updated for product ID {product_id}'}
+        else:
+            connection.rollback()
+            logger.warning(f"No stock entry found for product ID {product_id}.")
+            return {'status': 'fail', 'message': 'No stock entry found for this product.'}
     except Exception as e:
-        logging.error(f"Error updating stock for product ID {product_id}: {str(e)}")
+        connection.rollback()
+        logger.error(f"Error updating stock for product ID {product_id}: {str(e)}")
         return {'status': 'fail', 'message': str(e)}
-    finally:
-        connection.close()  # Close the connection here
 
-def update_product(product_id: int, product_data: Dict) -> Dict[str, str]:
-    """Update an existing product with the given data."""
-    connection = get_sql_connection()
+def update_product(connection, product_id: int, product_data: Dict) -> Dict[str, str]:
+    """Update an existing product with the given data.
+
+    A `quantity_in_stock` in the data sets the stock level absolutely (as a
+    correction in the stock ledger), in the same transaction as the product
+    fields.
+    """
     cursor = connection.cursor()
     try:
         fields_to_update = []
@@ -119,41 +220,42 @@ def update_product(product_id: int, product_data: Dict) -> Dict[str, str]:
             fields_to_update.append("barcode = %s")
             params.append(product_data['barcode'])
 
-        if 'quantity_in_stock' in product_data:
-            # Handle stock update separately if needed
-            return update_stock(product_id, product_data['quantity_in_stock'])
-
-        if not fields_to_update:
-            logging.error("No fields provided to update for product")
+        if not fields_to_update and 'quantity_in_stock' not in product_data:
+            logger.error("No fields provided to update for product")
             return {'status': 'fail', 'message': 'No fields to update'}
 
-        params.append(product_id)
+        if fields_to_update:
+            params.append(product_id)
 
-        update_query = f"""
-            UPDATE products SET {', '.join(fields_to_update)} WHERE product_id = %s
-        """
-        logging.info(f"Executing query: {update_query} with params: {params}")
+            update_query = f"""
+                UPDATE products SET {', '.join(fields_to_update)} WHERE product_id = %s
+            """
+            logger.debug(f"Executing query: {update_query} with params: {params}")
+            cursor.execute(update_query, tuple(params))
+
+        if 'quantity_in_stock' in product_data:
+            cursor.execute("SELECT product_id FROM stock WHERE product_id = %s", (product_id,))
+            if cursor.fetchone():
+                set_stock_levels(connection, {product_id: product_data['quantity_in_stock']})
 
-        cursor.execute(update_query, tuple(params))
         connection.commit()
+        catalog_cache.invalidate()
 
-        return {'status': 'success' if cursor.rowcount > 0 else 'fail'}
+        return {'status': 'success'}
     except Exception as e:
-        logging.error(f"Error updating product {product_id}: {str(e)}")
+        logger.error(f"Error updating product {product_id}: {str(e)}")
         connection.rollback()
         return {'status': 'fail', 'message': str(e)}
     finally:
         cursor.close()
-        connection.close()
 
 
 def fetch_product_by_id(connection, product_id: int) -> Dict[str, str]:
     """Fetch a product by its ID."""
-    connection = get_sql_connection()
     cursor = connection.cursor()
     try:
-        query = """
-            SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, p.uom_id, u.uom_name, s.quantity_in_stock
+        query = f"""
+            SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, p.uom_id, u.uom_name, {BALANCE}
             FROM products p
             LEFT JOIN uom u ON p.uom_id = u.uom_id
             LEFT JOIN stock s ON p.product_id = s.product_id
@@ -175,94 +277,125 @@ def fetch_product_by_id(connection, product_id: int) -> Dict[str, str]:
             'quantity_in_stock': result[6] if result[6] is not None else 0
         }
     except Exception as e:
-        logging.error(f"Error fetching product by ID {product_id}: {str(e)}")
+        logger.error(f"Error fetching product by ID {product_id}: {str(e)}")
         return {'status': 'fail', 'message': str(e)}
     finally:
         cursor.close()
-        connection.close()
 
-def get_product_by_barcode(barcode: str) -> Dict[str, Union[str, int]]:
+def get_product_by_barcode(connection, barcode: str) -> Dict[str, Union[str, int]]:
     """Fetch a product by its barcode."""
-    connection = get_sql_connection()
-    cursor = connection.cursor()
-    try:
-        query = """
-            SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, u.uom_name, s.quantity_in_stock
-            FROM products p
-            LEFT JOIN uom u ON p.uom_id = u.uom_id
-            LEFT JOIN stock s ON p.product_id = s.product_id
-            WHERE p.barcode = %s
-        """
-        cursor.execute(query, (barcode,))
-        result = cursor.fetchone()
+    product = get_products_by_barcodes(connection, [barcode]).get(barcode)
+    if product is None:
+        return {'status': 'fail', 'message': 'Product not found'}
+    return product
 
-        if result is None:
-            return {'status': 'fail', 'message': 'Product not found'}
+def get_products_by_barcodes(connection, barcodes: List[str]) -> Dict[str, Union[Dict, None]]:
+    """Resolve a batch of barcodes through the in-memory barcode index.
 
-        return {
-            'product_id': result[0],
-            'product_name': result[1],
-            'price_per_unit': float(result[2]) if isinstance(result[2], decimal.Decimal) else result[2],
-            'barcode': result[3],
-            'uom_name': result[4] if result[4] is not None else 'N/A',
-            'quantity_in_stock': result[5] if result[5] is not None else 0
-        }
-    except Exception as e:
-        logging.error(f"Error fetching product by barcode {barcode}: {str(e)}")
-        return {'status': 'fail', 'message': str(e)}
-    finally:
-        cursor.close()
-        connection.close()
+    Unknown barcodes map to None. The index is built with the catalog, so a
+    cold cache costs one catalog load and every later scan is a dict lookup.
+    Database errors propagate, so an outage is never reported as "not found".
+    """
+    refresh_stale_stock(connection)
+    resolved = catalog_cache.lookup_barcodes(barcodes)
+    if resolved is None:
+        get_all_products(connection)
+        resolved = catalog_cache.lookup_barcodes(barcodes)
+    if resolved is None:
+        # A concurrent write invalidated the catalog while it was loading;
+        # answer this batch straight from the database.
+        resolved = _query_products_by_barcodes(connection, barcodes)
+    return resolved
+
+def _query_products_by_barcodes(connection, barcodes: List[str]) -> Dict[str, Union[Dict, None]]:
+    """Look barcodes up with a single IN query, bypassing the cache."""
+    resolved = {barcode: None for barcode in barcodes}
+    if not barcodes:
+        return resolved
+    # Repeating the last barcode pads the IN list to a prepared shape
+    params = list(resolved)
+    size = batch_size(len(params))
+    params += params[-1:] * (size - len(params))
+    rows, _ = execute_prepared(connection, barcodes_query(size), tuple(params))
+    for row in rows:
+        resolved[row[3]] = product_from_row(row)
+    return resolved
+
+def product_from_row(row) -> Dict[str, Union[str, int]]:
+    """Build the catalog representation of a products/uom/stock row."""
+    return {
+        'product_id': row[0],
+        'product_name': row[1],
+        'price_per_unit': float(row[2]) if isinstance(row[2], decimal.Decimal) else row[2],
+        'barcode': row[3],
+        'uom_name': row[4] if row[4] is not None else 'N/A',
+        'quantity_in_stock': row[5] if row[5] is not None else 0
+    }
+
+def refresh_stale_stock(connection) -> None:
+    """Re-read the stock of cached products whose stock changed since it was cached."""
+    marks = catalog_cache.stale_stock()
+    if marks:
+        catalog_cache.refresh_stock(marks, get_stock_levels(connection, list(marks)))
+
+def get_cached_products() -> Union[List[Dict[str, Union[str, int]]], None]:
+    """Return the cached catalog without touching the database, or None if it is cold."""
+    return catalog_cache.get_all()
 
 def get_all_products(connection) -> List[Dict[str, Union[str, int]]]:
-    """Fetch all products along with their stock and UOM details."""
+    """Fetch all products along with their stock and UOM details.
+
+    Served from the in-process catalog cache; the database is only queried
+    when the cache is cold or has been invalidated by a product write, and
+    for the stock levels changed since they were cached.
+    """
+    refresh_stale_stock(connection)
+    products = get_cached_products()
+    if products is not None:
+        return products
+
+    version = catalog_cache.begin_load()
+    cursor = None
     try:
         cursor = connection.cursor()
-        cursor.execute("""
-            SELECT p.product_id, p.product_name, p.price_per_unit, p.barcode, u.uom_name, s.quantity_in_stock
-            FROM products p
-            LEFT JOIN uom u ON p.uom_id = u.uom_id
-            LEFT JOIN stock s ON p.product_id = s.product_id
-        """)
-        products = []
-        for row in cursor.fetchall():
-            products.append({
-                'product_id': row[0],
-                'product_name': row[1],
-                'price_per_unit': float(row[2]) if isinstance(row[2], decimal.Decimal) else row[2],
-                'barcode': row[3],
-                'uom_name': row[4],
-                'quantity_in_stock': row[5] if row[5] is not None else 0
-            })
+        cursor.execute(CATALOG_QUERY)
+        products = [product_from_row(row) for row in cursor.fetchall()]
+        catalog_cache.install(version, products)
         return products
     except Exception as e:
-        logging.error(f"Error fetching all products: {str(e)}")
+        logger.error(f"Error fetching all products: {str(e)}")
         return []
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
 
 def get_product_price(connection, product_id: int) -> Union[float, None]:
     """Fetch the price of a product by its ID."""
-    connection = get_sql_connection()
-    cursor = connection.cursor()
     try:
-        query = "SELECT price_per_unit FROM products WHERE product_id = %s"
-        cursor.execute(query, (product_id,))
-        result = cursor.fetchone()
+        rows, _ = execute_prepared(connection, PRODUCT_PRICE_QUERY, (product_id,))
         
-        if result is None:
+        if not rows:
             return None  # or raise an exception if preferred
-        return float(result[0]) if isinstance(result[0], decimal.Decimal) else result[0]
+        return float(rows[0][0]) if isinstance(rows[0][0], decimal.Decimal) else rows[0][0]
         
     except Exception as e:
-        logging.error(f"Error fetching product price for ID {product_id}: {str(e)}")
+        logger.error(f"Error fetching product price for ID {product_id}: {str(e)}")
         return None  # or handle as needed
-    finally:
-        cursor.close()
-        connection.close()
+def get_product_prices(connection, product_ids: List[int]) -> Dict[int, float]:
+    """Fetch the prices of several products with a single query."""
+    if not product_ids:
+        return {}
+    params = list(product_ids)
+    size = batch_size(len(params))
+    params += params[-1:] * (size - len(params))
+    rows, _ = execute_prepared(connection, prices_query(size), tuple(params))
+    return {
+        row[0]: float(row[1]) if isinstance(row[1], decimal.Decimal) else row[1]
+        for row in rows
+    }
+
 def delete_product(connection, product_id: int) -> Dict[str, str]:
     """Delete a product by its ID."""
-    connection = get_sql_connection()  # Get the connection
     try:
         with connection.cursor() as cursor:
             # Delete the product from the products table
@@ -271,21 +404,20 @@ def delete_product(connection, product_id: int) -> Dict[str, str]:
             connection.commit()  # Commit the changes
             
             if cursor.rowcount > 0:
-                logging.info(f"Deleted product with ID: {product_id}")
+                catalog_cache.remove(product_id)
+                logger.info(f"Deleted product with ID: {product_id}")
                 return {'status': 'success', 'message': f'Product with ID {product_id} deleted successfully.'}
             else:
-                logging.warning(f"No product found with ID: {product_id}")
+                logger.warning(f"No product found with ID: {product_id}")
                 return {'status': 'fail', 'message': 'No product found with the given ID.'}
     
-    except mysql.connector.Error as db_err:
+    except DatabaseError as db_err:
         connection.rollback()  # Rollback in case of error
-        logging.error(f"Database error deleting product ID {product_id}: {str(db_err)}")
+        logger.error(f"Database error deleting product ID {product_id}: {str(db_err)}")
         return {'status': 'fail', 'message': 'Database error occurred'}
     
     except Exception as e:
         connection.rollback()  # Rollback in case of any other error
-        logging.error(f"General error deleting product ID {product_id}: {str(e)}")
+        logger.error(f"General error deleting product ID {product_id}: {str(e)}")
         return {'status': 'fail', 'message': str(e)}
-    
-    finally:
-        connection.close()  # Close the connection
+
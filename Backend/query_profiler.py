@@ -0,0 +1,185 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+
+import sql_connection
+
+logger = logging.getLogger(__name__)
+
+# Per-request SQL profiling and N+1 detection.
+#
+# Every statement run through a pooled connection is recorded with its
+# normalized shape (literals, placeholders and IN / VALUES / UNION lists
+# collapsed), duration and row count. A shape repeated N_PLUS_ONE_THRESHOLD
+# times or more within one request is flagged as a likely N+1 loop.
+#
+# In dev mode (QUERY_PROFILE=1, or an app running with debug=True) every
+# request is profiled: its report is logged, appended as a JSON line to
+# QUERY_PROFILE_FILE when set, and summarized in the X-Query-Count and
+# X-Query-Time-Ms response headers. Outside dev mode only query_budget()
+# blocks are recorded, e.g. in a test:
+#
+#   with query_budget(4, max_repeats=1):
+#       client.post('/insertOrder', json=order)
+
+QUERY_PROFILE = os.environ.get('QUERY_PROFILE', '0') == '1'
+QUERY_PROFILE_FILE = os.environ.get('QUERY_PROFILE_FILE')
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_PROFILE_N_PLUS_ONE', '3'))
+
+# Profiles collecting the statements of the current thread or task
+_active = contextvars.ContextVar('query_profiles', default=())
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES = re.compile(r'(\(\?\+?\))(?:\s*,\s*\(\?\+?\))+')
+_UNION = re.compile(r'(select (?:\? as \w+(?:, )?)+)(?: union all select (?:\? as \w+(?:, )?)+)+')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(statement) -> str:
+    """Reduce a statement to its shape, so the same query with other values compares equal."""
+    if isinstance(statement, (bytes, bytearray)):
+        statement = statement.decode('utf-8', 'replace')
+    shape = _SPACE.sub(' ', statement).strip().lower()
+    shape = _STRING.sub('?', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = _LIST.sub('(?+)', shape)
+    shape = _VALUES.sub(r'\1+', shape)
+    shape = _UNION.sub(r'\1 union all ...', shape)
+    return shape
+
+
+class QueryProfile:
+    """Statements recorded for one request or one query_budget() block."""
+
+    def __init__(self, label=None):
+        self.label = label
+        self.statements = []  # (shape, seconds, rowcount)
+
+    def record(self, statement, seconds, rowcount):
+        self.statements.append((normalize(statement), seconds, rowcount))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds, _ in self.statements)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Shapes executed at least `threshold` times, most frequent first."""
+        counts = Counter(shape for shape, _, _ in self.statements)
+        return [(shape, count) for shape, count in counts.most_common() if count >= threshold]
+
+    def report(self):
+        shapes = {}
+        for shape, seconds, rowcount in self.statements:
+            entry = shapes.setdefault(shape, {'statement': shape, 'count': 0, 'seconds': 0.0, 'rows': 0})
+            entry['count'] += 1
+            entry['seconds'] += seconds
+            entry['rows'] += max(rowcount, 0)
+        return {
+            'label': self.label,
+            'queries': self.count,
+            'seconds': round(self.seconds, 6),
+            'n_plus_one': [{'statement': shape, 'count': count} for shape, count in self.repeated()],
+            'statements': sorted(shapes.values(), key=lambda entry: entry['seconds'], reverse=True),
+        }
+
+
+def _on_query(statement, seconds, rowcount):
+    for profile in _active.get():
+        profile.record(statement, seconds, rowcount)
+
+
+def _push(profile):
+    sql_connection.add_query_listener(_on_query)
+    return _active.set(_active.get() + (profile,))
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by query_budget() when a block ran more statements than allowed."""
+
+
+@contextmanager
+def query_budget(max_queries, max_repeats=None, label=None):
+    """Assert that the block runs at most `max_queries` statements.
+
+    With `max_repeats`, also assert that no statement shape runs more often
+    than that, which catches per-item queries in loops. Yields the profile.
+    """
+    profile = QueryProfile(label)
+    token = _push(profile)
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+
+    problems = []
+    if profile.count > max_queries:
+        problems.append(f'{profile.count} queries, budget is {max_queries}')
+    if max_repeats is not None:
+        problems.extend(f'{count}x {shape}' for shape, count in profile.repeated(max_repeats + 1))
+    if problems:
+        details = '\n  '.join(f'{shape}' for shape, _, _ in profile.statements)
+        raise QueryBudgetExceeded(f"{label or 'Query budget'} exceeded: {'; '.join(problems)}\n"
+                                  f"Statements:\n  {details}")
+
+
+def assert_query_budget(client, method, path, max_queries, max_repeats=None, **request_kwargs):
+    """Call an endpoint through a Flask test client within a query budget; returns the response."""
+    with query_budget(max_queries, max_repeats, label=f'{method} {path}'):
+        return client.open(path, method=method, **request_kwargs)
+
+
+def _start_request():
+    if not (QUERY_PROFILE or current_app.debug):
+        return
+    g.query_profile = QueryProfile(f'{request.method} {request.path}')
+    _push(g.query_profile)
+
+
+def _add_headers(response):
+    profile = g.get('query_profile')
+    if profile is not None:
+        response.headers['X-Query-Count'] = str(profile.count)
+        response.headers['X-Query-Time-Ms'] = f'{profile.seconds * 1000:.1f}'
+    return response
+
+
+def _finish_request(exception):
+    profile = g.pop('query_profile', None)
+    if profile is None:
+        return
+    _active.set(tuple(active for active in _active.get() if active is not profile))
+    if not profile.count:
+        return
+
+    report = profile.report()
+    if report['n_plus_one']:
+        logger.warning(f"{profile.label}: {profile.count} queries, repeated statements: "
+                       + '; '.join(f"{entry['count']}x {entry['statement']}" for entry in report['n_plus_one']))
+    else:
+        logger.info(f"{profile.label}: {profile.count} queries in {profile.seconds * 1000:.1f} ms")
+    if QUERY_PROFILE_FILE:
+        report['time'] = time.time()
+        with open(QUERY_PROFILE_FILE, 'a', encoding='utf-8') as output:
+            output.write(json.dumps(report) + '\n')
+
+
+def init_app(app):
+    """Profile every request of the app while dev mode is on."""
+    app.before_request(_start_request)
+    app.after_request(_add_headers)
+    app.teardown_request(_finish_request)
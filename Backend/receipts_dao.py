@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+from catalog_cache import catalog_cache
+from products_dao import get_products_by_barcodes
+from storage import backend, DatabaseError, is_duplicate_key
+import stock_dao
+import stock_ledger
+
+logger = logging.getLogger(__name__)
+
+# Goods receipts: a whole delivery appended to the stock ledger as receipt
+# movements in one transaction. The receipt id is recorded with the resulting
+# stock levels and a hash of its lines in goods_receipts (migration 0006) in
+# the same transaction, so a retry of an applied receipt returns the stored
+# result and changes nothing, and a different delivery reusing its id is
+# refused. A delivery that only adds stock does not lock the stock
+# rows the tills are selling from; one with returns locks them to check that
+# no balance goes negative.
+
+MAX_RECEIPT_ID_LENGTH = 64
+
+
+class ReceiptConflictError(ValueError):
+    """Raised when a receipt id is reused with lines other than those it was applied with."""
+
+    def __init__(self, receipt_id: str):
+        self.receipt_id = receipt_id
+        super().__init__(f"Goods receipt {receipt_id} was already applied with different lines")
+
+
+def _stored_result(connection, receipt_id: str, lines_hash: str):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT result, lines_hash FROM goods_receipts WHERE receipt_id = %s", (receipt_id,))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    if row[1] != lines_hash:
+        raise ReceiptConflictError(receipt_id)
+    return json.loads(row[0])
+
+
+def _check_lines(lines: List[Dict]) -> None:
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('Lines are required and should be a non-empty list')
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict) or not isinstance(line.get('delta'), int) or isinstance(line['delta'], bool):
+            raise ValueError(f'Line {index + 1}: an integer delta is required')
+        if line.get('product_id') is None and not line.get('barcode'):
+            raise ValueError(f'Line {index + 1}: product_id or barcode is required')
+
+
+def receipt_lines_hash(lines: List[Dict]) -> str:
+    """SHA-256 of a receipt's normalized lines.
+
+    Deltas are summed per product id or barcode and sorted, so the order of
+    the lines and how a product's quantity is split over them do not matter.
+    """
+    totals = {}
+    for line in lines:
+        if line.get('product_id') is not None:
+            key = f"product_id:{int(line['product_id'])}"
+        else:
+            key = f"barcode:{str(line['barcode']).strip()}"
+        totals[key] = totals.get(key, 0) + line['delta']
+    return hashlib.sha256(json.dumps(sorted(totals.items())).encode()).hexdigest()
+
+
+def resolve_receipt_lines(connection, lines: List[Dict]) -> Dict[int, int]:
+    """Turn receipt lines into summed deltas per product ID.
+
+    Each line has a `product_id` or a `barcode`, and an integer `delta`
+    (negative for returns or corrections). Raises ValueError naming the
+    offending lines, unknown products and barcodes.
+    """
+    _check_lines(lines)
+    barcodes = [str(line['barcode']).strip() for line in lines if line.get('product_id') is None]
+
+    products = get_products_by_barcodes(connection, list(dict.fromkeys(barcodes))) if barcodes else {}
+    unknown_barcodes = [barcode for barcode, product in products.items() if product is None]
+    if unknown_barcodes:
+        raise ValueError(f"Unknown barcodes: {', '.join(unknown_barcodes)}")
+
+    deltas = {}
+    for line in lines:
+        if line.get('product_id') is not None:
+            product_id = int(line['product_id'])
+        else:
+            product_id = products[str(line['barcode']).strip()]['product_id']
+        deltas[product_id] = deltas.get(product_id, 0) + line['delta']
+    return deltas
+
+
+def apply_goods_receipt(connection, receipt_id: str, lines: List[Dict]) -> Dict:
+    """Apply a goods receipt once and return the resulting stock levels.
+
+    Returns {'receipt_id', 'replayed', 'levels'}; `replayed` is True when the
+    receipt had already been applied and its stored result is returned.
+    Raises ReceiptConflictError if it had been applied with other lines, and
+    ValueError for invalid lines or stock that would go negative.
+    """
+    if not receipt_id or len(receipt_id) > MAX_RECEIPT_ID_LENGTH:
+        raise ValueError(f'Receipt id is required (at most {MAX_RECEIPT_ID_LENGTH} characters)')
+    _check_lines(lines)
+    lines_hash = receipt_lines_hash(lines)
+
+    stored = _stored_result(connection, receipt_id, lines_hash)
+    if stored is not None:
+        return {'receipt_id': receipt_id, 'replayed': True, 'levels': stored}
+
+    deltas = resolve_receipt_lines(connection, lines)
+    placeholders = ', '.join(['%s'] * len(deltas))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT product_id FROM products WHERE product_id IN ({placeholders})", tuple(deltas))
+            missing = set(deltas) - {row[0] for row in cursor.fetchall()}
+            if missing:
+                raise ValueError(f"Unknown product ids: {', '.join(str(product_id) for product_id in sorted(missing))}")
+
+            cursor.execute(f"SELECT product_id FROM stock WHERE product_id IN ({placeholders})", tuple(deltas))
+            unstocked = sorted(set(deltas) - {row[0] for row in cursor.fetchall()})
+            if unstocked:
+                # Stock rows start at zero; the receipt movements are their balance
+                cursor.execute(
+                    backend.upsert('stock', ('product_id', 'quantity_in_stock'), ('product_id',),
+                                   rows=len(unstocked), add=('quantity_in_stock',)),
+                    tuple(value for product_id in unstocked for value in (product_id, 0)))
+
+            if any(delta < 0 for delta in deltas.values()):
+                balances = stock_dao.lock_stock_balances(connection, deltas)
+                negative = [product_id for product_id, delta in sorted(deltas.items())
+                            if balances.get(product_id, 0) + delta < 0]
+                if negative:
+                    raise ValueError(f"Stock would go negative for product ids: {', '.join(map(str, negative))}")
+
+            stock_dao.record_movements(connection, [(product_id, delta, stock_ledger.RECEIPT, None, receipt_id)
+                                                    for product_id, delta in sorted(deltas.items()) if delta])
+            levels = [{'product_id': product_id, 'quantity_in_stock': quantity}
+                      for product_id, quantity in sorted(stock_dao.get_stock_levels(connection, list(deltas)).items())]
+
+            cursor.execute("INSERT INTO goods_receipts (receipt_id, received_at, line_count, lines_hash, result) "
+                           "VALUES (%s, %s, %s, %s, %s)",
+                           (receipt_id, datetime.now(), len(lines), lines_hash, json.dumps(levels)))
+        connection.commit()
+    except DatabaseError as e:
+        connection.rollback()
+        if not is_duplicate_key(e):
+            raise
+        # A concurrent retry of the same receipt committed first
+        logger.info(f"Goods receipt {receipt_id} was applied concurrently; returning its result.")
+        return {'receipt_id': receipt_id, 'replayed': True, 'levels': _stored_result(connection, receipt_id, lines_hash)}
+    except Exception:
+        connection.rollback()
+        raise
+
+    catalog_cache.stock_changed(deltas)
+    logger.info(f"Applied goods receipt {receipt_id}: {len(lines)} lines, {len(deltas)} products.")
+    return {'receipt_id': receipt_id, 'replayed': False, 'levels': levels}
@@ -0,0 +1,168 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import products_dao
+import sales_dao
+
+logger = logging.getLogger(__name__)
+
+# Sales-velocity and reorder forecasting for every product at once.
+#
+# Daily sales per product are kept in a products x days NumPy matrix covering
+# the last HISTORY_DAYS days, filled from the daily_product_sales rollup (the
+# per-day sum of order_details.quantity by orders.datetime). The matrix is
+# refreshed incrementally: only days from the last loaded day onward are
+# re-read, so a refresh after new orders costs one small query. Velocities,
+# days of cover and reorder quantities are then computed with whole-matrix
+# operations instead of per-product Python loops.
+#
+# Past days only change when an order is deleted or the rollups are rebuilt.
+# This process hears of those through sales_dao.rewrite_listeners and re-reads
+# from the day affected. Other processes (another gunicorn worker, a
+# `python sales_dao.py rebuild`) cannot tell it, so the whole window is also
+# re-read every FULL_RELOAD_SECONDS.
+
+HISTORY_DAYS = 56
+FETCH_BATCH_SIZE = 5000
+SERVICE_LEVEL_Z = 1.65  # ~95% chance of not running out during the lead time
+FULL_RELOAD_SECONDS = float(os.environ.get('FORECAST_FULL_RELOAD_SECONDS', '600'))
+
+
+class ReorderForecaster:
+    def __init__(self, history_days: int = HISTORY_DAYS):
+        self.history_days = history_days
+        self._lock = threading.Lock()
+        self._sales = np.zeros((0, history_days))
+        self._row_of: Dict[int, int] = {}
+        self._last_day = None  # date of the matrix's last column
+        self._loaded_through = None  # earliest day that may still change
+        self._full_reload_at = 0.0  # time.monotonic() of the last whole-window read
+
+    def _row(self, product_id: int) -> int:
+        row = self._row_of.get(product_id)
+        if row is None:
+            row = len(self._row_of)
+            self._row_of[product_id] = row
+            if row >= self._sales.shape[0]:
+                grown = np.zeros((max(16, self._sales.shape[0] * 2), self.history_days))
+                grown[:self._sales.shape[0]] = self._sales
+                self._sales = grown
+        return row
+
+    def _advance_to(self, today: date) -> None:
+        """Shift the matrix so its last column is today."""
+        if self._last_day is None:
+            self._last_day = today
+            return
+        shift = (today - self._last_day).days
+        if shift <= 0:
+            return
+        if shift >= self.history_days:
+            self._sales[:] = 0
+        else:
+            self._sales[:, :-shift] = self._sales[:, shift:]
+            self._sales[:, -shift:] = 0
+        self._last_day = today
+
+    def invalidate(self, since: Optional[date] = None) -> None:
+        """Re-read the rollups from `since` (None: the whole window) on the next refresh."""
+        with self._lock:
+            if since is None or self._loaded_through is None:
+                self._loaded_through = None
+            else:
+                self._loaded_through = min(self._loaded_through, since)
+
+    def refresh(self, connection, today: date = None) -> None:
+        """Load rollup rows for the days not yet final into the matrix."""
+        today = today or date.today()
+        first_day = today - timedelta(days=self.history_days - 1)
+        with self._lock:
+            self._advance_to(today)
+            if time.monotonic() - self._full_reload_at >= FULL_RELOAD_SECONDS:
+                self._loaded_through = None
+            if self._loaded_through is None:
+                self._full_reload_at = time.monotonic()
+            since = max(first_day, self._loaded_through or first_day)
+            since_column = (since - first_day).days
+            self._sales[:, since_column:] = 0
+
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT product_id, sale_date, quantity FROM daily_product_sales "
+                               "WHERE sale_date BETWEEN %s AND %s", (since, today))
+                while True:
+                    rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                    if not rows:
+                        break
+                    product_rows = np.fromiter((self._row(row[0]) for row in rows), dtype=np.int64, count=len(rows))
+                    columns = np.fromiter(((row[1] - first_day).days for row in rows), dtype=np.int64, count=len(rows))
+                    quantities = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+                    self._sales[product_rows, columns] = quantities
+
+            # Today's rollup keeps growing; earlier days are final
+            self._loaded_through = today
+
+    def suggestions(self, stock_levels: Dict[int, float], lead_time_days: int, review_days: int,
+                    window_days: int) -> List[Dict]:
+        """Compute velocity, days of cover and reorder quantity for every product."""
+        with self._lock:
+            for product_id in stock_levels:
+                self._row(product_id)
+            product_ids = np.array(list(self._row_of), dtype=np.int64)
+            rows = np.array(list(self._row_of.values()), dtype=np.int64)
+            sales = self._sales[rows]
+
+        window_days = min(window_days, self.history_days)
+        recent = sales[:, -window_days:]
+        short = sales[:, -min(7, window_days):]
+        # Blend the long window with the last week so trends show up quickly
+        velocity = 0.5 * recent.mean(axis=1) + 0.5 * short.mean(axis=1)
+        deviation = recent.std(axis=1)
+
+        stock = np.array([stock_levels.get(int(product_id), 0) for product_id in product_ids], dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_of_cover = np.where(velocity > 0, stock / velocity, np.inf)
+
+        safety_stock = SERVICE_LEVEL_Z * deviation * math.sqrt(max(lead_time_days, 1))
+        target = velocity * (lead_time_days + review_days) + safety_stock
+        reorder = np.ceil(np.maximum(target - stock, 0))
+
+        order = np.argsort(days_of_cover, kind='stable')
+        return [{
+            'product_id': int(product_ids[index]),
+            'velocity_per_day': round(float(velocity[index]), 3),
+            'quantity_in_stock': float(stock[index]),
+            'days_of_cover': None if np.isinf(days_of_cover[index]) else round(float(days_of_cover[index]), 1),
+            'suggested_reorder_quantity': int(reorder[index])
+        } for index in order]
+
+
+forecaster = ReorderForecaster()
+sales_dao.rewrite_listeners.append(forecaster.invalidate)
+
+
+def get_reorder_suggestions(connection, lead_time_days: int = 3, review_days: int = 7,
+                            window_days: int = 28, include_all: bool = False) -> List[Dict]:
+    """Refresh the sales matrix and return reorder suggestions, most urgent first."""
+    forecaster.refresh(connection)
+    catalog = products_dao.get_all_products(connection)
+    stock_levels = {product['product_id']: product['quantity_in_stock'] for product in catalog}
+    names = {product['product_id']: product['product_name'] for product in catalog}
+
+    suggestions = forecaster.suggestions(stock_levels, lead_time_days, review_days, window_days)
+    result = []
+    for suggestion in suggestions:
+        if suggestion['product_id'] not in names:
+            continue  # deleted product that still has sales history
+        if not include_all and suggestion['suggested_reorder_quantity'] == 0:
+            continue
+        suggestion['product_name'] = names[suggestion['product_id']]
+        result.append(suggestion)
+    logger.debug(f"Computed {len(result)} reorder suggestions.")
+    return result
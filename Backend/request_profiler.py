@@ -0,0 +1,132 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+from logging_config import request_id_var
+
+logger = logging.getLogger(__name__)
+
+# Opt-in CPU profiling of single requests.
+#
+# A request is profiled end to end when it carries an X-Profile header equal
+# to PROFILE_TOKEN, or when it is picked by PROFILE_SAMPLE_RATE. Two files are
+# written to PROFILE_DIR per profiled request:
+#
+#   <name>.prof       cProfile statistics (python -m pstats, snakeviz, ...)
+#   <name>.collapsed  stacks sampled every PROFILE_INTERVAL_MS, in the collapsed
+#                     format of flamegraph.pl and speedscope
+#
+# With neither setting, init_app registers nothing and requests run untouched.
+# Python allows one active profiler per process, so concurrent requests are
+# not profiled while another one is.
+
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+
+_profiler_lock = threading.Lock()
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _wanted():
+    if PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _start_request():
+    if not _wanted() or not _profiler_lock.acquire(blocking=False):
+        return
+    try:
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        profiler = cProfile.Profile()
+        sampler.start()
+        profiler.enable()
+    except Exception as e:
+        _profiler_lock.release()
+        logger.warning(f"Could not start profiling {request.path}: {str(e)}")
+        return
+    g.request_profile = (profiler, sampler, time.time())
+
+
+def _add_header(response):
+    if 'request_profile' in g:
+        response.headers['X-Profile-Id'] = _profile_name(g.request_profile[2])
+    return response
+
+
+def _profile_name(started):
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(started))
+    endpoint = _UNSAFE.sub('_', request.endpoint or 'unmatched')
+    return f'{stamp}-{endpoint}-{request_id_var.get() or os.getpid()}'
+
+
+def _finish_request(exception):
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return
+    profiler, sampler, started = profile
+    try:
+        profiler.disable()
+        sampler.stop()
+    finally:
+        _profiler_lock.release()
+
+    name = _profile_name(started)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, name)
+        profiler.dump_stats(path + '.prof')
+        with open(path + '.collapsed', 'w', encoding='utf-8') as output:
+            output.write(sampler.collapsed())
+        logger.info(f"Profiled {request.method} {request.path} in {time.time() - started:.3f}s: {path}.prof")
+    except OSError as e:
+        logger.error(f"Could not save profile {name}: {str(e)}")
+
+
+def init_app(app):
+    """Register the profiling hooks, only if profiling can be triggered at all."""
+    if not PROFILE_TOKEN and PROFILE_SAMPLE_RATE <= 0:
+        return
+    app.before_request(_start_request)
+    app.after_request(_add_header)
+    app.teardown_request(_finish_request)
+    logger.info(f"Request profiling available (sample rate {PROFILE_SAMPLE_RATE}, output in {PROFILE_DIR}).")
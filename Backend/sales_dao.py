@@ -0,0 +1,262 @@
+import logging
+import os
+import sys
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from storage import backend, is_lock_conflict, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Daily sales rollups (daily_sales, daily_product_sales, daily_payment_sales).
+#
+# The rollups are updated inside the same transaction as the write they
+# summarize, so they are always consistent with orders and payments. The
+# build_* functions only build statements; the caller executes them on its
+# own cursor and owns the commit. /getSalesSummary answers from the rollups
+# alone, so its cost depends on the date range, not on the order history.
+#
+# Every order of a day would lock that day's daily_sales row until it
+# commits, so orders append their change to daily_sales_deltas instead
+# (Database/migrations/0007), which takes no lock other orders wait for.
+# fold_daily_sales() adds the deltas into daily_sales and deletes them; the
+# stock compactor runs it (see stock_ledger.py), and readers add the deltas
+# not folded yet. The other rollups are still upserted, last in the
+# transaction: a daily_product_sales row is only locked by orders that
+# already hold the same product's stock row, and a daily_payment_sales row
+# serializes the payments of one mode while they commit.
+
+FOLD_BATCH_SIZE = int(os.environ.get('SALES_FOLD_BATCH_SIZE', '5000'))  # deltas per transaction
+
+Statement = Tuple[str, tuple]
+
+# Called with the earliest sale date whose rollups changed after the fact
+# (None: every date), so in-process readers of past days (reorder_forecast)
+# re-read them. Writes for the current day need no notification.
+rewrite_listeners: List[Callable[[Optional[date]], None]] = []
+
+
+def rollups_rewritten(since: Optional[date] = None) -> None:
+    for listener in rewrite_listeners:
+        listener(since)
+
+
+def build_order_rollup(sale_date: date, order_total: float, quantities: Dict[int, float],
+                       prices: Dict[int, float], sign: int = 1) -> List[Statement]:
+    """Statements adding (sign=1) or removing (sign=-1) an order from the rollups."""
+    items_sold = sum(quantities.values())
+    statements = [(
+        "INSERT INTO daily_sales_deltas (sale_date, order_count, items_sold, revenue) VALUES (%s, %s, %s, %s)",
+        (sale_date, sign, sign * items_sold, sign * order_total)
+    )]
+    if quantities:
+        params = []
+        for product_id, quantity in quantities.items():
+            params.extend((sale_date, product_id, sign * quantity, sign * prices[product_id] * quantity))
+        statements.append((
+            backend.upsert('daily_product_sales', ('sale_date', 'product_id', 'quantity', 'revenue'),
+                           ('sale_date', 'product_id'), rows=len(quantities), add=('quantity', 'revenue')),
+            tuple(params)
+        ))
+    return statements
+
+
+def build_payment_rollup(payment_id: str) -> Statement:
+    """Statement adding a payment that just became 'Paid' to the payment-mode rollup."""
+    return (
+        backend.upsert('daily_payment_sales', ('sale_date', 'payment_mode', 'payment_count', 'amount'),
+                       ('sale_date', 'payment_mode'), add=('payment_count', 'amount'),
+                       select="SELECT DATE(date_and_time), payment_mode, 1, COALESCE(grand_total, 0) "
+                              "FROM payments WHERE payment_id = %s"),
+        (payment_id,)
+    )
+
+
+def build_order_payments_rollup(order_id: int, sign: int = -1) -> Statement:
+    """Statement removing (sign=-1) an order's 'Paid' payments from the payment-mode rollup."""
+    return (
+        backend.upsert('daily_payment_sales', ('sale_date', 'payment_mode', 'payment_count', 'amount'),
+                       ('sale_date', 'payment_mode'), add=('payment_count', 'amount'),
+                       select="SELECT DATE(date_and_time), payment_mode, %s * COUNT(*), "
+                              "%s * COALESCE(SUM(grand_total), 0) FROM payments "
+                              "WHERE order_id = %s AND payment_status = 'Paid' "
+                              "GROUP BY DATE(date_and_time), payment_mode"),
+        (sign, sign, order_id)
+    )
+
+
+def apply_statements(cursor, statements: List[Statement]) -> None:
+    for query, params in statements:
+        cursor.execute(query, params)
+
+
+def fold_daily_sales(connection, batch_size: int = FOLD_BATCH_SIZE) -> int:
+    """Add the daily_sales_deltas into daily_sales and delete them; returns the number folded.
+
+    Like stock_ledger.compact, a batch that another run folded first, or that
+    loses a lock race, is rolled back and left for the next run.
+    """
+    folded = 0
+    while True:
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute("SELECT delta_id, sale_date, order_count, items_sold, revenue FROM daily_sales_deltas "
+                               "ORDER BY delta_id LIMIT %s", (batch_size,))
+                deltas = cursor.fetchall()
+                if not deltas:
+                    connection.commit()
+                    return folded
+                days = {}
+                for _, sale_date, order_count, items_sold, revenue in deltas:
+                    day = days.setdefault(sale_date, [0, 0, 0])
+                    day[0] += order_count
+                    day[1] += items_sold
+                    day[2] += revenue
+                cursor.execute(
+                    backend.upsert('daily_sales', ('sale_date', 'order_count', 'items_sold', 'revenue'), ('sale_date',),
+                                   rows=len(days), add=('order_count', 'items_sold', 'revenue')),
+                    tuple(value for sale_date, day in sorted(days.items()) for value in (sale_date, *day)))
+                delta_ids = [row[0] for row in deltas]
+                deleted = 0
+                for start in range(0, len(delta_ids), 1000):
+                    chunk = delta_ids[start:start + 1000]
+                    cursor.execute(f"DELETE FROM daily_sales_deltas WHERE delta_id IN ({', '.join(['%s'] * len(chunk))})",
+                                   tuple(chunk))
+                    deleted += cursor.rowcount
+                if deleted != len(delta_ids):
+                    # Another run folded some of them after this snapshot
+                    connection.rollback()
+                    logger.info(f"Daily sales fold raced another run; {folded} deltas folded.")
+                    return folded
+                connection.commit()
+            except DatabaseError as e:
+                connection.rollback()
+                if not is_lock_conflict(e):
+                    raise
+                logger.info(f"Daily sales fold yielded to a lock conflict ({e}); {folded} deltas folded.")
+                return folded
+        folded += len(deltas)
+
+
+def rebuild_rollups(connection) -> None:
+    """Recompute every rollup from orders, order_details and payments in one transaction."""
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("DELETE FROM daily_sales")
+            cursor.execute("DELETE FROM daily_sales_deltas")
+            cursor.execute("DELETE FROM daily_product_sales")
+            cursor.execute("DELETE FROM daily_payment_sales")
+            cursor.execute("""
+                INSERT INTO daily_sales (sale_date, order_count, items_sold, revenue)
+                SELECT DATE(o.datetime), COUNT(*), COALESCE(SUM(d.items), 0), SUM(o.total)
+                FROM orders o
+                LEFT JOIN (SELECT order_id, SUM(quantity) AS items FROM order_details GROUP BY order_id) d
+                    ON o.order_id = d.order_id
+                GROUP BY DATE(o.datetime)
+            """)
+            cursor.execute("""
+                INSERT INTO daily_product_sales (sale_date, product_id, quantity, revenue)
+                SELECT DATE(o.datetime), od.product_id, SUM(od.quantity), SUM(od.total_price)
+                FROM orders o
+                JOIN order_details od ON o.order_id = od.order_id
+                GROUP BY DATE(o.datetime), od.product_id
+            """)
+            cursor.execute("""
+                INSERT INTO daily_payment_sales (sale_date, payment_mode, payment_count, amount)
+                SELECT DATE(date_and_time), payment_mode, COUNT(*), COALESCE(SUM(grand_total), 0)
+                FROM payments
+                WHERE payment_status = 'Paid'
+                GROUP BY DATE(date_and_time), payment_mode
+            """)
+            connection.commit()
+            logger.info("Sales rollups rebuilt.")
+            rollups_rewritten()
+        except Exception as e:
+            connection.rollback()
+            logger.error(f"Error rebuilding sales rollups: {str(e)}")
+            raise
+
+
+# daily_sales plus the deltas not folded into it yet, in one statement so a
+# concurrent fold is never seen half done
+DAILY_SALES_QUERY = """
+    SELECT sale_date, SUM(order_count), SUM(items_sold), SUM(revenue)
+    FROM (SELECT sale_date, order_count, items_sold, revenue FROM daily_sales
+          WHERE sale_date BETWEEN %s AND %s
+          UNION ALL
+          SELECT sale_date, order_count, items_sold, revenue FROM daily_sales_deltas
+          WHERE sale_date BETWEEN %s AND %s) s
+    GROUP BY sale_date
+    ORDER BY sale_date
+"""
+
+
+def get_sales_summary(connection, date_from: date, date_to: date, top: int = 10) -> Dict:
+    """Summarize sales between date_from and date_to (both inclusive) from the rollups."""
+    with connection.cursor() as cursor:
+        cursor.execute(DAILY_SALES_QUERY, (date_from, date_to, date_from, date_to))
+        days = [{
+            'date': str(row[0]),
+            'order_count': int(row[1]),
+            'items_sold': row[2],
+            'revenue': round(row[3], 2)
+        } for row in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT s.product_id, p.product_name, SUM(s.quantity) AS quantity, SUM(s.revenue) AS revenue
+            FROM daily_product_sales s
+            LEFT JOIN products p ON s.product_id = p.product_id
+            WHERE s.sale_date BETWEEN %s AND %s
+            GROUP BY s.product_id, p.product_name
+            HAVING SUM(s.quantity) > 0
+            ORDER BY revenue DESC
+            LIMIT %s
+        """, (date_from, date_to, top))
+        top_products = [{
+            'product_id': row[0],
+            'product_name': row[1],
+            'quantity': row[2],
+            'revenue': round(row[3], 2)
+        } for row in cursor.fetchall()]
+
+        cursor.execute("SELECT payment_mode, SUM(payment_count), SUM(amount) FROM daily_payment_sales "
+                       "WHERE sale_date BETWEEN %s AND %s GROUP BY payment_mode", (date_from, date_to))
+        payment_modes = [{
+            'payment_mode': row[0],
+            'payment_count': int(row[1]),
+            'amount': float(row[2])
+        } for row in cursor.fetchall()]
+
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'totals': {
+            'order_count': sum(day['order_count'] for day in days),
+            'items_sold': sum(day['items_sold'] for day in days),
+            'revenue': round(sum(day['revenue'] for day in days), 2)
+        },
+        'days': days,
+        'top_products': top_products,
+        'payment_modes': payment_modes
+    }
+
+
+if __name__ == '__main__':
+    from sql_connection import get_sql_connection
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2 or sys.argv[1] not in ('rebuild', 'fold'):
+        print("Usage: python sales_dao.py rebuild\n       python sales_dao.py fold")
+        sys.exit(2)
+
+    connection = get_sql_connection()
+    try:
+        started = datetime.now()
+        if sys.argv[1] == 'rebuild':
+            rebuild_rollups(connection)
+            logger.info(f"Rebuild finished in {(datetime.now() - started).total_seconds():.1f}s")
+        else:
+            folded = fold_daily_sales(connection)
+            logger.info(f"Folded {folded} daily sales deltas in {(datetime.now() - started).total_seconds():.1f}s")
+    finally:
+        connection.close()
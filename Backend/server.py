@@ -1,45 +1,43 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS, cross_origin
-from sql_connection import get_sql_connection, close_sql_connection
+from db import get_db, close_db, db_rejection, open_stream_connection
+from sql_connection import PoolExhaustedError, pool_stats
+import admission
+from admission import admission_controller, RETRY_AFTER
 import products_dao
-from products_dao import get_product_price
 import orders_dao
-from orders_dao import insert_order
 import uom_dao
 import stock_dao
+import stock_ledger
+import sales_dao
+import reorder_forecast
+import product_import
+import receipts_dao
+import exports
+import metrics
+import query_profiler
+import request_profiler
 from payments_dao import PaymentsDAO
-import logging
-from logging.handlers import RotatingFileHandler
+from logging_config import setup_logging, request_id_var, logging_stats
+import csv
 import datetime
+import json
+import uuid
+
+setup_logging()
 app = Flask(__name__)
 
 # Enable CORS with specific settings
 CORS(app, resources={r"/*": {"origins": "*", "supports_credentials": True}})
 
-# Configure logging for better clarity and debugging
-# Configure logging
-# Create a logger for the Flask app
-logger = logging.getLogger('flask_app')
-logger.setLevel(logging.INFO)
-
-# Create handlers: one for the log file and one for the console
-file_handler = RotatingFileHandler('flask_app.log', maxBytes=10000, backupCount=1)  # Log to file (rotation enabled)
-console_handler = logging.StreamHandler()  # Log to console (VSCode terminal)
-
-# Create a logging format that matches typical Flask output
-formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
-
-# Apply formatter to both handlers
-file_handler.setFormatter(formatter)
-console_handler.setFormatter(formatter)
+# Opt-in CPU profiles of single requests (X-Profile header or sampling); first
+# so that it covers the other hooks too
+request_profiler.init_app(app)
+# Per-route latency, status and database metrics, served on /metrics
+metrics.init_app(app)
+# Per-request SQL report and N+1 warnings when QUERY_PROFILE=1 or in debug mode
+query_profiler.init_app(app)
 
-# Add both handlers to the logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-
-# Set logger to propagate messages to Flask's default logger (for consistency)
-app.logger.handlers = logger.handlers
-app.logger.setLevel(logging.INFO)
 # Helper function for error responses
 def error_response(message, status_code=500):
     """Create a JSON error response."""
@@ -52,19 +50,56 @@ def validate_fields(request_payload, required_fields):
             return error_response(f'{field.replace("_", " ").title()} is required', 400)
     return None
 
+def overloaded_response(error):
+    """503 telling the till to back off and retry."""
+    response = jsonify({"error": 'Database is busy, please retry shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(getattr(error, 'retry_after', RETRY_AFTER))
+    return response
+
+@app.errorhandler(PoolExhaustedError)
+def handle_overload(error):
+    """Answer with 503 instead of a stack trace when the database is saturated."""
+    app.logger.warning(f"Rejecting {request.path}: {str(error)}")
+    return overloaded_response(error)
+
 @app.before_request
-def before_request():
-    """Connect to the database before each request."""
-    app.config['db_connection'] = get_sql_connection()
-    app.logger.info("Database connection established.")
+def assign_request_id():
+    """Tag the request's log records with the caller's X-Request-ID, or a new id."""
+    request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex)
+
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
+
+@app.after_request
+def after_request(response):
+    """Report admission or pool rejections as 503 even if the handler masked them."""
+    rejection = db_rejection()
+    if rejection is not None and response.status_code != 503:
+        return overloaded_response(rejection)
+    return response
 
 @app.teardown_request
 def teardown_request(exception):
-    """Close the database connection after each request."""
-    connection = app.config.get('db_connection')
-    if connection:
-        connection.close()
-        app.logger.info("Database connection closed.")
+    """Return the request's database connection to the pool, if it used one."""
+    close_db(exception)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose request, database and pool metrics in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# GET Pool statistics
+@app.route('/getPoolStats', methods=['GET'])
+@cross_origin()
+def get_pool_stats():
+    """Report live connection pool occupancy and checkout wait statistics."""
+    stats = pool_stats()
+    stats['admission'] = admission_controller.stats()
+    stats['logging'] = logging_stats()
+    return jsonify(stats), 200
 
 # GET UOMs
 @app.route('/getUOMs', methods=['GET'])
@@ -72,7 +107,7 @@ def teardown_request(exception):
 def get_uoms():
     """Fetch all Units of Measurement (UOMs)."""
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         response = uom_dao.get_uoms(connection)
         return jsonify(response), 200
     except Exception as e:
@@ -89,23 +124,21 @@ def check_stock():
         if 'order_details' not in request_payload:
             return error_response('Order details are required to check stock', 400)
 
-        connection = app.config['db_connection']
-        stock_check_results = []
-        
-        added_products = set()
-        
+        requested = {}
         for item in request_payload['order_details']:
             product_id = item.get('product_id')
             quantity = item.get('quantity')
             
             if not product_id or quantity is None:
                 return error_response('Both product_id and quantity are required for stock checking', 400)
-            
-            if product_id in added_products:
-                continue
-            
-            added_products.add(product_id)
-            available_stock = stock_dao.get_stock_by_product_id(connection, product_id)
+            requested.setdefault(product_id, quantity)
+
+        # One query for every line instead of one per product
+        connection = get_db()
+        levels = stock_dao.get_stock_levels(connection, list(requested))
+        stock_check_results = []
+        for product_id, quantity in requested.items():
+            available_stock = levels.get(product_id)
             
             if available_stock is None:
                 stock_check_results.append({
@@ -135,48 +168,39 @@ def check_stock():
 @app.route('/getProducts', methods=['GET'])
 @cross_origin()
 def get_products():
-    connection = get_sql_connection()
-    if connection:
-        try:
-            products = products_dao.get_all_products(connection)  # Pass the connection here
-            return jsonify(products)  # Return the products as JSON
-        except Exception as e:
-            logging.error(f"Error retrieving products: {str(e)}")
-            return jsonify({'error': str(e)}), 500
-        finally:
-            close_sql_connection(connection)  # Close the connection
-    else:
-        return jsonify({'error': 'Failed to connect to database'}), 500
+    try:
+        # Lazy connection: a warm catalog cache answers without a pool checkout
+        connection = get_db()
+        products = products_dao.get_all_products(connection)  # Pass the connection here
+        return jsonify(products)  # Return the products as JSON
+    except Exception as e:
+        app.logger.error(f"Error retrieving products: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/getProduct/<int:product_id>', methods=['GET'])
 @cross_origin()
 def get_product_by_id(product_id):
     """Fetch a single product by its ID along with stock information."""
-    app.logger.info(f"Fetching product with ID: {product_id}")
 
     try:
-        with get_sql_connection() as connection:  # Use the context manager
-            if connection is None:
-                app.logger.error("Could not establish a database connection.")
-                return jsonify({'error': "Could not establish a database connection."}), 500
+        connection = get_db()
 
-            product = products_dao.fetch_product_by_id(connection, product_id)  # Call the renamed function
-            app.logger.info(f"Product fetched: {product}")
+        product = products_dao.fetch_product_by_id(connection, product_id)  # Call the renamed function
 
-            if product.get('status') == 'fail':
-                app.logger.warning(f"Product not found for ID: {product_id}")
-                return jsonify({'error': product['message']}), 404
-            else:
-                product_data = {
-                    'product_id': product['product_id'],
-                    'product_name': product['product_name'],
-                    'uom_id': product['uom_id'],
-                    'price_per_unit': product['price_per_unit'],
-                    'quantity_in_stock': product['quantity_in_stock'],
-                    'barcode': product['barcode'],
-                    'uom_name': product['uom_name']
-                }
-                return jsonify(product_data), 200
+        if product.get('status') == 'fail':
+            app.logger.warning(f"Product not found for ID: {product_id}")
+            return jsonify({'error': product['message']}), 404
+        else:
+            product_data = {
+                'product_id': product['product_id'],
+                'product_name': product['product_name'],
+                'uom_id': product['uom_id'],
+                'price_per_unit': product['price_per_unit'],
+                'quantity_in_stock': product['quantity_in_stock'],
+                'barcode': product['barcode'],
+                'uom_name': product['uom_name']
+            }
+            return jsonify(product_data), 200
     except Exception as e:
         app.logger.error(f"Error fetching product by ID {product_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -189,38 +213,19 @@ def get_product_by_id(product_id):
 def insert_order():
     try:
         request_payload = request.get_json()
-        app.logger.info(f"Received payload for order: {request_payload}")
 
         if 'order_details' not in request_payload or not isinstance(request_payload['order_details'], list):
             return error_response('Order details are required and should be a list', 400)
 
-        connection = app.config['db_connection']
+        connection = get_db()
         order_id = orders_dao.insert_order(connection, request_payload)
 
-        added_products = set()
-
-        for item in request_payload['order_details']:
-            product_id = item.get('product_id')
-            quantity = item.get('quantity')
-
-            # Get product price for the order
-            price = get_product_price(connection, product_id) 
-
-            if price is None:
-                app.logger.error(f"Product ID {product_id} not found.")
-                return error_response('Product not found', 400)
-
-            # Update stock if the product is valid
-            if product_id in added_products:
-                continue
-
-            added_products.add(product_id)
-
-            if product_id and quantity:
-                stock_dao.update_stock(connection, product_id, -quantity)
-
         return jsonify({'message': 'Order added successfully', 'order_id': order_id}), 201
 
+    except ValueError as e:
+        app.logger.warning(f"Rejected order: {str(e)}")
+        return error_response(str(e), 400)
+
     except Exception as e:
         app.logger.error(f"Error inserting order: {str(e)}")
         return error_response('An error occurred while inserting the order. Please check the details and try again.', 500)
@@ -238,23 +243,17 @@ def update_product(product_id):
         return validation_error
 
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         
         # Check if the product exists
         product = products_dao.fetch_product_by_id(connection, product_id)
-        if not product:
+        if product.get('status') == 'fail':
             return error_response('Product not found', 404)
 
-        # Update the product
-        update_result = products_dao.update_product(product_id, request_payload)
-        request_payload = request.get_json()
-        app.logger.info(f"Received payload: {request_payload}")
+        # Update the product, including its stock level if provided
+        update_result = products_dao.update_product(connection, product_id, request_payload)
 
-        
         if update_result['status'] == 'success':
-            # Update the stock if quantity_in_stock is provided
-            if 'quantity_in_stock' in request_payload:
-                stock_dao.update_stock(connection, product_id, request_payload['quantity_in_stock'])
             return jsonify({'message': 'Product updated successfully'}), 200
         else:
             return error_response(update_result['message'], 400)
@@ -262,8 +261,6 @@ def update_product(product_id):
     except Exception as e:
         app.logger.error(f"Error updating product ID {product_id}: {str(e)}")
         return error_response('An error occurred while updating the product. Please try again.', 500)
-    finally:
-        connection.close()  # Ensure the connection is closed
 
 
 # DELETE Product
@@ -272,25 +269,23 @@ def update_product(product_id):
 def delete_product(product_id):
     """Delete a product by ID along with its stock information."""
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         
-        deleted_id = products_dao.delete_product(connection, product_id)
+        result = products_dao.delete_product(connection, product_id)
         
-        if deleted_id:
+        if result['status'] == 'success':
             stock_deleted = stock_dao.delete_stock_by_product_id(connection, product_id)
             
             if stock_deleted:
-                return jsonify({'message': f'Product with ID {deleted_id} and its stock deleted successfully'}), 200
+                return jsonify({'message': f'Product with ID {product_id} and its stock deleted successfully'}), 200
             else:
                 app.logger.warning(f'No stock found for product ID {product_id}.')
-                return jsonify({'message': f'Product with ID {deleted_id} deleted, but no associated stock found.'}), 200
+                return jsonify({'message': f'Product with ID {product_id} deleted, but no associated stock found.'}), 200
         
         return jsonify({'error': 'Product not found'}), 404
     except Exception as e:
         app.logger.error(f"Error deleting product ID {product_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        connection.close()  # Ensure the connection is closed
 
 
 # GET Stock
@@ -299,7 +294,7 @@ def delete_product(product_id):
 def get_stock():
     """Fetch current stock information."""
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         stock_data = stock_dao.get_stock(connection)
         return jsonify(stock_data), 200
     except Exception as e:
@@ -317,11 +312,11 @@ def update_stock(product_id):
         return error_response('Quantity in stock is required to update', 400)
 
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         
         updated = stock_dao.update_stock(connection, product_id, request_payload['quantity_in_stock'])
         
-        if updated:
+        if updated['status'] == 'success':
             return jsonify({'message': 'Stock updated successfully'}), 200
         else:
             return error_response('Failed to update stock, product may not exist', 404)
@@ -330,23 +325,69 @@ def update_stock(product_id):
         app.logger.error(f"Error updating stock for product ID {product_id}: {str(e)}")
         return error_response('An error occurred while updating the stock. Please try again.', 500)
 
+@app.route('/getStockMovements/<int:product_id>', methods=['GET'])
+@cross_origin()
+def get_stock_movements(product_id):
+    """A product's stock ledger, newest first; page with ?before=<movement_id>."""
+    try:
+        limit = parse_int_arg('limit', 100)
+        before = parse_int_arg('before')
+    except ValueError as e:
+        return error_response(str(e), 400)
+    if not 1 <= limit <= 1000:
+        return error_response('limit must be between 1 and 1000', 400)
+    try:
+        connection = get_db()
+        movements = stock_ledger.get_movements(connection, product_id, limit, before)
+        return jsonify(movements), 200
+    except Exception as e:
+        app.logger.error(f"Error fetching stock movements for product ID {product_id}: {str(e)}")
+        return error_response(str(e))
+
+@app.route('/goodsReceipt', methods=['POST'])
+@cross_origin()
+def goods_receipt():
+    """Apply a delivery's stock changes in one transaction.
+
+    Body: {"receipt_id": "...", "lines": [{"product_id" or "barcode", "delta"}]}.
+    Retrying with the same receipt_id returns the first result unchanged;
+    reusing it with different lines is refused with 409.
+    """
+    request_payload = request.get_json(silent=True) or {}
+    validation_error = validate_fields(request_payload, ['receipt_id', 'lines'])
+    if validation_error:
+        return validation_error
+
+    try:
+        connection = get_db()
+        result = receipts_dao.apply_goods_receipt(connection, str(request_payload['receipt_id']),
+                                                  request_payload['lines'])
+        return jsonify(result), 200 if result['replayed'] else 201
+    except receipts_dao.ReceiptConflictError as e:
+        return error_response(str(e), 409)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    except Exception as e:
+        app.logger.error(f"Error applying goods receipt: {str(e)}")
+        return error_response('An error occurred while applying the goods receipt. Please try again.', 500)
+
 # GET Product by Barcode
 @app.route('/getProductByBarcode', methods=['GET'])
 @cross_origin()
 def get_product_by_barcode_route():
     """Get product details based on barcode."""
     try:
-        barcode = request.args.get('barcode')  # Get barcode from query parameters
+        barcode = request.args.get('barcode', '').strip()  # Get barcode from query parameters
         
         if not barcode:
             return error_response('Barcode is required', 400)
 
-        connection = app.config['db_connection']
+        connection = get_db()
 
         # Fetch product details based on the barcode
-        product = products_dao.get_product_by_barcode(barcode)
+        product = products_dao.get_product_by_barcode(connection, barcode)
         
-        if product:
+        if product.get('status') != 'fail':
             return jsonify(product), 200
         else:
             return error_response('Product not found for the given barcode', 404)
@@ -354,19 +395,212 @@ def get_product_by_barcode_route():
     except Exception as e:
         app.logger.error(f"Error fetching product by barcode: {str(e)}")
         return error_response('An error occurred while fetching product details. Please try again.', 500)
+
+# GET Products by Barcodes (batch)
+@app.route('/getProductsByBarcodes', methods=['POST'])
+@cross_origin()
+def get_products_by_barcodes_route():
+    """Resolve a basket of scanned barcodes in one round trip."""
+    try:
+        request_payload = request.get_json(silent=True) or {}
+        barcodes = request_payload.get('barcodes')
+
+        if not isinstance(barcodes, list) or not barcodes:
+            return error_response('Barcodes are required and should be a non-empty list', 400)
+
+        # Preserve scan order while dropping duplicate scans of the same item
+        barcodes = list(dict.fromkeys(str(barcode).strip() for barcode in barcodes if str(barcode).strip()))
+
+        connection = get_db()
+        resolved = products_dao.get_products_by_barcodes(connection, barcodes)
+
+        return jsonify({
+            'products': {barcode: product for barcode, product in resolved.items() if product is not None},
+            'not_found': [barcode for barcode, product in resolved.items() if product is None]
+        }), 200
+
+    except Exception as e:
+        app.logger.error(f"Error fetching products by barcodes: {str(e)}")
+        return error_response('An error occurred while fetching product details. Please try again.', 500)
+
+def parse_int_arg(name, default=None):
+    """Parse an optional integer query argument; a malformed value raises ValueError."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}: {value}')
+
+def parse_date_arg(name, end_of_day=False):
+    """Parse an optional ISO date or datetime query argument.
+
+    A bare date used as an upper bound covers that whole day.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name} date: {value}')
+    if end_of_day and len(value) == 10:
+        parsed += datetime.timedelta(days=1)
+    return parsed
+
+MAX_ORDERS_PAGE_SIZE = 500
+
 @app.route('/getAllOrders', methods=['GET'])
 @cross_origin()
 def get_all_orders():
-    """Fetch all order information."""
+    """Stream order information, optionally filtered by date and paginated.
+
+    Query arguments: `from` / `to` (ISO dates, `to` inclusive for bare dates),
+    `limit` (page size) and `cursor` (the `next_cursor` of the previous page).
+    Without `limit` the response is a JSON array of every matching order;
+    with it, the response is `{"orders": [...], "next_cursor": ...}`.
+    """
     try:
-        connection = app.config['db_connection']  # Get the database connection
-        orders_data = orders_dao.get_all_orders(connection)  # Fetch orders using the DAO
-        
-        # Assuming orders_data is a list of dicts containing order_id and other fields
-        return jsonify(orders_data), 200  # Return the orders as JSON with a 200 status code
+        date_from = parse_date_arg('from')
+        date_to = parse_date_arg('to', end_of_day=True)
+        after = orders_dao.decode_orders_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = parse_int_arg('limit')
+        if limit is not None and not 0 < limit <= MAX_ORDERS_PAGE_SIZE:
+            raise ValueError(f'Limit must be between 1 and {MAX_ORDERS_PAGE_SIZE}')
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    # The body is generated after the request's teardown, so it owns its connection
+    connection = open_stream_connection()
+
+    def generate():
+        # Fetch one extra order to learn whether another page follows
+        orders = orders_dao.iter_orders(connection, date_from, date_to, after,
+                                        limit + 1 if limit is not None else None)
+        try:
+            yield '[' if limit is None else '{"orders": ['
+            last = None
+            for index, order in enumerate(orders):
+                if limit is not None and index == limit:
+                    break
+                yield (',' if index else '') + json.dumps(order, default=str)
+                last = order
+            else:
+                last = None
+            if limit is None:
+                yield ']'
+            else:
+                next_cursor = orders_dao.encode_orders_cursor(last) if last is not None else None
+                yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+        except Exception as e:
+            # Headers are already sent, so the only option left is to log
+            app.logger.error(f"Error streaming orders: {str(e)}")
+            raise
+        finally:
+            orders.close()
+            connection.release()
+
+    response = Response(stream_with_context(generate()), status=200, mimetype='application/json')
+    # A body that is never iterated (client gone) does not run generate()'s finally
+    response.call_on_close(connection.release)
+    return response
+
+
+@app.route('/export/<dataset>', methods=['GET'])
+@cross_origin()
+def export_dataset(dataset):
+    """Stream `orders`, `stock` or `products` as CSV, NDJSON or Parquet.
+
+    Query arguments: `format` (csv, ndjson or parquet; default csv) and, for
+    orders, `from` / `to` like /getAllOrders.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        exports.check_export(dataset, fmt)
+        date_from = parse_date_arg('from')
+        date_to = parse_date_arg('to', end_of_day=True)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    # The body is generated after the request's teardown, so it owns its
+    # connection and opens the snapshot itself, right before the first row
+    connection = open_stream_connection()
+
+    def generate():
+        chunks = None
+        try:
+            exports.begin_snapshot(connection)
+            chunks = exports.stream_export(connection, dataset, fmt, date_from, date_to)
+            yield from chunks
+        except Exception as e:
+            # Headers are already sent, so the only option left is to log
+            app.logger.error(f"Error exporting {dataset}: {str(e)}")
+            raise
+        finally:
+            if chunks is not None:
+                chunks.close()
+            connection.release()
+
+    response = Response(stream_with_context(generate()), status=200, mimetype=exports.MIMETYPES[fmt])
+    # A body that is never iterated (client gone) does not run generate()'s finally
+    response.call_on_close(connection.release)
+    response.headers['Content-Disposition'] = f'attachment; filename={dataset}.{fmt}'
+    return response
+
+
+@app.route('/getSalesSummary', methods=['GET'])
+@cross_origin()
+def get_sales_summary():
+    """Summarize sales per day, top products and payment modes from the rollups.
+
+    Query arguments: `from` / `to` (ISO dates, inclusive, default: the last 30
+    days) and `top` (number of top-selling products, default 10).
+    """
+    try:
+        date_to = datetime.date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.date.today()
+        date_from = (datetime.date.fromisoformat(request.args['from']) if request.args.get('from')
+                     else date_to - datetime.timedelta(days=29))
+        top = parse_int_arg('top', 10)
+        if date_from > date_to or not 0 < top <= 100:
+            raise ValueError('Invalid date range or top count')
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    try:
+        connection = get_db()
+        return jsonify(sales_dao.get_sales_summary(connection, date_from, date_to, top)), 200
     except Exception as e:
-        app.logger.error(f"Error fetching orders: {str(e)}")  # Log the error
-        return error_response(str(e))  # Return an error response
+        app.logger.error(f"Error fetching sales summary: {str(e)}")
+        return error_response('An error occurred while fetching the sales summary.', 500)
+
+
+@app.route('/getReorderSuggestions', methods=['GET'])
+@cross_origin()
+def get_reorder_suggestions():
+    """Suggest reorder quantities from recent sales velocity, most urgent first.
+
+    Query arguments: `lead_time` (days until a reorder arrives, default 3),
+    `review` (days until the next reorder check, default 7), `window` (days of
+    sales history to average, default 28) and `all` (1 to include products
+    that need no reorder).
+    """
+    try:
+        lead_time = parse_int_arg('lead_time', 3)
+        review = parse_int_arg('review', 7)
+        window = parse_int_arg('window', 28)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    include_all = request.args.get('all') == '1'
+    if lead_time < 0 or review < 0 or not 0 < window <= reorder_forecast.HISTORY_DAYS:
+        return error_response(f'Invalid lead time, review period or window (max {reorder_forecast.HISTORY_DAYS} days)', 400)
+
+    try:
+        connection = get_db()
+        return jsonify(reorder_forecast.get_reorder_suggestions(connection, lead_time, review, window, include_all)), 200
+    except Exception as e:
+        app.logger.error(f"Error computing reorder suggestions: {str(e)}")
+        return error_response('An error occurred while computing reorder suggestions.', 500)
 
 
 #insert product
@@ -375,7 +609,6 @@ def get_all_orders():
 def insert_product():
     """Insert a new product along with its stock."""
     request_payload = request.get_json()
-    app.logger.info(f"Received payload for insert product: {request_payload}")
 
     # Validate required fields
     required_fields = ['product_name', 'uom_id', 'price_per_unit', 'quantity_in_stock']
@@ -384,13 +617,13 @@ def insert_product():
         return validation_error
 
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
 
-        # Insert the product into the products table
-        product_id = products_dao.insert_product(connection, request_payload)
-
-        # Update the stock table with the initial quantity
-        stock_dao.update_stock(connection, product_id, request_payload['quantity_in_stock'])
+        # Insert the product and its stock in one transaction
+        result = products_dao.insert_product(connection, request_payload)
+        if result['status'] != 'success':
+            return error_response(result['message'], 400)
+        product_id = result['product_id']
 
         return jsonify({'message': 'Product inserted successfully', 'product_id': product_id}), 201
 
@@ -398,15 +631,38 @@ def insert_product():
         app.logger.error(f"Error inserting product: {str(e)}")
         return error_response('An error occurred while inserting the product. Please try again.', 500)
 
-    finally:
-        connection.close()  # Ensure the connection is closed
+
+@app.route('/importProducts', methods=['POST'])
+@cross_origin()
+def import_products():
+    """Bulk insert or update products from a CSV or NDJSON upload.
+
+    The body is streamed and upserted in chunks; CSV needs a header row. Columns
+    are those of /insertProduct plus an optional barcode. Rows that fail are
+    reported by line number and do not stop the rest of the import.
+    """
+    try:
+        fmt = product_import.detect_format(request.content_type, request.args.get('format'))
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    try:
+        connection = get_db()
+        summary = product_import.import_products(connection, request.stream, fmt)
+        return jsonify(summary), 200
+    except UnicodeDecodeError:
+        return error_response('Upload must be UTF-8 encoded', 400)
+    except csv.Error as e:
+        return error_response(f'Invalid CSV: {str(e)}', 400)
+    except Exception as e:
+        app.logger.error(f"Error importing products: {str(e)}")
+        return error_response('An error occurred while importing products.', 500)
 
 
 @app.route('/processPayment', methods=['POST'])
 @cross_origin()
 def process_payment():
     request_payload = request.get_json()
-    app.logger.info(f"Received payment payload: {request_payload}")
 
     # Validate required fields
     required_fields = ['payment_mode', 'order_id', 'customer_name', 'grandTotal', 'order_details']
@@ -418,17 +674,11 @@ def process_payment():
     order_id = request_payload['order_id']
     customer_name = request_payload['customer_name']
     grand_total = request_payload['grandTotal']
-    order_details = request_payload['order_details']
 
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         payments_dao = PaymentsDAO(connection)
 
-        app.logger.info(f"Processing payment for order ID: {order_id} with mode: {payment_mode}") 
-
-        # Log order details for reference
-        app.logger.info(f"Order details: {order_details}")
-
         if payment_mode.lower() == 'upi':
             success = validate_upi_payment(request_payload)
             if success:
@@ -466,7 +716,7 @@ def validate_upi_payment(request_payload):
 @cross_origin()
 def get_payment_details(payment_id):
     try:
-        connection = app.config['db_connection']
+        connection = get_db()
         payments_dao = PaymentsDAO(connection)
 
         payment_details = payments_dao.get_payment_details(payment_id)
@@ -480,6 +730,10 @@ def get_payment_details(payment_id):
         return error_response('An error occurred while retrieving payment details. Please try again.', 500)
 
 
+# A misspelt endpoint in ROUTE_CLASSES would silently fall back to read/write
+admission.check_route_classes(app.view_functions)
+
 
 if __name__ == '__main__':
+    stock_ledger.start_compactor()
     app.run(debug=True, port=3000)
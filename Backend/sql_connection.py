@@ -1,55 +1,420 @@
-import mysql.connector
-from mysql.connector import pooling
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from mysql.connector.errors import PoolError
 import logging
+from storage import backend, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Pool and credentials are configured from the environment so the pool can be
+# sized for the number of tills without code changes. DB_ENGINE picks MySQL or
+# an embedded SQLite file (see storage.py); the DB_* credentials only apply to
+# MySQL.
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': int(os.environ.get('DB_PORT', '3306')),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': os.environ.get('DB_PASSWORD', 'Result@2020'),
+    'database': os.environ.get('DB_NAME', 'sms'),
+}
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '10'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))  # seconds to wait for a free connection
+POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '3600'))  # seconds before a connection is recycled
+POOL_HEALTH_CHECK = os.environ.get('DB_POOL_HEALTH_CHECK', 'true').lower() in ('1', 'true', 'yes')
+# The fixed-shape lookups and stock updates on the scan and checkout paths run
+# as server-side prepared statements, parsed once per pooled connection and
+# kept with it across checkouts (set to false to compare against plain text).
+# Each connection keeps up to DB_PREPARED_CACHE_SIZE of them, least recently
+# used first out; the server caps the total at max_prepared_stmt_count.
+PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() in ('1', 'true', 'yes')
+PREPARED_CACHE_SIZE = int(os.environ.get('DB_PREPARED_CACHE_SIZE', '64'))
+# IN lists and multi-row statements are padded to one of these sizes, so a
+# basket of up to 64 lines needs at most seven shapes of each statement
+PREPARED_BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+
+# Upper bounds (in milliseconds) of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolExhaustedError(PoolError):
+    """Raised when no connection became free within the checkout timeout."""
+
+
+# Callbacks notified of every statement run through a pooled connection, as
+# fn(statement, seconds, rowcount), and of every checkout, as fn(wait_seconds). They run
+# on the calling thread and must be cheap; metrics.py registers its own.
+query_listeners = []
+checkout_listeners = []
+
+
+def add_query_listener(listener):
+    if listener not in query_listeners:
+        query_listeners.append(listener)
+
+
+def add_checkout_listener(listener):
+    if listener not in checkout_listeners:
+        checkout_listeners.append(listener)
+
+
+class TimedCursor:
+    """Cursor wrapper that reports each execute() to the query listeners."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def _timed(self, method, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            rowcount = getattr(self._cursor, 'rowcount', -1)
+            for listener in query_listeners:
+                listener(operation, elapsed, rowcount)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, *args, **kwargs)
+
+
+class StatementCache:
+    """Prepared statements of one database connection, keyed by statement text."""
+
+    def __init__(self, size):
+        self.size = size
+        self._cursors = OrderedDict()
+
+    def get(self, backend, cnx, statement):
+        """Return (cursor, statement, reused) for `statement`, preparing a cursor on a miss.
+
+        Execute the returned statement object rather than an equal string:
+        mysql.connector re-prepares whenever it is handed a different object.
+        """
+        entry = self._cursors.get(statement)
+        if entry is not None:
+            self._cursors.move_to_end(statement)
+            return entry + (True,)
+        if len(self._cursors) >= self.size:
+            self.discard(next(iter(self._cursors)))
+        entry = self._cursors[statement] = (backend.prepared_cursor(cnx), statement)
+        return entry + (False,)
+
+    def discard(self, statement):
+        """Deallocate the prepared statement, e.g. after it failed mid-result."""
+        entry = self._cursors.pop(statement, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except DatabaseError as err:
+                logger.debug(f"Error closing prepared statement: {err}")
+
+
+class PooledConnection:
+    """A checked-out connection; close() hands it back to the pool."""
+
+    def __init__(self, pool, cnx, opened_at, session, statements, wait_seconds):
+        self._pool = pool
+        self._cnx = cnx
+        self._opened_at = opened_at
+        # Session variables already applied to the underlying connection;
+        # kept with it across checkouts so unchanged settings cost nothing.
+        self._session = session
+        # Its prepared statements, likewise
+        self._statements = statements
+        self.wait_seconds = wait_seconds
+
+    def __getattr__(self, name):
+        if self._cnx is None:
+            raise PoolError("Connection has already been returned to the pool.")
+        return getattr(self._cnx, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def cursor(self, *args, **kwargs):
+        if self._cnx is None:
+            raise PoolError("Connection has already been returned to the pool.")
+        cursor = self._cnx.cursor(*args, **kwargs)
+        return TimedCursor(cursor) if query_listeners else cursor
+
+    def set_statement_timeout(self, milliseconds):
+        """Cap the execution time of SELECT statements on this connection."""
+        if self._session.get('max_execution_time') == milliseconds:
+            return
+        self._pool.backend.set_statement_timeout(self._cnx, milliseconds)
+        self._session['max_execution_time'] = milliseconds
+
+    def execute_prepared(self, statement, params=()):
+        """Run `statement` as a prepared statement kept on this connection.
+
+        Returns (rows, rowcount); rows is empty for statements other than
+        SELECT. See execute_prepared() below for connections outside the pool.
+        """
+        if self._cnx is None:
+            raise PoolError("Connection has already been returned to the pool.")
+        cursor, statement, reused = self._statements.get(self._pool.backend, self._cnx, statement)
+        self._pool._record_prepared(reused)
+        if query_listeners:
+            cursor = TimedCursor(cursor)
+        try:
+            cursor.execute(statement, params)
+            # Prepared cursors are unbuffered: read the result before anything
+            # else runs on the connection
+            rows = cursor.fetchall() if cursor.description else []
+            return rows, cursor.rowcount
+        except Exception:
+            self._statements.discard(statement)
+            raise
+
+    def close(self):
+        if self._cnx is not None:
+            cnx, self._cnx = self._cnx, None
+            self._pool._release(cnx, self._opened_at, self._session, self._statements)
+
+
+class ConnectionPool:
+    """Bounded connection pool with checkout timeouts and statistics.
+
+    Connections are opened lazily up to `size`. A checkout waits at most
+    `timeout` seconds for a free slot and then raises PoolExhaustedError.
+    Idle connections older than `max_age` are recycled, and with
+    `health_check` every borrowed connection is pinged before use.
+    """
+
+    def __init__(self, size, timeout, max_age, health_check, backend=backend, **connect_args):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.health_check = health_check
+        self._connect_args = connect_args
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._opened = 0
+        self._checkouts = 0
+        self._exhausted = 0
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._wait_sum = 0.0
+        self._prepared = 0
+        self._prepared_reused = 0
+
+    def get_connection(self, timeout=None):
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout if timeout is None else timeout):
+            with self._lock:
+                self._exhausted += 1
+            raise PoolExhaustedError(f"No connection available within {self.timeout}s "
+                                     f"({self.size} in use).")
+        waited = time.monotonic() - start
+        try:
+            cnx, opened_at, session, statements = self._take_idle() or self._open()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._record_wait(waited)
+        logger.debug("Connection checked out after %.1f ms; %s in use.", waited * 1000, self._in_use)
+        for listener in checkout_listeners:
+            listener(waited)
+        return PooledConnection(self, cnx, opened_at, session, statements, waited)
+
+    def _take_idle(self):
+        while True:
+            try:
+                cnx, opened_at, session, statements = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - opened_at > self.max_age:
+                self._discard(cnx)
+                continue
+            if self.health_check and not cnx.is_connected():
+                self._discard(cnx)
+                continue
+            return cnx, opened_at, session, statements
+
+    def _open(self):
+        cnx = self.backend.connect(**self._connect_args)
+        with self._lock:
+            self._opened += 1
+        return cnx, time.monotonic(), {}, StatementCache(PREPARED_CACHE_SIZE)
+
+    def _discard(self, cnx):
+        with self._lock:
+            self._opened -= 1
+        try:
+            cnx.close()
+        except DatabaseError as err:
+            logger.debug(f"Error closing recycled connection: {err}")
+
+    def _release(self, cnx, opened_at, session, statements):
+        try:
+            # Never hand the next request an open transaction or a stale
+            # REPEATABLE READ snapshot.
+            if cnx.in_transaction:
+                cnx.rollback()
+            self._idle.put((cnx, opened_at, session, statements))
+        except DatabaseError as err:
+            logger.warning(f"Dropping broken connection on release: {err}")
+            self._discard(cnx)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _record_wait(self, waited):
+        waited_ms = waited * 1000
+        self._wait_sum += waited
+        for index, bound in enumerate(WAIT_BUCKETS_MS):
+            if waited_ms <= bound:
+                self._wait_buckets[index] += 1
+                return
+        self._wait_buckets[-1] += 1
+
+    def _record_prepared(self, reused):
+        with self._lock:
+            if reused:
+                self._prepared_reused += 1
+            else:
+                self._prepared += 1
+
+    def close_idle(self):
+        """Close every idle connection, e.g. before forking worker processes."""
+        while True:
+            try:
+                cnx, _, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(cnx)
+
+    def stats(self):
+        """Return a snapshot of pool occupancy and checkout wait statistics."""
+        with self._lock:
+            cumulative = 0
+            histogram = {}
+            for bound, count in zip(WAIT_BUCKETS_MS + ('+Inf',), self._wait_buckets):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'opened': self._opened,
+                'checkouts': self._checkouts,
+                'exhausted': self._exhausted,
+                'wait_seconds_sum': round(self._wait_sum, 6),
+                'wait_ms_histogram': histogram,
+                'statements_prepared': self._prepared,
+                'statements_reused': self._prepared_reused,
+            }
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 
 # Define connection pool
 connection_pool = None
+_pool_lock = threading.Lock()
 
-try:
-    connection_pool = pooling.MySQLConnectionPool(
-        pool_name="mypool",
-        pool_size=10,  # Set pool size according to your needs
-        pool_reset_session=False,
-        host='localhost',
-        user='root',
-        password='Result@2020',
-        database='sms'
-    )
-    logging.info("Connection pool initialized successfully.")
-except mysql.connector.Error as err:
-    logging.error(f"Error initializing connection pool: {err.errno} - {err.sqlstate}: {err.msg}")
 
-def get_sql_connection():
-    """Get a connection from the connection pool."""
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
     global connection_pool
+    if connection_pool is None:
+        with _pool_lock:
+            if connection_pool is None:
+                connection_pool = ConnectionPool(POOL_SIZE, POOL_TIMEOUT, POOL_MAX_AGE,
+                                                 POOL_HEALTH_CHECK, **DB_CONFIG)
+                logger.info(f"Connection pool initialized ({backend.name}, size={POOL_SIZE}, "
+                            f"timeout={POOL_TIMEOUT}s).")
+    return connection_pool
+
+
+def reset_pool():
+    """Drop the current pool so the next checkout builds a fresh one."""
+    global connection_pool
+    with _pool_lock:
+        if connection_pool is not None:
+            connection_pool.close_idle()
+        connection_pool = None
+
+
+def pool_stats():
+    """Return live statistics of the connection pool."""
+    return get_pool().stats()
+
+
+def get_sql_connection():
+    """Get a connection from the connection pool.
+
+    Raises PoolExhaustedError if the pool stays saturated for longer than
+    DB_POOL_TIMEOUT, and a storage.DatabaseError if a connection can't be opened.
+    """
     try:
-        if connection_pool is None:
-            raise Exception("Connection pool not initialized.")
-        logging.info(f"Getting MySQL connection from pool. Active connections: {connection_pool._cnx_queue.qsize()}")
-        cnx = connection_pool.get_connection()
-        logging.info("Connection obtained.")
-        return cnx
-    except mysql.connector.Error as err:
-        logging.error(f"Error getting connection: {err.errno} - {err.sqlstate}: {err.msg}")
-        return None
-    except Exception as e:
-        logging.error(f"Error: {str(e)}")
-        return None
+        return get_pool().get_connection()
+    except PoolExhaustedError as err:
+        logger.warning(f"Connection pool exhausted: {err}")
+        raise
+    except DatabaseError as err:
+        logger.error(f"Error getting connection: {err}")
+        raise
+
+def batch_size(count):
+    """Number of values to prepare a statement over `count` IN-list values or rows for."""
+    for size in PREPARED_BATCH_SIZES:
+        if count <= size:
+            return size
+    return count
+
+
+def execute_prepared(connection, statement, params=()):
+    """Run `statement` as a prepared statement where the connection keeps them.
+
+    Pooled connections reuse one prepared statement per statement text; any
+    other connection, or DB_PREPARED_STATEMENTS=false, runs it as plain text.
+    Returns (rows, rowcount) as PooledConnection.execute_prepared() does.
+    """
+    execute = getattr(connection, 'execute_prepared', None) if PREPARED_STATEMENTS else None
+    if execute is not None:
+        return execute(statement, params)
+    with connection.cursor() as cursor:
+        cursor.execute(statement, params)
+        rows = cursor.fetchall() if cursor.description else []
+        return rows, cursor.rowcount
 
 def close_sql_connection(cnx):
     """Close the connection passed to the function."""
-    if cnx is not None and cnx.is_connected():
+    if cnx is not None:
         try:
             cnx.close()
-            logging.info("MySQL connection closed and returned to pool.")
-        except mysql.connector.Error as err:
-            logging.error(f"Error closing connection: {err.errno} - {err.sqlstate}: {err.msg}")
+            logger.debug("Connection closed and returned to pool.")
+        except DatabaseError as err:
+            logger.error(f"Error closing connection: {err}")
 
 # Usage example
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     connection = get_sql_connection()
     if connection:
         # Perform database operations here
@@ -58,5 +423,6 @@ if __name__ == "__main__":
         # cursor.execute("SELECT * FROM your_table")
         # result = cursor.fetchall()
         # cursor.close()
-        
+
         close_sql_connection(connection)
+        logger.info(f"Pool statistics: {pool_stats()}")
@@ -0,0 +1,203 @@
+import datetime
+import decimal
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# mysql.connector-style connection and cursor on top of sqlite3, so the DAO
+# modules run unchanged on an embedded SQLite file (DB_ENGINE=sqlite, see
+# storage.py).
+#
+# Statements keep their %s placeholders; they are rewritten to ? once per
+# distinct statement. The connection runs sqlite3 in autocommit mode and
+# manages transactions itself, the way InnoDB locks behave for this code:
+#
+#   - plain SELECTs outside a transaction read the latest committed data and
+#     never block writers (WAL mode)
+#   - the first write, or a SELECT ... FOR UPDATE, opens a BEGIN IMMEDIATE
+#     transaction that holds the database write lock until commit/rollback
+#   - start_transaction() opens a deferred, snapshot-consistent transaction
+#
+# Taking the write lock up front means a transaction never has to upgrade a
+# read snapshot to a writer, which SQLite refuses with SQLITE_BUSY as soon as
+# another writer committed in between. Waiting writers block for at most
+# SQLITE_BUSY_TIMEOUT milliseconds (default 5000).
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'Database', 'sqlite_schema.sql')
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'))
+
+# Row-level locks do not exist in SQLite; the write lock stands in for them
+_FOR_UPDATE = re.compile(r'\s+FOR\s+UPDATE\s*$', re.IGNORECASE)
+# %s outside of quoted literals and identifiers
+_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|%s")
+# Progress handler granularity, in SQLite virtual machine instructions
+_PROGRESS_STEPS = 10000
+
+READ, LOCKING_READ, WRITE = 'read', 'locking read', 'write'
+
+# Store and read back values the way MySQL's DATETIME(0), DATE and DECIMAL
+# columns do. Converters apply by declared column type (PARSE_DECLTYPES).
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' ', timespec='seconds'))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter('datetime', lambda value: datetime.datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('date', lambda value: datetime.date.fromisoformat(value.decode()))
+sqlite3.register_converter('decimal', lambda value: decimal.Decimal(value.decode()))
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+@functools.lru_cache(maxsize=1024)
+def translate(operation):
+    """Return the SQLite form of a %s-style statement and whether it reads, locks or writes."""
+    statement, locking = _FOR_UPDATE.subn('', operation.strip().rstrip(';'))
+    statement = _PLACEHOLDER.sub(lambda match: '?' if match.group(0) == '%s' else match.group(0), statement)
+    if locking:
+        return statement, LOCKING_READ
+    # The DAO modules never write through WITH ..., so a leading WITH is a read
+    keyword = statement.split(None, 1)[0].upper() if statement else ''
+    return statement, READ if keyword in ('SELECT', 'WITH', 'EXPLAIN', 'PRAGMA') else WRITE
+
+
+class SQLiteCursor:
+    """Cursor with the mysql.connector surface the DAO modules use."""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection._cnx.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, operation, params=()):
+        statement = self._connection._prepare(operation)
+        self._cursor.execute(statement, tuple(params or ()))
+        return None
+
+    def executemany(self, operation, seq_params):
+        statement = self._connection._prepare(operation)
+        self._cursor.executemany(statement, (tuple(params) for params in seq_params))
+        return None
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """A sqlite3 connection in WAL mode that answers like a mysql.connector connection."""
+
+    def __init__(self, path):
+        self.path = path
+        self._cnx = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None,
+                                    check_same_thread=False)
+        self._cnx.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        self._cnx.execute('PRAGMA journal_mode = WAL')
+        # Safe with WAL: a power cut may lose the last commits but never
+        # corrupts the file, and commits skip an fsync each
+        self._cnx.execute('PRAGMA synchronous = NORMAL')
+        self._cnx.execute('PRAGMA foreign_keys = ON')
+        self._statement_timeout = None
+        self._deadline = None
+        self._cnx.set_progress_handler(self._past_deadline, _PROGRESS_STEPS)
+
+    def _past_deadline(self):
+        # A non-zero return interrupts the running statement
+        return self._deadline is not None and time.monotonic() > self._deadline
+
+    def _prepare(self, operation):
+        statement, kind = translate(operation)
+        if kind != READ and not self._cnx.in_transaction:
+            self._cnx.execute('BEGIN IMMEDIATE')
+        # Like MySQL's max_execution_time, the limit only applies to SELECTs
+        self._deadline = (time.monotonic() + self._statement_timeout
+                          if self._statement_timeout and kind != WRITE else None)
+        return statement
+
+    def cursor(self, *args, **kwargs):
+        # buffered= and similar options have no SQLite equivalent: sqlite3
+        # cursors step through results lazily and never hold up the connection
+        return SQLiteCursor(self)
+
+    def start_transaction(self, consistent_snapshot=False, isolation_level=None, readonly=None):
+        self._cnx.execute('BEGIN')
+
+    @property
+    def in_transaction(self):
+        return self._cnx.in_transaction
+
+    def commit(self):
+        if self._cnx.in_transaction:
+            self._cnx.execute('COMMIT')
+
+    def rollback(self):
+        if self._cnx.in_transaction:
+            self._cnx.execute('ROLLBACK')
+
+    def consume_results(self):
+        """No-op: an abandoned sqlite3 cursor does not block the connection."""
+
+    def set_statement_timeout(self, milliseconds):
+        self._statement_timeout = milliseconds / 1000 if milliseconds else None
+
+    def is_connected(self):
+        try:
+            self._cnx.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self._cnx.close()
+
+
+def ensure_schema(path):
+    """Create any missing tables in the database file, once per process and file."""
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        with open(SCHEMA_FILE, encoding='utf-8') as schema:
+            script = schema.read()
+        cnx = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+        try:
+            cnx.executescript(script)
+        finally:
+            cnx.close()
+        _schema_ready.add(path)
+
+
+def connect(path):
+    """Open a connection to the SQLite database at `path`, creating its schema if needed."""
+    ensure_schema(path)
+    return SQLiteConnection(path)
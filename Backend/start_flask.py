@@ -1,8 +1,106 @@
-import subprocess
-import os
-
-# Set the environment for your Flask app
-os.environ['FLASK_APP'] = r"E:\\mini project new [Final Draft]\\mini project new\\backend\\server.py"  # Full path to server.py
-
-# Start the Flask server
-subprocess.run(["flask", "run", "--host=0.0.0.0", "--port=3000"])
+import logging
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+# Production entry point: serves server.app with a preforking gunicorn server.
+#
+#   python start_flask.py
+#
+# Tunables (environment):
+#   WEB_BIND              address to listen on (default 0.0.0.0:3000)
+#   WEB_WORKERS           worker processes (default: CPU core count)
+#   WEB_THREADS           request threads per worker (default 4)
+#   WEB_TIMEOUT           seconds before a stuck worker is restarted (default 30)
+#   WEB_GRACEFUL_TIMEOUT  seconds in-flight requests get on shutdown (default 30)
+#
+# Every worker gets its own connection pool, sized to its thread count unless
+# DB_POOL_SIZE is set, so WEB_WORKERS * DB_POOL_SIZE must stay below MySQL's
+# max_connections. Every worker also folds the stock ledger every
+# STOCK_COMPACTION_INTERVAL seconds (see stock_ledger.py); overlapping runs
+# wait on each other's row locks and find nothing left to fold.
+
+CPU_COUNT = multiprocessing.cpu_count()
+WORKERS = int(os.environ.get('WEB_WORKERS', str(CPU_COUNT)))
+THREADS = int(os.environ.get('WEB_THREADS', '4'))
+
+# Must be set before sql_connection is imported by the app
+os.environ.setdefault('DB_POOL_SIZE', str(THREADS))
+
+
+def warm_worker():
+    """Open the worker's connections and load its catalog cache before it serves."""
+    from sql_connection import get_sql_connection, pool_stats
+    import products_dao
+
+    connections = []
+    try:
+        for _ in range(min(THREADS, pool_stats()['size'])):
+            connections.append(get_sql_connection())
+        products_dao.get_all_products(connections[0])
+        logger.info(f"Worker {os.getpid()} warmed: {len(connections)} connections, catalog cached.")
+    except Exception as e:
+        # A cold worker still serves correctly, just slower on first requests
+        logger.warning(f"Worker {os.getpid()} warm-up incomplete: {str(e)}")
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def post_fork(server, worker):
+    # The log listener thread does not survive the fork; start the worker's own
+    from logging_config import setup_logging
+    setup_logging()
+    # Connections must never be shared across processes: start from an empty pool
+    from sql_connection import reset_pool
+    reset_pool()
+    warm_worker()
+    import stock_ledger
+    stock_ledger.start_compactor()
+
+
+def worker_exit(server, worker):
+    import stock_ledger
+    stock_ledger.stop_compactor()
+    from sql_connection import reset_pool
+    reset_pool()
+
+
+class GroceryStoreApplication(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from catalog_cache import catalog_cache
+        # Shared memory has to exist before the workers are forked
+        catalog_cache.enable_shared_generation()
+        from server import app
+        return app
+
+
+if __name__ == '__main__':
+    from logging_config import setup_logging
+    setup_logging()
+    options = {
+        'bind': os.environ.get('WEB_BIND', '0.0.0.0:3000'),
+        'workers': WORKERS,
+        'threads': THREADS,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': int(os.environ.get('WEB_TIMEOUT', '30')),
+        'graceful_timeout': int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30')),
+        'keepalive': 5,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+    }
+    logger.info(f"Starting {WORKERS} workers x {THREADS} threads on {options['bind']}")
+    GroceryStoreApplication(options).run()
@@ -1,8 +1,45 @@
+import functools
 import logging
-from typing import Dict, Optional, List
-from sql_connection import get_sql_connection  # Import the connection function
-import mysql.connector
-from mysql.connector import Error  # Import Error class
+import os
+import random
+import time
+from typing import Callable, Dict, Optional, List, TypeVar
+from catalog_cache import catalog_cache
+from sql_connection import batch_size, execute_prepared
+from storage import backend, is_lock_conflict, DatabaseError as Error
+import stock_ledger
+
+logger = logging.getLogger(__name__)
+
+# Stock changes are movements in the stock ledger (stock_ledger.py); the
+# balances read here are live, folded stock plus unfolded movements.
+#
+# Checkout reserves a basket's stock with reserve_stock(): it locks the
+# basket's stock rows in product_id order, checks their live balances and
+# records a sale movement per line, adding it to the row's withdrawn total.
+# Tills selling the same hot items queue on those rows in the same order
+# instead of deadlocking, and nothing is sold that another till took in the
+# meantime. A transaction that still loses a lock race (lock wait timeout,
+# deadlock victim, SQLite busy) is rolled back and run again by
+# retry_on_lock_conflict(), up to STOCK_RESERVATION_ATTEMPTS times with a
+# jittered, doubling backoff.
+RESERVATION_ATTEMPTS = int(os.environ.get('STOCK_RESERVATION_ATTEMPTS', '3'))
+RESERVATION_BACKOFF = float(os.environ.get('STOCK_RESERVATION_BACKOFF', '0.02'))  # seconds before the first retry
+
+T = TypeVar('T')
+
+STOCK_QUERY = f"SELECT {stock_ledger.BALANCE} FROM stock s WHERE s.product_id = %s"
+
+
+class InsufficientStockError(ValueError):
+    """Raised when a basket asks for more than is in stock."""
+
+    def __init__(self, shortages: Dict[int, Optional[float]]):
+        # product_id -> quantity available, None for products without stock
+        self.shortages = shortages
+        super().__init__("Insufficient stock")
+
+
 def get_initial_stock(uom_id: int) -> int:
     """Determine initial stock based on UOM ID."""
     stock_dict = {1: 80, 2: 50}
@@ -10,7 +47,7 @@ def get_initial_stock(uom_id: int) -> int:
 
 
 def insert_or_update_product_with_stock(connection, product_data: Dict, quantity_in_stock: int) -> bool:
-    logging.info("Attempting to insert or update product with data: %s", product_data)  # Log the incoming data
+    logger.debug("Inserting or updating product %r", product_data.get('product_name'))
 
     with connection.cursor() as cursor:
         
@@ -29,11 +66,11 @@ def insert_or_update_product_with_stock(connection, product_data: Dict, quantity
                 WHERE product_id = %s
                 """
                 cursor.execute(update_product_query, (product_data['price_per_unit'], product_id))
-                logging.info(f"Updated existing product ID: {product_id}")
+                logger.info(f"Updated existing product ID: {product_id}")
 
             else:
                 # Insert new product
-                logging.info("Inserting new product")
+                logger.info("Inserting new product")
                 insert_product_query = """
                 INSERT INTO products (product_name, price_per_unit, uom_id) 
                 VALUES (%s, %s, %s)
@@ -47,30 +84,31 @@ def insert_or_update_product_with_stock(connection, product_data: Dict, quantity
                 new_product_id = cursor.lastrowid
 
                 # Log confirmation of successful product insert
-                logging.info(f"Product inserted successfully. New product ID: {new_product_id}")
+                logger.info(f"Product inserted successfully. New product ID: {new_product_id}")
                 
                 if not new_product_id:
-                    logging.error("Product insertion failed, no product ID returned.")
+                    logger.error("Product insertion failed, no product ID returned.")
                     return False
 
             connection.commit()  # Commit changes
+            catalog_cache.invalidate()
             return True
 
-        except Error as e:  # Handle mysql.connector errors
+        except Error as e:  # Handle database errors
             connection.rollback()  # Rollback if there's a database error
-            logging.error(f"Database error while inserting or updating product and stock: {str(e)}")
+            logger.error(f"Database error while inserting or updating product and stock: {str(e)}")
             return False
         except Exception as e:
             connection.rollback()  # Rollback for any other error
-            logging.error(f"Unexpected error while inserting or updating product and stock: {str(e)}")
+            logger.error(f"Unexpected error while inserting or updating product and stock: {str(e)}")
             return False
 
 def get_product_with_stock_by_id(connection, product_id: int) -> Optional[Dict]:
     """Fetch product details along with stock by product ID."""
     cursor = connection.cursor()
     try:
-        query = """
-        SELECT p.product_id, p.product_name, p.price_per_unit, p.uom_id, s.quantity_in_stock
+        query = f"""
+        SELECT p.product_id, p.product_name, p.price_per_unit, p.uom_id, {stock_ledger.BALANCE}
         FROM products p
         LEFT JOIN stock s ON p.product_id = s.product_id
         WHERE p.product_id = %s
@@ -87,14 +125,14 @@ def get_product_with_stock_by_id(connection, product_id: int) -> Optional[Dict]:
                 'quantity_in_stock': result[4]
             }
         else:
-            logging.warning(f"No product found with ID {product_id}.")
+            logger.warning(f"No product found with ID {product_id}.")
             return None
 
     except Error as e:
-        logging.error(f"Database error while fetching product with ID {product_id}: {str(e)}")
+        logger.error(f"Database error while fetching product with ID {product_id}: {str(e)}")
         return None
     except Exception as e:
-        logging.error(f"Unexpected error while fetching product with ID {product_id}: {str(e)}")
+        logger.error(f"Unexpected error while fetching product with ID {product_id}: {str(e)}")
         return None
     finally:
         cursor.close()
@@ -107,40 +145,37 @@ def delete_stock_by_product_id(connection, product_id):
         delete_query = "DELETE FROM stock WHERE product_id = %s"
         cursor.execute(delete_query, (product_id,))
         connection.commit()
+        catalog_cache.stock_changed([product_id])
         return cursor.rowcount > 0  # Returns True if a row was deleted
     except Exception as e:
         connection.rollback()
-        logging.error(f"Error deleting stock for product ID {product_id}: {str(e)}")
+        logger.error(f"Error deleting stock for product ID {product_id}: {str(e)}")
         return False
     finally:
         cursor.close()
 
 
 def update_stock(connection, product_id: int, quantity: int) -> Dict[str, str]:
-    """Update the stock for a given product."""
+    """Add `quantity` (negative to remove) to a product's stock, as a correction in the ledger."""
     cursor = connection.cursor()
     try:
-        # Update stock entry
-        update_stock_query = """
-        UPDATE stock 
-        SET quantity_in_stock = quantity_in_stock + %s 
-        WHERE product_id = %s
-        """
-        cursor.execute(update_stock_query, (quantity, product_id))
-        if cursor.rowcount > 0:
+        cursor.execute("SELECT product_id FROM stock WHERE product_id = %s", (product_id,))
+        if cursor.fetchone():
+            record_movements(connection, [(product_id, quantity, stock_ledger.CORRECTION, None, None)])
             connection.commit()
-            logging.info(f"Stock updated successfully for product ID {product_id}")
+            catalog_cache.stock_changed([product_id])
+            logger.info(f"Stock updated successfully for product ID {product_id}")
             return {'status': 'success'}
         else:
-            logging.warning(f"No stock entry found for product ID {product_id}.")
+            logger.warning(f"No stock entry found for product ID {product_id}.")
             return {'status': 'fail', 'message': 'No stock entry found for this product.'}
     except Error as e:
         connection.rollback()  # Rollback on database error
-        logging.error(f"Database error while updating stock for product ID {product_id}: {str(e)}")
+        logger.error(f"Database error while updating stock for product ID {product_id}: {str(e)}")
         return {'status': 'fail', 'message': 'Database error occurred.'}
     except Exception as e:
         connection.rollback()  # Rollback on any other error
-        logging.error(f"Unexpected error while updating stock for product ID {product_id}: {str(e)}")
+        logger.error(f"Unexpected error while updating stock for product ID {product_id}: {str(e)}")
         return {'status': 'fail', 'message': str(e)}
     finally:
         cursor.close()
@@ -150,8 +185,8 @@ def get_stock(connection) -> List[Dict]:
     """Fetch current stock information."""
     with connection.cursor() as cursor:
         try:
-            query = """
-            SELECT s.product_id, p.product_name, s.quantity_in_stock
+            query = f"""
+            SELECT s.product_id, p.product_name, {stock_ledger.BALANCE}
             FROM stock s
             JOIN products p ON s.product_id = p.product_id
             """
@@ -166,70 +201,164 @@ def get_stock(connection) -> List[Dict]:
                 for result in results
             ]
         except Error as e:
-            logging.error(f"Database error while fetching stock: {str(e)}")
+            logger.error(f"Database error while fetching stock: {str(e)}")
             return []
         except Exception as e:
-            logging.error(f"Unexpected error while fetching stock: {str(e)}")
+            logger.error(f"Unexpected error while fetching stock: {str(e)}")
             return []
 def decrease_stock(connection, product_id: int, quantity: int) -> bool:
-    """Decrease the stock for a given product."""
-    with connection.cursor() as cursor:
+    """Decrease the stock for a given product, if it holds enough."""
+    try:
+        reserve_stock(connection, {product_id: quantity})
+        connection.commit()
+        catalog_cache.stock_changed([product_id])
+        logger.debug(f"Stock decreased successfully for product ID {product_id}")
+        return True
+    except InsufficientStockError:
+        connection.rollback()
+        logger.warning(f"Insufficient stock for product ID {product_id} or no entry found.")
+        return False
+    except Error as e:
+        connection.rollback()  # Rollback on database error
+        logger.error(f"Database error while decreasing stock for product ID {product_id}: {str(e)}")
+        return False
+    except Exception as e:
+        connection.rollback()  # Rollback on any other error
+        logger.error(f"Unexpected error while decreasing stock for product ID {product_id}: {str(e)}")
+        return False
+def lock_stock_balances(connection, product_ids) -> Dict[int, int]:
+    """Lock some products' stock rows in product_id order and return their live balances.
+
+    Only the stock rows are locked. The balances are read from the
+    transaction's snapshot and lowered by what was withdrawn after it, so no
+    stock another till took is counted; stock added after it may be missed.
+    Products without a stock row are left out. Does not commit.
+    """
+    rows, _ = execute_prepared(connection, *stock_ledger.build_lock_stock(product_ids))
+    withdrawn = dict(rows)
+    if not withdrawn:
+        return {}
+    rows, _ = execute_prepared(connection, *stock_ledger.build_balances(withdrawn))
+    return {product_id: balance - (withdrawn[product_id] - seen) for product_id, seen, balance in rows}
+
+def record_movements(connection, movements: List[stock_ledger.Movement]) -> None:
+    """Append movements to the stock ledger.
+
+    Movements that take stock out are added to their stock rows' withdrawn
+    totals, which locks those rows; movements that add stock are only
+    appended. Does not commit.
+    """
+    withdrawn = {}
+    for product_id, quantity, *_ in movements:
+        if quantity < 0:
+            withdrawn[product_id] = withdrawn.get(product_id, 0) - quantity
+    if withdrawn:
+        execute_prepared(connection, *stock_ledger.build_withdraw(withdrawn))
+    if movements:
+        execute_prepared(connection, *stock_ledger.build_movements(movements))
+
+def reserve_stock(connection, quantities: Dict[int, float], order_id: Optional[int] = None) -> None:
+    """Atomically take a basket's quantities out of stock.
+
+    Locks the stock rows in product_id order, raises InsufficientStockError
+    if any line is short or has no stock row, and otherwise records a sale
+    movement for every line. Does not commit: the caller owns the transaction
+    and rolls it back on error.
+    """
+    if not quantities:
+        return
+    available = lock_stock_balances(connection, quantities)
+    shortages = {product_id: available.get(product_id) for product_id, quantity in quantities.items()
+                 if available.get(product_id) is None or available[product_id] < quantity}
+    if shortages:
+        raise InsufficientStockError(shortages)
+    record_movements(connection, [(product_id, -quantity, stock_ledger.SALE, order_id, None)
+                                  for product_id, quantity in sorted(quantities.items())])
+
+def set_stock_levels(connection, levels: Dict[int, float], reason: str = stock_ledger.CORRECTION) -> Dict[int, int]:
+    """Set absolute stock levels by recording their difference to the live balances.
+
+    Products without a stock row get one, starting from an 'initial'
+    movement. Returns the balances found before the change. Does not commit.
+    """
+    if not levels:
+        return {}
+    balances = lock_stock_balances(connection, levels)
+    missing = [product_id for product_id in sorted(levels) if product_id not in balances]
+    if missing:
+        with connection.cursor() as cursor:
+            cursor.execute(backend.upsert('stock', ('product_id', 'quantity_in_stock'), ('product_id',),
+                                          rows=len(missing), add=('quantity_in_stock',)),
+                           tuple(value for product_id in missing for value in (product_id, 0)))
+    movements = [(product_id, level - balances.get(product_id, 0),
+                  reason if product_id in balances else stock_ledger.INITIAL, None, None)
+                 for product_id, level in sorted(levels.items()) if level != balances.get(product_id, 0)]
+    record_movements(connection, movements)
+    return balances
+
+def retry_on_lock_conflict(connection, transaction: Callable[[], T], attempts: int = RESERVATION_ATTEMPTS,
+                           backoff: float = RESERVATION_BACKOFF) -> T:
+    """Run `transaction()`, rolling back and retrying it when it loses a lock race.
+
+    `transaction` must do all of its work, including the commit, so that a
+    retry starts from scratch. Other errors and the last conflict propagate.
+    """
+    for attempt in range(1, attempts + 1):
         try:
-            # Update stock entry
-            update_stock_query = """
-            UPDATE stock 
-            SET quantity_in_stock = quantity_in_stock - %s 
-            WHERE product_id = %s AND quantity_in_stock >= %s
-            """
-            cursor.execute(update_stock_query, (quantity, product_id, quantity))
-            
-            if cursor.rowcount > 0:
-                connection.commit()
-                logging.info(f"Stock decreased successfully for product ID {product_id}")
-                return True
-            else:
-                logging.warning(f"Insufficient stock for product ID {product_id} or no entry found.")
-                return False
+            return transaction()
         except Error as e:
-            connection.rollback()  # Rollback on database error
-            logging.error(f"Database error while decreasing stock for product ID {product_id}: {str(e)}")
-            return False
-        except Exception as e:
-            connection.rollback()  # Rollback on any other error
-            logging.error(f"Unexpected error while decreasing stock for product ID {product_id}: {str(e)}")
-            return False
+            if not is_lock_conflict(e) or attempt == attempts:
+                raise
+            connection.rollback()
+            delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"Lock conflict ({e}); retrying in {delay * 1000:.0f} ms "
+                           f"(attempt {attempt + 1} of {attempts})")
+            time.sleep(delay)
+
 def is_stock_available(connection, product_id: int, requested_quantity: int) -> bool:
     """Check if the requested quantity of the product is available in stock."""
-    with connection.cursor() as cursor:
-        try:
-            # Fetch the current quantity in stock for the given product_id
-            cursor.execute("SELECT quantity_in_stock FROM stock WHERE product_id = %s", (product_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                current_stock = result[0]
-                return current_stock >= requested_quantity  # Check if requested quantity is available
-            else:
-                logging.warning(f"No stock entry found for product ID {product_id}.")
-                return False
-            
-        except Error as e:
-            logging.error(f"Database error while checking stock availability for product ID {product_id}: {str(e)}")
-            return False
-        except Exception as e:
-            logging.error(f"Unexpected error while checking stock availability for product ID {product_id}: {str(e)}")
+    try:
+        # Fetch the current quantity in stock for the given product_id
+        rows, _ = execute_prepared(connection, STOCK_QUERY, (product_id,))
+        
+        if rows:
+            current_stock = rows[0][0]
+            return current_stock >= requested_quantity  # Check if requested quantity is available
+        else:
+            logger.warning(f"No stock entry found for product ID {product_id}.")
             return False
+        
+    except Error as e:
+        logger.error(f"Database error while checking stock availability for product ID {product_id}: {str(e)}")
+        return False
+    except Exception as e:
+        logger.error(f"Unexpected error while checking stock availability for product ID {product_id}: {str(e)}")
+        return False
+def get_stock_levels(connection, product_ids: List[int]) -> Dict[int, int]:
+    """Fetch the stock quantities of several products with one query; missing products are left out."""
+    if not product_ids:
+        return {}
+    params = list(product_ids)
+    size = batch_size(len(params))
+    params += params[-1:] * (size - len(params))
+    rows, _ = execute_prepared(connection, stock_levels_query(size), tuple(params))
+    return {row[0]: row[1] for row in rows}
+
+@functools.lru_cache(maxsize=None)
+def stock_levels_query(size: int) -> str:
+    """Stock of `size` product IDs; one prepared shape per batch size."""
+    return (f"SELECT s.product_id, {stock_ledger.BALANCE} FROM stock s "
+            f"WHERE s.product_id IN ({', '.join(['%s'] * size)})")
+
 def get_stock_by_product_id(connection, product_id: int) -> Optional[int]:
     """Fetch the stock quantity for a given product ID."""
-    with connection.cursor() as cursor:
-        try:
-            cursor.execute("SELECT quantity_in_stock FROM stock WHERE product_id = %s", (product_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-        except Error as e:
-            logging.error(f"Database error while fetching stock for product ID {product_id}: {str(e)}")
-            return None
-        except Exception as e:
-            logging.error(f"Unexpected error while fetching stock for product ID {product_id}: {str(e)}")
-            return None
+    try:
+        rows, _ = execute_prepared(connection, STOCK_QUERY, (product_id,))
+        return rows[0][0] if rows else None
+    except Error as e:
+        logger.error(f"Database error while fetching stock for product ID {product_id}: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error while fetching stock for product ID {product_id}: {str(e)}")
+        return None
 
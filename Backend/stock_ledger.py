@@ -0,0 +1,280 @@
+import functools
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sql_connection import batch_size, get_sql_connection
+from storage import backend, is_lock_conflict, DatabaseError
+import sales_dao
+
+logger = logging.getLogger(__name__)
+
+# Append-only stock ledger (stock_movements, Database/migrations/0004).
+#
+# Every stock change is a signed movement row with its reason: a sale, the
+# reversal of a deleted order, a goods receipt line or a correction, with the
+# order or receipt it came from. stock.quantity_in_stock is the materialized
+# balance of the movements folded into it so far; movements not folded yet
+# are added on read, so a product's live balance is
+#
+#   stock.quantity_in_stock + SUM(stock_movements.quantity WHERE folded = 0)
+#
+# Adding stock (deliveries, reversals, upward corrections) is a plain INSERT
+# into the ledger: it takes no lock on the stock row and no locking read ever
+# runs on stock_movements, so it never queues behind the tills on fast
+# movers. Taking stock out (sales, returns to the supplier, downward
+# corrections) must not oversell, so it locks the stock row and adds the
+# amount to stock.withdrawn, a running total that compaction leaves alone.
+# A balance read from the transaction's snapshot may miss stock withdrawn
+# since; the locked counter tells how much, so the check subtracts it (see
+# stock_dao.lock_stock_balances). Stock added since the snapshot is not
+# counted, which only errs on the safe side.
+#
+# compact() folds unfolded movements into stock, a batch of products per
+# transaction. Each process runs it every STOCK_COMPACTION_INTERVAL seconds
+# (0 disables it) once start_compactor() has been called, followed by
+# sales_dao.fold_daily_sales(); it can also be run by hand:
+#
+#   python stock_ledger.py compact
+#   python stock_ledger.py history 42
+
+SALE, SALE_REVERSAL, RECEIPT, CORRECTION, INITIAL = 'sale', 'sale_reversal', 'receipt', 'correction', 'initial'
+
+COMPACTION_INTERVAL = float(os.environ.get('STOCK_COMPACTION_INTERVAL', '60'))
+COMPACTION_BATCH_SIZE = int(os.environ.get('STOCK_COMPACTION_BATCH_SIZE', '200'))  # products per transaction
+
+# Live balance of the stock row aliased s
+BALANCE = ("CAST(s.quantity_in_stock + COALESCE((SELECT SUM(m.quantity) FROM stock_movements m "
+           "WHERE m.folded = 0 AND m.product_id = s.product_id), 0) AS SIGNED)")
+
+MOVEMENT_COLUMNS = ('product_id', 'quantity', 'reason', 'order_id', 'receipt_id', 'created_at')
+
+# (product_id, quantity, reason, order_id, receipt_id)
+Movement = Tuple[int, float, str, Optional[int], Optional[str]]
+Statement = Tuple[str, tuple]
+
+
+def build_movements(movements: List[Movement], created_at: Optional[datetime] = None) -> Statement:
+    """Statement appending `movements` to the ledger.
+
+    Padded to batch_size() rows with NULL product ids, which are not inserted,
+    so checkout reuses a handful of prepared statements.
+    """
+    created_at = created_at or datetime.now()
+    size = batch_size(len(movements))
+    params = [value for movement in movements for value in (*movement, created_at)]
+    params += [None] * len(MOVEMENT_COLUMNS) * (size - len(movements))
+    return _movements_query(size), tuple(params)
+
+
+@functools.lru_cache(maxsize=None)
+def _movements_query(size: int) -> str:
+    columns = ', '.join(MOVEMENT_COLUMNS)
+    row = 'SELECT ' + ', '.join(f'%s AS {column}' for column in MOVEMENT_COLUMNS)
+    return (f"INSERT INTO stock_movements ({columns}) SELECT {columns} "
+            f"FROM ({' UNION ALL '.join([row] * size)}) d WHERE d.product_id IS NOT NULL")
+
+
+def build_lock_stock(product_ids: Iterable[int]) -> Statement:
+    """Build the locking read of some products' stock rows and withdrawn totals, in product_id order."""
+    product_ids = sorted(product_ids)
+    size = batch_size(len(product_ids))
+    return _lock_stock_query(size), tuple(product_ids + product_ids[-1:] * (size - len(product_ids)))
+
+
+@functools.lru_cache(maxsize=None)
+def _lock_stock_query(size: int) -> str:
+    return (f"SELECT product_id, withdrawn FROM stock WHERE product_id IN ({', '.join(['%s'] * size)}) "
+            "ORDER BY product_id FOR UPDATE")
+
+
+def build_balances(product_ids: Iterable[int]) -> Statement:
+    """Build the (non-locking) read of some products' withdrawn totals and live balances."""
+    product_ids = sorted(product_ids)
+    size = batch_size(len(product_ids))
+    return _balances_query(size), tuple(product_ids + product_ids[-1:] * (size - len(product_ids)))
+
+
+@functools.lru_cache(maxsize=None)
+def _balances_query(size: int) -> str:
+    return f"SELECT s.product_id, s.withdrawn, {BALANCE} FROM stock s WHERE s.product_id IN ({', '.join(['%s'] * size)})"
+
+
+def build_withdraw(quantities: Dict[int, float]) -> Statement:
+    """Build the statement adding taken-out `quantities` to the withdrawn totals of locked stock rows."""
+    size = batch_size(len(quantities))
+    params = [value for item in sorted(quantities.items()) for value in item]
+    params += [None, 0] * (size - len(quantities))
+    return _withdraw_query(size), tuple(params)
+
+
+@functools.lru_cache(maxsize=None)
+def _withdraw_query(size: int) -> str:
+    derived = ' UNION ALL '.join(['SELECT %s AS product_id, %s AS quantity'] * size)
+    return backend.update_from('stock', 's', derived, 's.product_id = d.product_id',
+                               {'withdrawn': 's.withdrawn + d.quantity'})
+
+
+def compact(connection, batch_size: int = COMPACTION_BATCH_SIZE) -> int:
+    """Fold every unfolded movement into its stock row; returns the number folded.
+
+    Stock rows are locked in product_id order, like checkout does; the
+    movements are read without locks, so recording new ones never waits for
+    compaction. A batch that loses a lock race is rolled back and left for the
+    next run. Movements of products without a stock row (deleted products) are
+    marked folded and only kept as history.
+    """
+    folded = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT product_id FROM stock_movements WHERE folded = 0 "
+                           "ORDER BY product_id LIMIT %s", (batch_size,))
+            product_ids = [row[0] for row in cursor.fetchall()]
+            # End that read, so the batch's snapshot is taken after its locks
+            connection.commit()
+            if not product_ids:
+                return folded
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            try:
+                cursor.execute(*build_lock_stock(product_ids))
+                stocked = {row[0] for row in cursor.fetchall()}
+                cursor.execute(f"SELECT movement_id, product_id, quantity FROM stock_movements "
+                               f"WHERE folded = 0 AND product_id IN ({placeholders})", tuple(product_ids))
+                movements = cursor.fetchall()
+                totals = {}
+                for _, product_id, quantity in movements:
+                    totals[product_id] = totals.get(product_id, 0) + quantity
+                deltas = {product_id: total for product_id, total in sorted(totals.items())
+                          if product_id in stocked and total}
+                if deltas:
+                    cursor.execute(*_build_fold(deltas))
+                movement_ids = [row[0] for row in movements]
+                flagged = 0
+                for start in range(0, len(movement_ids), 1000):
+                    chunk = movement_ids[start:start + 1000]
+                    cursor.execute(f"UPDATE stock_movements SET folded = 1 "
+                                   f"WHERE folded = 0 AND movement_id IN ({', '.join(['%s'] * len(chunk))})",
+                                   tuple(chunk))
+                    flagged += cursor.rowcount
+                if flagged != len(movement_ids):
+                    # Another compactor folded some of them after this snapshot
+                    connection.rollback()
+                    logger.info(f"Stock compaction raced another run; {folded} movements folded.")
+                    return folded
+                connection.commit()
+            except DatabaseError as e:
+                connection.rollback()
+                if not is_lock_conflict(e):
+                    raise
+                logger.info(f"Stock compaction yielded to a lock conflict ({e}); {folded} movements folded.")
+                return folded
+        folded += len(movements)
+
+
+def _build_fold(deltas: Dict[int, float]) -> Statement:
+    derived = ' UNION ALL '.join(['SELECT %s AS product_id, %s AS quantity'] * len(deltas))
+    query = backend.update_from('stock', 's', derived, 's.product_id = d.product_id',
+                                {'quantity_in_stock': 's.quantity_in_stock + d.quantity'})
+    return query, tuple(value for item in deltas.items() for value in item)
+
+
+def get_movements(connection, product_id: int, limit: int = 100, before: Optional[int] = None) -> List[Dict]:
+    """A product's movements, newest first; pass the last movement_id as `before` for the next page."""
+    query = ("SELECT movement_id, quantity, reason, order_id, receipt_id, created_at, folded "
+             "FROM stock_movements WHERE product_id = %s")
+    params = [product_id]
+    if before is not None:
+        query += " AND movement_id < %s"
+        params.append(before)
+    query += " ORDER BY movement_id DESC LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(query, tuple(params))
+        return [
+            {
+                'movement_id': row[0],
+                'quantity': row[1],
+                'reason': row[2],
+                'order_id': row[3],
+                'receipt_id': row[4],
+                'created_at': row[5].isoformat(sep=' ') if row[5] else None,
+                'folded': bool(row[6]),
+            }
+            for row in cursor.fetchall()
+        ]
+
+
+class StockCompactor(threading.Thread):
+    """Daemon thread running compact() and sales_dao.fold_daily_sales() every `interval` seconds."""
+
+    def __init__(self, interval: float):
+        super().__init__(name='stock-compactor', daemon=True)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            connection = None
+            try:
+                connection = get_sql_connection()
+                folded = compact(connection)
+                if folded:
+                    logger.info(f"Folded {folded} stock movements.")
+                folded = sales_dao.fold_daily_sales(connection)
+                if folded:
+                    logger.info(f"Folded {folded} daily sales deltas.")
+            except Exception as e:
+                logger.warning(f"Stock compaction failed: {str(e)}")
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def stop(self):
+        self._stopped.set()
+
+
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def start_compactor(interval: float = COMPACTION_INTERVAL) -> None:
+    """Start this process's compactor thread, once; call it after forking."""
+    global _compactor
+    if interval <= 0:
+        return
+    with _compactor_lock:
+        if _compactor is None or not _compactor.is_alive():
+            _compactor = StockCompactor(interval)
+            _compactor.start()
+
+
+def stop_compactor() -> None:
+    global _compactor
+    with _compactor_lock:
+        if _compactor is not None:
+            _compactor.stop()
+            _compactor = None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] not in ('compact', 'history') or (sys.argv[1] == 'history' and len(sys.argv) != 3):
+        print("Usage: python stock_ledger.py compact\n       python stock_ledger.py history <product_id>")
+        sys.exit(2)
+
+    connection = get_sql_connection()
+    try:
+        if sys.argv[1] == 'compact':
+            started = datetime.now()
+            folded = compact(connection)
+            logger.info(f"Folded {folded} stock movements in {(datetime.now() - started).total_seconds():.1f}s")
+        else:
+            for movement in get_movements(connection, int(sys.argv[2])):
+                print(f"{movement['movement_id']:>10} {movement['created_at']} {movement['reason']:<14} "
+                      f"{movement['quantity']:>8} order={movement['order_id']} receipt={movement['receipt_id']}"
+                      f"{'' if movement['folded'] else ' (unfolded)'}")
+    finally:
+        connection.close()
@@ -0,0 +1,180 @@
+import os
+import re
+import sqlite3
+import string
+import unicodedata
+
+import mysql.connector
+
+import sqlite_connection
+
+# Storage backends behind the connection pool and the DAO modules.
+#
+# DB_ENGINE selects the database every pooled connection talks to:
+#
+#   mysql   (default) a MySQL server, configured by DB_HOST / DB_PORT /
+#           DB_USER / DB_PASSWORD / DB_NAME in sql_connection.py
+#   sqlite  an embedded SQLite file at SQLITE_PATH (default sms.sqlite3, next
+#           to the backend) in WAL mode, created from Database/sqlite_schema.sql
+#           on first use. Data access is in-process, which suits a single-till
+#           store, local development and benchmarks without a database server.
+#
+# DAO modules keep writing %s-style SQL against connection.cursor(); the
+# SQLite connection (sqlite_connection.py) translates placeholders and
+# FOR UPDATE itself. The statements the two dialects spell differently,
+# upserts and UPDATEs joined to a derived table, come from backend.upsert()
+# and backend.update_from(); backend.prepared_cursor() gives a cursor for
+# prepared statements (see sql_connection.execute_prepared), and
+# backend.name_key() folds a product name the way the engine's collation
+# compares it. The ASGI app
+# (async_sql_connection.py) talks to MySQL only.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'mysql').lower()
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'sms.sqlite3'))
+
+# Catch these instead of mysql.connector.Error in code that runs on either engine
+DatabaseError = (mysql.connector.Error, sqlite3.Error)
+
+MYSQL_DUPLICATE_KEY = 1062
+SQLITE_CONSTRAINT_UNIQUE = (1555, 2067)  # SQLITE_CONSTRAINT_PRIMARYKEY, SQLITE_CONSTRAINT_UNIQUE
+MYSQL_LOCK_CONFLICT = (1205, 1213)  # ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK
+SQLITE_LOCK_CONFLICT = (5, 6)  # SQLITE_BUSY, SQLITE_LOCKED (primary result codes)
+# EXPLAIN QUERY PLAN detail of a full table scan, e.g. "SCAN p" or, before
+# SQLite 3.36, "SCAN TABLE products AS p"
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?$')
+
+
+def is_duplicate_key(error) -> bool:
+    """True if a database error is a primary or unique key violation."""
+    if isinstance(error, mysql.connector.Error):
+        return error.errno == MYSQL_DUPLICATE_KEY
+    return isinstance(error, sqlite3.IntegrityError) and getattr(error, 'sqlite_errorcode', None) in SQLITE_CONSTRAINT_UNIQUE
+
+
+def is_lock_conflict(error) -> bool:
+    """True if a database error means the transaction lost a lock race and may be retried.
+
+    Covers MySQL lock wait timeouts and deadlock victims, from mysql.connector
+    or aiomysql (pymysql errors carry the errno as their first argument), and
+    SQLite's busy and locked errors.
+    """
+    if isinstance(error, mysql.connector.Error):
+        return error.errno in MYSQL_LOCK_CONFLICT
+    if isinstance(error, sqlite3.OperationalError):
+        code = getattr(error, 'sqlite_errorcode', None)
+        return code is not None and code & 0xff in SQLITE_LOCK_CONFLICT
+    return bool(error.args) and error.args[0] in MYSQL_LOCK_CONFLICT
+
+
+class MySQLBackend:
+    name = 'mysql'
+
+    def connect(self, **connect_args):
+        return mysql.connector.connect(**connect_args)
+
+    def set_statement_timeout(self, cnx, milliseconds):
+        with cnx.cursor() as cursor:
+            cursor.execute("SET SESSION max_execution_time = %s", (milliseconds,))
+
+    def prepared_cursor(self, cnx):
+        """Cursor that prepares the statement it executes on the server and keeps it."""
+        return cnx.cursor(prepared=True)
+
+    def name_key(self, name):
+        """Fold a product name like utf8mb4_0900_ai_ci does: ignoring case and accents."""
+        decomposed = unicodedata.normalize('NFKD', name)
+        return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+    def upsert(self, table, columns, keys, rows=1, add=(), replace=(), select=None):
+        """INSERT of `rows` value tuples (or a SELECT) that updates rows whose key already exists.
+
+        Columns in `add` are incremented by the inserted value, columns in
+        `replace` are overwritten with it. `keys` is the conflicting key.
+        """
+        assignments = [f"{column} = {column} + VALUES({column})" for column in add]
+        assignments += [f"{column} = VALUES({column})" for column in replace]
+        return (_insert(table, columns, rows, select)
+                + " ON DUPLICATE KEY UPDATE " + ", ".join(assignments))
+
+    def update_from(self, table, alias, derived, on, assignments, where=None):
+        """UPDATE `table` joined to the derived table `derived`, aliased d.
+
+        `assignments` maps column names to expressions over `alias` and d.
+        """
+        statement = (f"UPDATE {table} {alias} JOIN ({derived}) d ON {on} SET "
+                     + ", ".join(f"{alias}.{column} = {expression}" for column, expression in assignments.items()))
+        return statement + (f" WHERE {where}" if where else "")
+
+    def full_scans(self, cursor, query, params=()):
+        """Tables (by alias) that the plan of `query` reads with a full table scan."""
+        cursor.execute("EXPLAIN " + query, params)
+        columns = [column[0] for column in cursor.description]
+        return [row['table'] for row in (dict(zip(columns, values)) for values in cursor.fetchall())
+                if row['type'] == 'ALL']
+
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self, **connect_args):
+        return sqlite_connection.connect(self.path)
+
+    def set_statement_timeout(self, cnx, milliseconds):
+        cnx.set_statement_timeout(milliseconds)
+
+    def prepared_cursor(self, cnx):
+        # sqlite3 already keeps the compiled form of recent statements on
+        # each connection, and translate() caches their rewritten text
+        return cnx.cursor()
+
+    def name_key(self, name):
+        # NOCASE only folds ASCII letters
+        return name.translate(_ASCII_LOWER)
+
+    def upsert(self, table, columns, keys, rows=1, add=(), replace=(), select=None):
+        # An INSERT ... SELECT needs a WHERE clause for SQLite to parse the
+        # ON CONFLICT that follows it
+        assignments = [f"{column} = {column} + excluded.{column}" for column in add]
+        assignments += [f"{column} = excluded.{column}" for column in replace]
+        return (_insert(table, columns, rows, select)
+                + f" ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " + ", ".join(assignments))
+
+    def update_from(self, table, alias, derived, on, assignments, where=None):
+        statement = (f"UPDATE {table} AS {alias} SET "
+                     + ", ".join(f"{column} = {expression}" for column, expression in assignments.items())
+                     + f" FROM ({derived}) AS d WHERE {on}")
+        return statement + (f" AND {where}" if where else "")
+
+    def full_scans(self, cursor, query, params=()):
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        scans = []
+        for row in cursor.fetchall():
+            match = _SQLITE_FULL_SCAN.match(row[-1])
+            if match:
+                scans.append(match.group(2) or match.group(1))
+        return scans
+
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _insert(table, columns, rows, select):
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) "
+    if select is not None:
+        return statement + select
+    return statement + "VALUES " + ", ".join([f"({', '.join(['%s'] * len(columns))})"] * rows)
+
+
+def create_backend(engine=DB_ENGINE):
+    if engine == 'mysql':
+        return MySQLBackend()
+    if engine == 'sqlite':
+        return SQLiteBackend(SQLITE_PATH)
+    raise ValueError(f"Unknown DB_ENGINE: {engine} (expected mysql or sqlite)")
+
+
+backend = create_backend()
@@ -1,5 +1,10 @@
+from sql_connection import get_sql_connection
 from products_dao import get_product_price
 
 test_product_id = 10  # Replace with a valid product ID from your database
-price = get_product_price(test_product_id)
-print(f"Price for product ID {test_product_id}: {price}")
+connection = get_sql_connection()
+try:
+    price = get_product_price(connection, test_product_id)
+    print(f"Price for product ID {test_product_id}: {price}")
+finally:
+    connection.close()
@@ -0,0 +1,71 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The suite runs against a throwaway SQLite database (DB_ENGINE=sqlite, see
+# storage.py). The environment has to be set before the backend modules are
+# imported, since they read it at import time.
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ['DB_ENGINE'] = 'sqlite'
+os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='sms-tests-'), 'sms.sqlite3')
+os.environ['LOG_FILE'] = ''
+os.environ['LOG_CONSOLE'] = '0'
+os.environ['STOCK_COMPACTION_INTERVAL'] = '0'
+sys.path.insert(0, BACKEND)
+
+import migrate  # noqa: E402
+from catalog_cache import catalog_cache  # noqa: E402
+from sql_connection import get_sql_connection  # noqa: E402
+
+_product_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def database():
+    """Bring the test database up to the latest migration."""
+    connection = get_sql_connection()
+    try:
+        migrate.migrate(connection)
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def connection(database):
+    connection = get_sql_connection()
+    catalog_cache.invalidate()
+    yield connection
+    connection.rollback()
+    connection.close()
+
+
+@pytest.fixture
+def make_products(connection):
+    """Create products of their own for a test; returns {product_id: barcode}."""
+
+    def make(count, stock=100, price=10):
+        products = {}
+        with connection.cursor() as cursor:
+            for _ in range(count):
+                number = next(_product_numbers)
+                barcode = f'77{number:011d}'
+                cursor.execute("INSERT INTO products (product_name, uom_id, price_per_unit, barcode) "
+                               "VALUES (%s, %s, %s, %s)", (f'Test product {number}', 2, price, barcode))
+                products[cursor.lastrowid] = barcode
+                cursor.execute("INSERT INTO stock (product_id, quantity_in_stock) VALUES (%s, %s)",
+                               (cursor.lastrowid, stock))
+        connection.commit()
+        catalog_cache.invalidate()
+        return products
+
+    return make
+
+
+@pytest.fixture
+def client(database):
+    import server
+    return server.app.test_client()
+
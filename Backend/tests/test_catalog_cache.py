@@ -0,0 +1,19 @@
+import time
+
+from catalog_cache import CatalogCache
+
+
+def test_a_loaded_catalog_expires_after_its_ttl():
+    cache = CatalogCache(ttl=0.05)
+    cache.install(cache.begin_load(), [{'product_id': 1, 'barcode': '123', 'quantity_in_stock': 3}])
+    assert cache.lookup_barcodes(['123'])['123']['product_id'] == 1
+
+    time.sleep(0.1)
+    assert cache.get_all() is None and cache.lookup_barcodes(['123']) is None
+
+
+def test_a_zero_ttl_never_expires():
+    cache = CatalogCache(ttl=0)
+    cache.install(cache.begin_load(), [])
+    time.sleep(0.01)
+    assert cache.get_all() == []
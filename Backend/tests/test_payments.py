@@ -0,0 +1,23 @@
+import datetime
+
+import orders_dao
+
+
+def test_payment_modes_are_stored_in_their_canonical_spelling(client, connection, make_products):
+    product_id, = make_products(1)
+    order_id = orders_dao.insert_order(connection, {
+        'customer_name': 'Payer', 'grandTotal': 10,
+        'order_details': [{'product_id': product_id, 'quantity': 1, 'total_price': 10}]})
+
+    response = client.post('/processPayment', json={'payment_mode': 'cash', 'order_id': order_id,
+                                                    'customer_name': 'Payer', 'grandTotal': 10,
+                                                    'order_details': []})
+    assert response.status_code == 200
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT payment_mode FROM payments WHERE payment_id = %s", (response.get_json()['payment_id'],))
+        assert cursor.fetchone()[0] == 'Cash'
+        cursor.execute("SELECT DISTINCT payment_mode FROM daily_payment_sales WHERE sale_date = %s",
+                       (datetime.date.today(),))
+        assert [row[0] for row in cursor.fetchall()] == ['Cash']
+    connection.commit()
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+import product_import
+import products_dao
+from storage import MySQLBackend, SQLiteBackend
+
+
+def upload(*lines):
+    return io.BytesIO(('product_name,price_per_unit,uom_id,quantity_in_stock\n' + '\n'.join(lines)).encode())
+
+
+def test_a_rejected_chunk_only_fails_its_bad_rows(connection, monkeypatch):
+    upsert_products = products_dao.upsert_products
+
+    def reject_poison(connection, rows):
+        if any(row['product_name'].startswith('Poison') for row in rows):
+            raise ValueError('Data too long for column product_name')
+        return upsert_products(connection, rows)
+
+    monkeypatch.setattr(products_dao, 'upsert_products', reject_poison)
+    lines = [f'Import product {number},1.50,2,5' for number in range(9)]
+    lines[4] = 'Poison product,1.50,2,5'
+    summary = product_import.import_products(connection, upload(*lines), 'csv', chunk_size=10)
+
+    assert summary['inserted'] == 8 and summary['failed'] == 1
+    assert summary['errors'] == [{'line': 6, 'error': 'Database error: Data too long for column product_name'}]
+
+
+@pytest.mark.parametrize('line, error', [
+    ('x' * 256 + ',1,2,1', 'Product name is longer than 255 characters'),
+    ('Big price,100000000,2,1', 'Price must be at most 99999999.99'),
+    ('Not a price,nan,2,1', 'Price must be at most 99999999.99'),
+    ('Big stock,1,2,2147483648', 'Quantity must be at most 2147483647'),
+])
+def test_values_the_columns_cannot_hold_are_rejected_before_the_database(connection, line, error):
+    summary = product_import.import_products(connection, upload(line), 'csv')
+    assert summary['errors'] == [{'line': 2, 'error': error}]
+
+
+def test_rows_are_matched_to_products_the_way_the_collation_compares_names(connection):
+    product_import.import_products(connection, upload('Import Match,2.00,2,3'), 'csv')
+    summary = product_import.import_products(connection, upload('IMPORT MATCH,2.50,2,4'), 'csv')
+    assert summary['updated'] == 1 and summary['failed'] == 0
+
+
+def test_name_keys_follow_each_engine_collation():
+    assert MySQLBackend().name_key('Crème Brûlée') == MySQLBackend().name_key('CREME BRULEE')
+    assert SQLiteBackend(':memory:').name_key('Crème') == 'crème'
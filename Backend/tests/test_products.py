@@ -0,0 +1,12 @@
+def test_delete_product_reports_the_product_id(client, make_products):
+    product_id, = make_products(1)
+
+    response = client.delete(f'/deleteProduct/{product_id}')
+    assert response.status_code == 200
+    assert response.get_json()['message'] == f'Product with ID {product_id} and its stock deleted successfully'
+
+    assert client.delete(f'/deleteProduct/{product_id}').status_code == 404
+
+
+def test_update_stock_of_an_unknown_product_is_not_found(client):
+    assert client.put('/updateStock/999999', json={'quantity_in_stock': 5}).status_code == 404
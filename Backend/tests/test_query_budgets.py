@@ -0,0 +1,58 @@
+import pytest
+
+from query_profiler import assert_query_budget
+
+# Pinned statement counts of the checkout hot paths. A change that adds a
+# statement per basket line, or a new round trip, fails here; raise a budget
+# only together with the change that needs it.
+
+INSERT_ORDER_QUERIES = 9
+
+
+def order_payload(quantities, price=10):
+    return {
+        'customer_name': 'Test customer',
+        'grandTotal': sum(quantity * price for quantity in quantities.values()),
+        'order_details': [{'product_id': product_id, 'quantity': quantity, 'total_price': quantity * price}
+                          for product_id, quantity in quantities.items()],
+    }
+
+
+@pytest.mark.parametrize('lines', [1, 3, 12])
+def test_insert_order_does_not_grow_with_the_basket(client, make_products, lines):
+    products = make_products(lines)
+    response = assert_query_budget(client, 'POST', '/insertOrder', INSERT_ORDER_QUERIES, max_repeats=1,
+                                   json=order_payload({product_id: 2 for product_id in products}))
+    assert response.status_code == 201
+
+
+def test_check_stock_is_one_query(client, make_products):
+    products = make_products(8)
+    response = assert_query_budget(client, 'POST', '/checkStock', 1,
+                                   json={'order_details': [{'product_id': product_id, 'quantity': 1}
+                                                           for product_id in products]})
+    assert response.status_code == 200
+    assert all(line['available'] for line in response.get_json())
+
+
+def test_barcodes_load_the_catalog_once_then_hit_the_cache(client, make_products):
+    barcodes = list(make_products(3).values())
+    body = {'barcodes': barcodes + ['0000000000000']}
+
+    response = assert_query_budget(client, 'POST', '/getProductsByBarcodes', 1, json=body)
+    assert sorted(response.get_json()['products']) == sorted(barcodes)
+    assert response.get_json()['not_found'] == ['0000000000000']
+
+    response = assert_query_budget(client, 'POST', '/getProductsByBarcodes', 0, json=body)
+    assert response.status_code == 200
+
+
+def test_barcodes_after_a_sale_reread_only_the_stock(client, make_products):
+    products = make_products(3)
+    body = {'barcodes': list(products.values())}
+    client.post('/getProductsByBarcodes', json=body)
+    sold = next(iter(products))
+    client.post('/insertOrder', json=order_payload({sold: 5}))
+
+    response = assert_query_budget(client, 'POST', '/getProductsByBarcodes', 1, json=body)
+    assert response.get_json()['products'][products[sold]]['quantity_in_stock'] == 95
@@ -0,0 +1,44 @@
+import pytest
+
+import receipts_dao
+import stock_dao
+
+
+def test_replay_returns_the_first_result_without_applying_twice(connection, make_products):
+    product_id, = make_products(1)
+    lines = [{'product_id': product_id, 'delta': 5}]
+
+    first = receipts_dao.apply_goods_receipt(connection, 'delivery-1', lines)
+    replay = receipts_dao.apply_goods_receipt(connection, 'delivery-1', lines)
+
+    assert not first['replayed'] and replay['replayed']
+    assert replay['levels'] == first['levels'] == [{'product_id': product_id, 'quantity_in_stock': 105}]
+    assert stock_dao.get_stock_by_product_id(connection, product_id) == 105
+
+
+def test_replay_ignores_line_order_and_splitting(connection, make_products):
+    first, second = make_products(2)
+    receipts_dao.apply_goods_receipt(connection, 'delivery-2', [{'product_id': first, 'delta': 3},
+                                                                {'product_id': second, 'delta': 1}])
+    replay = receipts_dao.apply_goods_receipt(connection, 'delivery-2', [{'product_id': second, 'delta': 1},
+                                                                         {'product_id': first, 'delta': 2},
+                                                                         {'product_id': first, 'delta': 1}])
+    assert replay['replayed']
+
+
+def test_replay_with_different_lines_is_refused(client, make_products):
+    product_id, = make_products(1)
+    response = client.post('/goodsReceipt', json={'receipt_id': 'delivery-3',
+                                                  'lines': [{'product_id': product_id, 'delta': 5}]})
+    assert response.status_code == 201
+
+    response = client.post('/goodsReceipt', json={'receipt_id': 'delivery-3',
+                                                  'lines': [{'product_id': product_id, 'delta': 50}]})
+    assert response.status_code == 409
+
+
+def test_returns_may_not_take_stock_below_zero(connection, make_products):
+    product_id, = make_products(1, stock=4)
+    with pytest.raises(ValueError):
+        receipts_dao.apply_goods_receipt(connection, 'delivery-4', [{'product_id': product_id, 'delta': -5}])
+    assert stock_dao.get_stock_by_product_id(connection, product_id) == 4
@@ -0,0 +1,45 @@
+import datetime
+
+import orders_dao
+import sales_dao
+
+
+def rollup_rows(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sale_date, order_count, items_sold, revenue FROM daily_sales ORDER BY sale_date")
+        days = [(row[0], row[1], row[2], round(row[3], 2)) for row in cursor.fetchall()]
+        cursor.execute("SELECT sale_date, product_id, quantity, revenue FROM daily_product_sales "
+                       "WHERE quantity != 0 ORDER BY sale_date, product_id")
+        products = [(row[0], row[1], row[2], round(row[3], 2)) for row in cursor.fetchall()]
+    connection.commit()
+    return days, products
+
+
+def test_rebuild_matches_the_incremental_rollups(connection, make_products):
+    first, second = make_products(2, price=4)
+    kept = orders_dao.insert_order(connection, {
+        'customer_name': 'Kept', 'grandTotal': 12,
+        'order_details': [{'product_id': first, 'quantity': 2, 'total_price': 8},
+                          {'product_id': second, 'quantity': 1, 'total_price': 4}]})
+    deleted = orders_dao.insert_order(connection, {
+        'customer_name': 'Deleted', 'grandTotal': 20,
+        'order_details': [{'product_id': second, 'quantity': 5, 'total_price': 20}]})
+    assert orders_dao.delete_order(connection, deleted) == deleted
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT total FROM orders WHERE order_id = %s", (kept,))
+        assert cursor.fetchone()[0] == 12
+    today = datetime.date.today()
+    unfolded = sales_dao.get_sales_summary(connection, today, today, top=100)
+    assert sales_dao.fold_daily_sales(connection) >= 3
+    assert sales_dao.get_sales_summary(connection, today, today, top=100) == unfolded
+
+    incremental = rollup_rows(connection)
+    assert incremental[0] and all(revenue > 0 for *_, revenue in incremental[0])
+
+    sales_dao.rebuild_rollups(connection)
+    assert rollup_rows(connection) == incremental
+
+    summary = sales_dao.get_sales_summary(connection, today, today, top=100)
+    sold = {product['product_id']: (product['quantity'], product['revenue']) for product in summary['top_products']}
+    assert sold[first] == (2, 8) and sold[second] == (1, 4)
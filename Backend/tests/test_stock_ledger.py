@@ -0,0 +1,21 @@
+import stock_dao
+import stock_ledger
+
+
+def test_compaction_folds_movements_without_changing_balances(connection, make_products):
+    first, second = make_products(2, stock=50)
+    stock_dao.reserve_stock(connection, {first: 7, second: 2})
+    connection.commit()
+    stock_dao.update_stock(connection, second, 10)
+    before = stock_dao.get_stock_levels(connection, [first, second])
+
+    assert stock_ledger.compact(connection) >= 3
+
+    assert stock_dao.get_stock_levels(connection, [first, second]) == before == {first: 43, second: 58}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM stock_movements WHERE folded = 0 AND product_id IN (%s, %s)",
+                       (first, second))
+        assert cursor.fetchone()[0] == 0
+        cursor.execute("SELECT quantity_in_stock FROM stock WHERE product_id = %s", (first,))
+        assert cursor.fetchone()[0] == 43
+    connection.commit()
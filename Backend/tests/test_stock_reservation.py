@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+import orders_dao
+import stock_dao
+import stock_ledger
+from sql_connection import get_sql_connection
+
+
+def test_reserve_stock_reports_every_short_line_and_records_nothing(connection, make_products):
+    plenty, scarce = make_products(2, stock=3)
+    with pytest.raises(stock_dao.InsufficientStockError) as raised:
+        stock_dao.reserve_stock(connection, {plenty: 1, scarce: 4, 999999: 1})
+    connection.rollback()
+
+    assert raised.value.shortages == {scarce: 3, 999999: None}
+    assert stock_dao.get_stock_levels(connection, [plenty, scarce]) == {plenty: 3, scarce: 3}
+    assert stock_ledger.get_movements(connection, plenty) == []
+
+
+def test_concurrent_checkouts_never_oversell(make_products):
+    product_id, = make_products(1, stock=20)
+    outcomes = []
+
+    def till():
+        connection = get_sql_connection()
+        try:
+            for _ in range(5):
+                order = {'customer_name': 'Till', 'grandTotal': 10,
+                         'order_details': [{'product_id': product_id, 'quantity': 1, 'total_price': 10}]}
+                try:
+                    orders_dao.insert_order(connection, order)
+                    outcomes.append('sold')
+                except stock_dao.InsufficientStockError:
+                    outcomes.append('short')
+        finally:
+            connection.close()
+
+    tills = [threading.Thread(target=till) for _ in range(6)]
+    for thread in tills:
+        thread.start()
+    for thread in tills:
+        thread.join()
+
+    connection = get_sql_connection()
+    try:
+        assert outcomes.count('sold') == 20 and outcomes.count('short') == 10
+        assert stock_dao.get_stock_by_product_id(connection, product_id) == 0
+    finally:
+        connection.close()
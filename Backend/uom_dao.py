@@ -1,5 +1,7 @@
 import logging
 
+logger = logging.getLogger(__name__)
+
 def get_uoms(connection):
     """Fetches all units of measurement (UOMs) from the database."""
     response = []
@@ -8,9 +10,9 @@ def get_uoms(connection):
             query = "SELECT uom_id, uom_name FROM uom"
             cursor.execute(query)
             response = [{'uom_id': uom_id, 'uom_name': uom_name} for uom_id, uom_name in cursor]
-        logging.info("Retrieved UOMs successfully.")
+        logger.info("Retrieved UOMs successfully.")
     except Exception as e:
-        logging.error("Error retrieving UOMs: %s", str(e), exc_info=True)  # Log error with traceback
+        logger.error("Error retrieving UOMs: %s", str(e), exc_info=True)  # Log error with traceback
     return response
 
 if __name__ == '__main__':
@@ -20,8 +22,8 @@ if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)  # Set logging level
     try:
         uoms = get_uoms(connection)
-        logging.info("Retrieved UOMs: %s", uoms)
+        logger.info("Retrieved UOMs: %s", uoms)
     except Exception as e:
-        logging.error("Failed to retrieve UOMs: %s", str(e), exc_info=True)
+        logger.error("Failed to retrieve UOMs: %s", str(e), exc_info=True)
     finally:
         connection.close()  # Ensure connection is closed
@@ -5,8 +5,8 @@ from sql_connection import get_sql_connection
 def register_user(connection, username, password, role):
     cursor = connection.cursor()
     
-    # Hash the password before storing it
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    # Hash the password before storing it, as text so every storage engine returns a string
+    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
     query = "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)"
     cursor.execute(query, (username, hashed_password, role))
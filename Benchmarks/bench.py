@@ -0,0 +1,200 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from loadgen import Client, summarize
+
+# Throughput and latency of the core API flows at several concurrency levels.
+#
+#   python seed.py                                   # once: build sms_bench
+#   DB_NAME=sms_bench python ../Backend/start_flask.py   # in another shell
+#   python bench.py run --concurrency 1,8,32 --duration 15 --label baseline
+#   python bench.py compare results/baseline.json results/candidate.json
+#
+# Each scenario runs for --duration seconds per concurrency level, after a
+# --warmup period whose requests are not counted. A request counts as an
+# error when it fails or answers with a status of 400 or more. Results are
+# written to results/<label>.json and .csv.
+
+SCENARIOS = ('getProducts', 'getProductByBarcode', 'checkStock', 'insertOrder', 'processPayment', 'getAllOrders')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+CSV_FIELDS = ('scenario', 'concurrency', 'requests', 'errors', 'seconds', 'throughput_rps',
+              'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+
+
+class Workload:
+    """Builds the requests of each scenario from the server's own catalog and orders."""
+
+    def __init__(self, client):
+        self.products = [product for product in client.get_json('/getProducts')
+                         if product.get('quantity_in_stock')]
+        self.barcodes = [product['barcode'] for product in self.products if product.get('barcode')]
+        self.orders = client.get_json('/getAllOrders?limit=500')['orders']
+        if not self.products or not self.barcodes or not self.orders:
+            raise RuntimeError('The server has no products, barcodes or orders; run seed.py first')
+
+    def _lines(self, rng, count):
+        return [{'product_id': product['product_id'], 'quantity': rng.randint(1, 3)}
+                for product in rng.sample(self.products, min(count, len(self.products)))]
+
+    def build(self, scenario, rng):
+        """Return (method, path, body) for one request of the scenario."""
+        if scenario == 'getProducts':
+            return 'GET', '/getProducts', None
+        if scenario == 'getProductByBarcode':
+            return 'GET', f'/getProductByBarcode?barcode={rng.choice(self.barcodes)}', None
+        if scenario == 'checkStock':
+            return 'POST', '/checkStock', {'order_details': self._lines(rng, 5)}
+        if scenario == 'insertOrder':
+            lines = self._lines(rng, rng.randint(1, 8))
+            prices = {product['product_id']: product['price_per_unit'] for product in self.products}
+            total = sum(prices[line['product_id']] * line['quantity'] for line in lines)
+            return 'POST', '/insertOrder', {'customer_name': 'Bench', 'grandTotal': round(total, 2),
+                                            'order_details': lines}
+        if scenario == 'processPayment':
+            order = rng.choice(self.orders)
+            return 'POST', '/processPayment', {'payment_mode': 'Cash', 'order_id': order['order_id'],
+                                               'customer_name': order['customer_name'],
+                                               'grandTotal': order['total'], 'order_details': []}
+        if scenario == 'getAllOrders':
+            return 'GET', '/getAllOrders?limit=100', None
+        raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def measure(client, workload, scenario, concurrency, duration, warmup, seed):
+    """Run one scenario with `concurrency` threads; returns its summary."""
+    results = [([], [0]) for _ in range(concurrency)]
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        latencies, errors = results[index]
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            method, path, body = workload.build(scenario, rng)
+            status, seconds, _ = client.request(method, path, body)
+            if now < measure_from:
+                continue
+            if 0 < status < 400:
+                latencies.append(seconds)
+            else:
+                errors[0] += 1
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = [latency for thread_latencies, _ in results for latency in thread_latencies]
+    errors = sum(thread_errors[0] for _, thread_errors in results)
+    return summarize(latencies, errors, time.perf_counter() - measure_from)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    client = Client(args.url)
+    workload = Workload(client)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    scenarios = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+
+    report = {
+        'label': args.label,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'url': args.url,
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'duration': args.duration,
+        'warmup': args.warmup,
+        'results': [],
+    }
+    for scenario in scenarios:
+        for concurrency in levels:
+            summary = measure(client, workload, scenario, concurrency, args.duration, args.warmup, args.seed)
+            summary.update(scenario=scenario, concurrency=concurrency)
+            report['results'].append(summary)
+            print(f"{scenario:<20} c={concurrency:<4} {summary['throughput_rps']} req/s  "
+                  f"p50 {summary['p50_ms']} ms  p99 {summary['p99_ms']} ms  errors {summary['errors']}")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, args.label)
+    with open(path + '.json', 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    with open(path + '.csv', 'w', encoding='utf-8', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for summary in report['results']:
+            writer.writerow({field: summary[field] for field in CSV_FIELDS})
+    print(f'Results written to {path}.json and {path}.csv')
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as baseline_file, open(args.candidate, encoding='utf-8') as candidate_file:
+        baseline = {(row['scenario'], row['concurrency']): row for row in json.load(baseline_file)['results']}
+        candidate = json.load(candidate_file)['results']
+
+    def change(old, new):
+        if not old or new is None:
+            return 'n/a'
+        return f'{(new - old) / old * 100:+.1f}%'
+
+    print(f"{'scenario':<20} {'conc':>4} {'req/s':>10} {'change':>8} {'p99 ms':>10} {'change':>8}")
+    for row in candidate:
+        old = baseline.get((row['scenario'], row['concurrency']))
+        if old is None:
+            continue
+        print(f"{row['scenario']:<20} {row['concurrency']:>4} {row['throughput_rps']:>10} "
+              f"{change(old['throughput_rps'], row['throughput_rps']):>8} {row['p99_ms']:>10} "
+              f"{change(old['p99_ms'], row['p99_ms']):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the core API flows.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='measure a running server')
+    run_parser.add_argument('--url', default=os.environ.get('BENCH_URL', 'http://127.0.0.1:3000'))
+    run_parser.add_argument('--concurrency', default='1,4,16,32', help='comma-separated thread counts')
+    run_parser.add_argument('--duration', type=float, default=10, help='measured seconds per level')
+    run_parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds before each level')
+    run_parser.add_argument('--scenarios', help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--label', default=datetime.now().strftime('%Y%m%d-%H%M%S'))
+    run_parser.add_argument('--output-dir', default=RESULTS_DIR)
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        unknown = set((args.scenarios or '').split(',')) - set(SCENARIOS) - {''}
+        if unknown:
+            parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
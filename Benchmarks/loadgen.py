@@ -0,0 +1,90 @@
+import http.client
+import json
+import math
+import threading
+import time
+from urllib.parse import urlsplit
+
+# HTTP plumbing shared by bench.py and replay.py: keep-alive connections per
+# thread, timed requests and latency summaries. Standard library only, so the
+# load generator runs anywhere the backend does.
+
+
+class Client:
+    """Sends requests to one server, with a keep-alive connection per thread."""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            connection = self._local.connection = factory(self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def request(self, method, path, body=None, headers=None):
+        """Send one request; returns (status, seconds, response body). Status 0 means it failed."""
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+            headers.setdefault('Content-Type', 'application/json')
+        started = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+            return response.status, time.perf_counter() - started, data
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, time.perf_counter() - started, b''
+
+    def get_json(self, path):
+        status, _, data = self.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f'GET {path} answered {status}')
+        return json.loads(data)
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (milliseconds) of one measurement."""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': count + errors,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(count / elapsed, 2) if elapsed > 0 else None,
+        'mean_ms': ms(sum(ordered) / count) if count else None,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p90_ms': ms(percentile(ordered, 0.90)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1]) if ordered else None,
+    }
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from loadgen import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Backend'))
+
+import products_dao  # noqa: E402
+import sql_connection  # noqa: E402
+import stock_dao  # noqa: E402
+
+# Per-call latency of the hot lookups and stock updates of the scan and
+# checkout paths, once as plain text statements and once as prepared
+# statements (DB_PREPARED_STATEMENTS, see sql_connection.py). The DAO
+# functions are called in-process on one pooled connection, so the
+# difference is the parse and plan time the server saves, without HTTP in
+# the way.
+#
+#   python seed.py                                  # once: build sms_bench
+#   DB_NAME=sms_bench python prepared.py --iterations 5000
+#
+# Stock reservations (locking the stock rows and recording sale movements in
+# the stock ledger) run in a transaction that is rolled back. For the
+# end-to-end effect, run bench.py against servers started with
+# DB_PREPARED_STATEMENTS=false and true and compare the two results.
+
+CALLS = ('barcode lookup', 'price lookup', 'stock check', 'stock reservation')
+
+
+def load_catalog(connection):
+    """Product IDs and barcodes of the products with stock."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT p.product_id, p.barcode FROM products p JOIN stock s ON p.product_id = s.product_id "
+                       "WHERE s.quantity_in_stock > 0")
+        rows = cursor.fetchall()
+    if not rows:
+        raise RuntimeError('The database has no products in stock; run seed.py first')
+    return [row[0] for row in rows], [row[1] for row in rows if row[1]]
+
+
+def call(name, connection, rng, product_ids, barcodes, max_lines):
+    """Run one call of `name` with a random basket of 1 to `max_lines` products."""
+    count = rng.randint(1, max_lines)
+    if name == 'barcode lookup':
+        products_dao._query_products_by_barcodes(connection, rng.sample(barcodes, min(count, len(barcodes))))
+    elif name == 'price lookup':
+        products_dao.get_product_prices(connection, rng.sample(product_ids, min(count, len(product_ids))))
+    elif name == 'stock check':
+        stock_dao.get_stock_levels(connection, rng.sample(product_ids, min(count, len(product_ids))))
+    else:
+        basket = rng.sample(product_ids, min(count, len(product_ids)))
+        stock_dao.reserve_stock(connection, {product_id: 1 for product_id in basket})
+
+
+def measure(name, prepared, iterations, warmup, max_lines, seed):
+    """Latency summary of `iterations` calls of `name` after `warmup` unmeasured ones."""
+    sql_connection.PREPARED_STATEMENTS = prepared
+    rng = random.Random(seed)
+    connection = sql_connection.get_sql_connection()
+    try:
+        product_ids, barcodes = load_catalog(connection)
+        latencies = []
+        elapsed = 0.0
+        for index in range(warmup + iterations):
+            start = time.perf_counter()
+            call(name, connection, rng, product_ids, barcodes, max_lines)
+            seconds = time.perf_counter() - start
+            if name == 'stock reservation':
+                connection.rollback()
+            if index >= warmup:
+                latencies.append(seconds)
+                elapsed += seconds
+        return summarize(latencies, 0, elapsed)
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare plain and prepared hot statements.')
+    parser.add_argument('--iterations', type=int, default=2000, help='measured calls per statement and mode')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured calls before each measurement')
+    parser.add_argument('--max-lines', type=int, default=8, help='largest basket size')
+    parser.add_argument('--calls', help=f"comma-separated subset of {','.join(CALLS)}")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    calls = args.calls.split(',') if args.calls else list(CALLS)
+    unknown = set(calls) - set(CALLS)
+    if unknown:
+        parser.error(f"Unknown calls: {', '.join(sorted(unknown))}")
+
+    results = []
+    print(f"{'call':<17} {'plain p50':>10} {'prepared':>10} {'change':>8} {'plain p99':>10} {'prepared':>10} {'change':>8}")
+    for name in calls:
+        plain = measure(name, False, args.iterations, args.warmup, args.max_lines, args.seed)
+        prepared = measure(name, True, args.iterations, args.warmup, args.max_lines, args.seed)
+        results.append({'call': name, 'plain': plain, 'prepared': prepared})
+        changes = [f"{(prepared[key] - plain[key]) / plain[key] * 100:+.1f}%" if plain[key] else 'n/a'
+                   for key in ('p50_ms', 'p99_ms')]
+        print(f"{name:<17} {plain['p50_ms']:>10} {prepared['p50_ms']:>10} {changes[0]:>8} "
+              f"{plain['p99_ms']:>10} {prepared['p99_ms']:>10} {changes[1]:>8}")
+    print(f"Pool: {sql_connection.pool_stats()['statements_prepared']} statements prepared, "
+          f"{sql_connection.pool_stats()['statements_reused']} executions reused one")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'iterations': args.iterations, 'max_lines': args.max_lines, 'results': results},
+                      output, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from loadgen import Client, summarize
+
+# Replays recorded traffic against a server, keeping the recorded request mix
+# and inter-arrival times, and reports latency per endpoint.
+#
+#   python replay.py ../error.log --speed 1
+#   python replay.py ../error.log captures.jsonl --speed 20 --max-gap 30 --output replay.json
+#   python replay.py ../error.log --dry-run         # only show the recorded mix
+#
+# Supported captures:
+#   - werkzeug access lines, as in error.log, with or without ANSI colours and
+#     also inside the backend's JSON log lines (logging_config.py)
+#   - JSON lines with "method", "path" and a time field ("time", "timestamp"
+#     or "ts"; ISO text or epoch seconds), optionally "body" and "headers"
+# Other lines (startup banners, unrelated JSON) are skipped and counted.
+#
+# Access logs carry no request bodies. For POST endpoints that bench.py knows
+# (/insertOrder, /checkStock, /processPayment) a body is generated from the
+# server's catalog; other requests are sent without one. Idle gaps longer
+# than --max-gap seconds (server restarts, quiet hours) are shortened to it.
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+WERKZEUG_LINE = re.compile(r'\[(?P<time>\d{2}/\w{3}/\d{4} \d{2}:\d{2}:\d{2})\] '
+                           r'"(?P<method>[A-Z]+) (?P<path>\S+) HTTP/[\d.]+" (?P<status>\d{3})')
+WERKZEUG_TIME = '%d/%b/%Y %H:%M:%S'
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+GENERATED_BODIES = {'/insertOrder': 'insertOrder', '/checkStock': 'checkStock', '/processPayment': 'processPayment'}
+
+
+class Recorded:
+    __slots__ = ('at', 'method', 'path', 'body', 'headers')
+
+    def __init__(self, at, method, path, body=None, headers=None):
+        self.at = at
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+
+    @property
+    def endpoint(self):
+        """Method and path with query and numeric ids removed, for grouping."""
+        return f"{self.method} {ID_SEGMENT.sub('/{id}', self.path.split('?', 1)[0])}"
+
+
+def _parse_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def parse_line(line):
+    """Return a Recorded request for a capture line, or None if it is not one."""
+    line = ANSI_ESCAPE.sub('', line.strip())
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(entry, dict):
+            return None
+        if 'method' in entry and 'path' in entry:
+            stamp = entry.get('time', entry.get('timestamp', entry.get('ts')))
+            if stamp is None:
+                return None
+            return Recorded(_parse_time(stamp), entry['method'].upper(), entry['path'],
+                            entry.get('body'), entry.get('headers'))
+        line = ANSI_ESCAPE.sub('', str(entry.get('message', '')))
+    match = WERKZEUG_LINE.search(line)
+    if match is None:
+        return None
+    at = datetime.strptime(match.group('time'), WERKZEUG_TIME).timestamp()
+    return Recorded(at, match.group('method'), match.group('path'))
+
+
+def load_captures(paths):
+    """Parse every capture file; returns (requests sorted by time, skipped line count)."""
+    recorded, skipped = [], 0
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as capture:
+            for line in capture:
+                request = parse_line(line)
+                if request is None:
+                    skipped += line.strip() != ''
+                else:
+                    recorded.append(request)
+    recorded.sort(key=lambda request: request.at)
+    return recorded, skipped
+
+
+def schedule(recorded, speed, max_gap):
+    """Offsets in seconds from the start of the replay, one per recorded request."""
+    offsets, offset = [], 0.0
+    for index, request in enumerate(recorded):
+        if index:
+            gap = min(request.at - recorded[index - 1].at, max_gap)
+            offset += gap / speed if speed > 0 else 0.0
+        offsets.append(offset)
+    return offsets
+
+
+def describe(recorded):
+    """Recorded request mix and inter-arrival statistics."""
+    mix = Counter(request.endpoint for request in recorded)
+    gaps = sorted(later.at - earlier.at for earlier, later in zip(recorded, recorded[1:]))
+    return {
+        'requests': len(recorded),
+        'span_seconds': round(recorded[-1].at - recorded[0].at, 3) if recorded else 0,
+        'mix': {endpoint: {'count': count, 'share': round(count / len(recorded), 4)}
+                for endpoint, count in mix.most_common()},
+        'median_gap_seconds': gaps[len(gaps) // 2] if gaps else None,
+    }
+
+
+def replay(client, recorded, offsets, workers, workload=None, seed=42):
+    """Send every request at its offset; returns per-endpoint summaries."""
+    results = defaultdict(lambda: {'latencies': [], 'errors': 0, 'statuses': Counter(), 'late': 0})
+    lock = threading.Lock()
+    rng = random.Random(seed)
+
+    def send(request, body):
+        status, seconds, _ = client.request(request.method, request.path, body, request.headers)
+        with lock:
+            result = results[request.endpoint]
+            result['statuses'][str(status)] += 1
+            if 0 < status < 400:
+                result['latencies'].append(seconds)
+            else:
+                result['errors'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for request, offset in zip(recorded, offsets):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.1:
+                # Falling behind the recorded schedule: the server (or this
+                # generator) cannot keep up at this speed
+                results[request.endpoint]['late'] += 1
+            body = request.body
+            path = request.path.split('?', 1)[0]
+            if body is None and request.method == 'POST' and workload is not None and path in GENERATED_BODIES:
+                body = workload.build(GENERATED_BODIES[path], rng)[2]
+            pool.submit(send, request, body)
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for endpoint, result in sorted(results.items()):
+        summary = summarize(result['latencies'], result['errors'], elapsed)
+        summary['statuses'] = dict(result['statuses'])
+        summary['late'] = result['late']
+        report[endpoint] = summary
+    everything = [latency for result in results.values() for latency in result['latencies']]
+    report['ALL'] = summarize(everything, sum(result['errors'] for result in results.values()), elapsed)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded traffic against a server.')
+    parser.add_argument('captures', nargs='+', help='access logs or JSON-lines captures')
+    parser.add_argument('--url', default=os.environ.get('BENCH_URL', 'http://127.0.0.1:3000'))
+    parser.add_argument('--speed', type=float, default=1.0, help='time compression; 0 sends as fast as possible')
+    parser.add_argument('--max-gap', type=float, default=60.0, help='longest idle gap kept, in recorded seconds')
+    parser.add_argument('--workers', type=int, default=64, help='most requests in flight at once')
+    parser.add_argument('--no-bodies', action='store_true', help='do not generate bodies for POST requests')
+    parser.add_argument('--dry-run', action='store_true', help='only print the recorded mix')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    recorded, skipped = load_captures(args.captures)
+    if not recorded:
+        parser.error(f'No requests found in the captures ({skipped} lines skipped)')
+    offsets = schedule(recorded, args.speed, args.max_gap)
+    report = {'captures': args.captures, 'skipped_lines': skipped, 'recorded': describe(recorded),
+              'speed': args.speed, 'max_gap': args.max_gap, 'planned_seconds': round(offsets[-1], 3)}
+
+    if not args.dry_run:
+        client = Client(args.url)
+        workload = None
+        if not args.no_bodies:
+            from bench import Workload
+            workload = Workload(client)
+        report['url'] = args.url
+        report['endpoints'] = replay(client, recorded, offsets, args.workers, workload)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Backend'))
+
+import migrate  # noqa: E402
+import sales_dao  # noqa: E402
+import sqlite_connection  # noqa: E402
+import storage  # noqa: E402
+
+logger = logging.getLogger('seed')
+
+# Creates a benchmark database from Database/GSMS.sql, fills it with a
+# synthetic catalog and order history and applies the migrations in
+# Database/migrations. The same --seed always
+# produces the same catalog and orders (dated relative to today), so runs on
+# the same settings are comparable.
+#
+#   python seed.py --products 5000 --orders 50000 --days 90
+#
+# Connection settings come from the same DB_HOST / DB_PORT / DB_USER /
+# DB_PASSWORD variables as the backend; the database is BENCH_DB_NAME
+# (default sms_bench) and is dropped and recreated. With DB_ENGINE=sqlite the
+# database is the SQLite file SQLITE_PATH (default sms_bench.sqlite3), which is
+# deleted and recreated from Database/sqlite_schema.sql.
+
+SCHEMA_FILES = ('GSMS.sql',)
+BATCH_SIZE = 1000
+PAYMENT_MODES = ('UPI', 'Cash', 'Credit Card')
+NAMES = ('Rice', 'Wheat Flour', 'Sugar', 'Milk', 'Butter', 'Tea', 'Coffee', 'Soap', 'Shampoo', 'Biscuits',
+         'Oil', 'Salt', 'Lentils', 'Apple', 'Banana', 'Onion', 'Tomato', 'Juice', 'Chips', 'Detergent')
+CUSTOMERS = ('Asha', 'Ravi', 'Meena', 'Kiran', 'Prem', 'Divya', 'Arjun', 'Lakshmi', 'Vikram', 'Nisha')
+
+
+def connect(database=None):
+    return mysql.connector.connect(
+        host=os.environ.get('DB_HOST', 'localhost'),
+        port=int(os.environ.get('DB_PORT', '3306')),
+        user=os.environ.get('DB_USER', 'root'),
+        password=os.environ.get('DB_PASSWORD', 'Result@2020'),
+        database=database,
+    )
+
+
+def load_schema(cursor, database):
+    """Run the schema scripts against `database` instead of sms."""
+    for name in SCHEMA_FILES:
+        with open(os.path.join(ROOT, 'Database', name), encoding='utf-8') as schema:
+            script = schema.read().replace('use sms;', f'use `{database}`;')
+        for statement in script.split(';\n'):
+            lines = [line for line in statement.splitlines() if line.strip() and not line.startswith('--')]
+            if lines:
+                cursor.execute('\n'.join(lines).rstrip().rstrip(';'))
+
+
+def insert_batches(cursor, table, columns, rows):
+    statement = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+                 f"({', '.join(['%s'] * len(columns))})")
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(statement, rows[start:start + BATCH_SIZE])
+
+
+def create_database(database):
+    """Drop and recreate the benchmark database; returns a connection to it."""
+    if storage.DB_ENGINE == 'sqlite':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+        return sqlite_connection.connect(database)
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        cursor.execute(f"CREATE DATABASE `{database}`")
+        load_schema(cursor, database)
+    return connection
+
+
+def seed(database, products, orders, days, max_lines, rng):
+    connection = create_database(database)
+    cursor = connection.cursor()
+    for table in ('order_details', 'payments', 'orders', 'stock', 'products', 'uom', 'users'):
+        cursor.execute(f"DELETE FROM {table}")
+
+    insert_batches(cursor, 'uom', ('uom_id', 'uom_name'), [(1, 'kg'), (2, 'each')])
+    catalog = []
+    for product_id in range(1, products + 1):
+        name = f'{rng.choice(NAMES)} {product_id}'
+        catalog.append((product_id, name, rng.choice((1, 2)), round(rng.uniform(5, 500), 2),
+                        f'89{product_id:011d}'))
+    insert_batches(cursor, 'products', ('product_id', 'product_name', 'uom_id', 'price_per_unit', 'barcode'),
+                   catalog)
+    # Deep stock, so /insertOrder never runs out during a run
+    insert_batches(cursor, 'stock', ('product_id', 'quantity_in_stock'),
+                   [(product_id, 1000000) for product_id in range(1, products + 1)])
+    prices = {row[0]: row[3] for row in catalog}
+
+    now = datetime.now()
+    order_rows, detail_rows, payment_rows = [], [], []
+    for order_id in range(1, orders + 1):
+        ordered_at = now - timedelta(seconds=rng.randint(0, days * 86400))
+        lines = {rng.randint(1, products): rng.randint(1, 5) for _ in range(rng.randint(1, max_lines))}
+        total = round(sum(prices[product_id] * quantity for product_id, quantity in lines.items()), 2)
+        customer = rng.choice(CUSTOMERS)
+        order_rows.append((order_id, customer, total, ordered_at))
+        detail_rows.extend((order_id, product_id, quantity, prices[product_id] * quantity)
+                           for product_id, quantity in lines.items())
+        payment_rows.append((str(uuid.UUID(int=rng.getrandbits(128))), order_id, customer, ordered_at, 'Paid',
+                             rng.choice(PAYMENT_MODES), total))
+    insert_batches(cursor, 'orders', ('order_id', 'customer_name', 'total', 'datetime'), order_rows)
+    insert_batches(cursor, 'order_details', ('order_id', 'product_id', 'quantity', 'total_price'), detail_rows)
+    insert_batches(cursor, 'payments', ('payment_id', 'order_id', 'customer_name', 'date_and_time',
+                                        'payment_status', 'payment_mode', 'grand_total'), payment_rows)
+    connection.commit()
+    cursor.close()
+
+    # Indexes go on after the bulk load, which is faster than maintaining them
+    migrate.migrate(connection)
+    sales_dao.rebuild_rollups(connection)
+    connection.close()
+    return len(detail_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed a benchmark database with synthetic data.')
+    if storage.DB_ENGINE == 'sqlite':
+        default_database = os.environ.get('SQLITE_PATH', 'sms_bench.sqlite3')
+    else:
+        default_database = os.environ.get('BENCH_DB_NAME', 'sms_bench')
+    parser.add_argument('--database', default=default_database, help='database name, or file with DB_ENGINE=sqlite')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=90, help='spread the order history over this many days')
+    parser.add_argument('--max-lines', type=int, default=8, help='maximum lines per order')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.database == 'sms' or os.path.basename(args.database) == 'sms.sqlite3':
+        parser.error('Refusing to overwrite the store database')
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.monotonic()
+    lines = seed(args.database, args.products, args.orders, args.days, args.max_lines, random.Random(args.seed))
+    logger.info(f"Seeded {args.database}: {args.products} products, {args.orders} orders, {lines} order lines "
+                f"in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -142,6 +142,7 @@ DROP TABLE IF EXISTS `stock`;
 CREATE TABLE `stock` (
   `product_id` int NOT NULL,
   `quantity_in_stock` int NOT NULL,
+  `withdrawn` bigint NOT NULL DEFAULT '0',
   PRIMARY KEY (`product_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
@@ -152,10 +153,32 @@ CREATE TABLE `stock` (
 
 LOCK TABLES `stock` WRITE;
 /*!40000 ALTER TABLE `stock` DISABLE KEYS */;
-INSERT INTO `stock` VALUES (2,53),(4,20),(10,26),(49,50),(81,58),(82,46),(83,50),(84,50),(85,50);
+INSERT INTO `stock` VALUES (2,53,0),(4,20,0),(10,26,0),(49,50,0),(81,58,0),(82,46,0),(83,50,0),(84,50,0),(85,50,0);
 /*!40000 ALTER TABLE `stock` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `stock_movements`
+--
+
+DROP TABLE IF EXISTS `stock_movements`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `stock_movements` (
+  `movement_id` bigint NOT NULL AUTO_INCREMENT,
+  `product_id` int NOT NULL,
+  `quantity` int NOT NULL,
+  `reason` varchar(20) NOT NULL,
+  `order_id` int DEFAULT NULL,
+  `receipt_id` varchar(64) DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  `folded` tinyint NOT NULL DEFAULT '0',
+  PRIMARY KEY (`movement_id`),
+  KEY `stock_movements_unfolded` (`folded`,`product_id`),
+  KEY `stock_movements_product` (`product_id`,`movement_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `uom`
 --
@@ -0,0 +1 @@
+DROP INDEX products_barcode;
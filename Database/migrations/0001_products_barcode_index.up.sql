@@ -0,0 +1,4 @@
+-- Every scan at the till looks a product up by barcode (/getProductByBarcode,
+-- /getProductsByBarcodes and the catalog cache's cold path).
+-- Not unique: /updateProduct can store an empty barcode on several products.
+CREATE INDEX products_barcode ON products (barcode);
@@ -0,0 +1 @@
+DROP INDEX products_name_uom;
@@ -0,0 +1,7 @@
+-- insert_product, insert_or_update_product_with_stock and upsert_products
+-- identify a product by (product_name, uom_id). The unique key serves that
+-- probe and stops concurrent inserts from creating the same product twice.
+-- Duplicates already stored make this fail; list them with
+--   SELECT product_name, uom_id, COUNT(*) FROM products
+--   GROUP BY product_name, uom_id HAVING COUNT(*) > 1;
+CREATE UNIQUE INDEX products_name_uom ON products (product_name, uom_id);
@@ -0,0 +1 @@
+DROP INDEX orders_datetime ON orders;
@@ -0,0 +1,4 @@
+-- Order history (/getAllOrders, exports, rollup rebuilds) reads orders by
+-- datetime, newest first, with order_id as the tie-breaker. The primary key
+-- is part of every secondary index, so (datetime) covers that order.
+CREATE INDEX orders_datetime ON orders (datetime);
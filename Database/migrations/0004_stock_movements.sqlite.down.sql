@@ -0,0 +1,6 @@
+-- Fold the movements not folded yet into stock before dropping the ledger,
+-- so no balance changes. stock.withdrawn stays: sqlite_schema.sql creates it
+-- and 0004's up migration does not add it back.
+UPDATE stock SET quantity_in_stock = quantity_in_stock + COALESCE(
+  (SELECT SUM(m.quantity) FROM stock_movements m WHERE m.product_id = stock.product_id AND m.folded = 0), 0);
+DROP TABLE stock_movements;
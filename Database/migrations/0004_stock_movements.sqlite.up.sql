@@ -0,0 +1,15 @@
+-- Append-only stock ledger (see Backend/stock_ledger.py). AUTOINCREMENT keeps
+-- movement ids from being reused after the newest rows are deleted.
+-- IF NOT EXISTS: sqlite_schema.sql creates it too.
+CREATE TABLE IF NOT EXISTS stock_movements (
+  movement_id integer PRIMARY KEY AUTOINCREMENT,
+  product_id int NOT NULL,
+  quantity int NOT NULL,
+  reason varchar(20) NOT NULL,
+  order_id int DEFAULT NULL,
+  receipt_id varchar(64) DEFAULT NULL,
+  created_at datetime NOT NULL,
+  folded tinyint NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS stock_movements_unfolded ON stock_movements (folded, product_id);
+CREATE INDEX IF NOT EXISTS stock_movements_product ON stock_movements (product_id, movement_id);
@@ -0,0 +1,27 @@
+-- Append-only stock ledger (see Backend/stock_ledger.py). Every stock change
+-- is a signed movement; stock.quantity_in_stock holds the movements already
+-- folded in, and those with folded = 0 are added on read. (folded,
+-- product_id) serves both the per-product balance lookups and compaction.
+-- IF NOT EXISTS: GSMS.sql creates it too.
+CREATE TABLE IF NOT EXISTS stock_movements (
+  movement_id bigint NOT NULL AUTO_INCREMENT,
+  product_id int NOT NULL,
+  quantity int NOT NULL,
+  reason varchar(20) NOT NULL,
+  order_id int DEFAULT NULL,
+  receipt_id varchar(64) DEFAULT NULL,
+  created_at datetime NOT NULL,
+  folded tinyint NOT NULL DEFAULT 0,
+  PRIMARY KEY (movement_id),
+  KEY stock_movements_unfolded (folded, product_id),
+  KEY stock_movements_product (product_id, movement_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+-- Running total of the stock taken out of each row, kept under the row lock
+-- so checkout never has to lock the ledger (see Backend/stock_ledger.py).
+-- Added only if missing, since GSMS.sql creates it too.
+SET @add_withdrawn = IF((SELECT COUNT(*) FROM information_schema.columns WHERE table_schema = DATABASE()
+                         AND table_name = 'stock' AND column_name = 'withdrawn') = 0,
+                        'ALTER TABLE stock ADD COLUMN withdrawn bigint NOT NULL DEFAULT 0', 'DO 0');
+PREPARE add_withdrawn FROM @add_withdrawn;
+EXECUTE add_withdrawn;
+DEALLOCATE PREPARE add_withdrawn;
@@ -0,0 +1,3 @@
+DROP TABLE IF EXISTS daily_payment_sales;
+DROP TABLE IF EXISTS daily_product_sales;
+DROP TABLE IF EXISTS daily_sales;
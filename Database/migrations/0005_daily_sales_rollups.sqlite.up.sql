@@ -0,0 +1,22 @@
+-- Already part of sqlite_schema.sql; kept here so the versions line up
+CREATE TABLE IF NOT EXISTS daily_sales (
+  sale_date date NOT NULL PRIMARY KEY,
+  order_count int NOT NULL DEFAULT 0,
+  items_sold double NOT NULL DEFAULT 0,
+  revenue double NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS daily_product_sales (
+  sale_date date NOT NULL,
+  product_id int NOT NULL,
+  quantity double NOT NULL DEFAULT 0,
+  revenue double NOT NULL DEFAULT 0,
+  PRIMARY KEY (sale_date, product_id)
+);
+CREATE INDEX IF NOT EXISTS daily_product_sales_product_id ON daily_product_sales (product_id);
+CREATE TABLE IF NOT EXISTS daily_payment_sales (
+  sale_date date NOT NULL,
+  payment_mode varchar(20) NOT NULL,
+  payment_count int NOT NULL DEFAULT 0,
+  amount decimal(12,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (sale_date, payment_mode)
+);
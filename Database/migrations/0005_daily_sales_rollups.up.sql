@@ -0,0 +1,29 @@
+-- Daily sales rollups, maintained by orders_dao.insert_order / delete_order
+-- and by payment status changes. Orders placed before this migration are not
+-- in the rollups until they are rebuilt from history:
+--   python Backend/sales_dao.py rebuild
+
+CREATE TABLE `daily_sales` (
+  `sale_date` date NOT NULL,
+  `order_count` int NOT NULL DEFAULT 0,
+  `items_sold` double NOT NULL DEFAULT 0,
+  `revenue` double NOT NULL DEFAULT 0,
+  PRIMARY KEY (`sale_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE `daily_product_sales` (
+  `sale_date` date NOT NULL,
+  `product_id` int NOT NULL,
+  `quantity` double NOT NULL DEFAULT 0,
+  `revenue` double NOT NULL DEFAULT 0,
+  PRIMARY KEY (`sale_date`,`product_id`),
+  KEY `product_id` (`product_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE `daily_payment_sales` (
+  `sale_date` date NOT NULL,
+  `payment_mode` varchar(20) NOT NULL,
+  `payment_count` int NOT NULL DEFAULT 0,
+  `amount` decimal(12,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`sale_date`,`payment_mode`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,8 @@
+-- Already part of sqlite_schema.sql; kept here so the versions line up
+CREATE TABLE IF NOT EXISTS goods_receipts (
+  receipt_id varchar(64) NOT NULL PRIMARY KEY,
+  received_at datetime NOT NULL,
+  line_count int NOT NULL,
+  lines_hash char(64) NOT NULL,
+  result text NOT NULL
+);
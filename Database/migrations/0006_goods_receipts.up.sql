@@ -0,0 +1,15 @@
+-- Applied goods receipts, keyed by the client-supplied receipt id, so a
+-- retried /goodsReceipt call returns the original result instead of adding
+-- the delivery twice. lines_hash identifies the lines it was applied with,
+-- so a reused id with different lines is refused. Written by
+-- receipts_dao.apply_goods_receipt.
+
+CREATE TABLE `goods_receipts` (
+  `receipt_id` varchar(64) NOT NULL,
+  `received_at` datetime NOT NULL,
+  `line_count` int NOT NULL,
+  `lines_hash` char(64) NOT NULL,
+  `result` json NOT NULL,
+  PRIMARY KEY (`receipt_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
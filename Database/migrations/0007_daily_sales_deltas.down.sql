@@ -0,0 +1,6 @@
+-- Fold the deltas into daily_sales before dropping them, so no day changes
+INSERT INTO daily_sales (sale_date, order_count, items_sold, revenue)
+SELECT sale_date, SUM(order_count), SUM(items_sold), SUM(revenue) FROM daily_sales_deltas GROUP BY sale_date
+ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count),
+  items_sold = items_sold + VALUES(items_sold), revenue = revenue + VALUES(revenue);
+DROP TABLE daily_sales_deltas;
@@ -0,0 +1,6 @@
+-- Fold the deltas into daily_sales before dropping them, so no day changes
+INSERT INTO daily_sales (sale_date, order_count, items_sold, revenue)
+SELECT sale_date, SUM(order_count), SUM(items_sold), SUM(revenue) FROM daily_sales_deltas WHERE true GROUP BY sale_date
+ON CONFLICT (sale_date) DO UPDATE SET order_count = order_count + excluded.order_count,
+  items_sold = items_sold + excluded.items_sold, revenue = revenue + excluded.revenue;
+DROP TABLE daily_sales_deltas;
@@ -0,0 +1,9 @@
+-- Already part of sqlite_schema.sql; kept here so the versions line up
+CREATE TABLE IF NOT EXISTS daily_sales_deltas (
+  delta_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  sale_date date NOT NULL,
+  order_count int NOT NULL,
+  items_sold double NOT NULL,
+  revenue double NOT NULL
+);
+CREATE INDEX IF NOT EXISTS daily_sales_deltas_sale_date ON daily_sales_deltas (sale_date);
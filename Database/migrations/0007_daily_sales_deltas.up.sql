@@ -0,0 +1,14 @@
+-- Per-order changes to daily_sales, appended by orders_dao.insert_order and
+-- delete_order instead of updating the day's daily_sales row, which every
+-- checkout would otherwise lock until it commits. sales_dao.fold_daily_sales
+-- adds them into daily_sales and deletes them; readers add the ones not
+-- folded yet.
+CREATE TABLE `daily_sales_deltas` (
+  `delta_id` bigint NOT NULL AUTO_INCREMENT,
+  `sale_date` date NOT NULL,
+  `order_count` int NOT NULL,
+  `items_sold` double NOT NULL,
+  `revenue` double NOT NULL,
+  PRIMARY KEY (`delta_id`),
+  KEY `sale_date` (`sale_date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
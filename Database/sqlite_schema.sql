@@ -0,0 +1,127 @@
+-- SQLite version of GSMS.sql and the tables of migrations 0004 to 0007, for
+-- DB_ENGINE=sqlite. Applied by Backend/sqlite_connection.py whenever a
+-- process first opens the database file; every statement is idempotent.
+--
+-- Column types keep their MySQL names so sqlite_connection's converters
+-- return datetime, date and Decimal values like mysql.connector does.
+-- product_name compares case-insensitively, like the MySQL collation.
+
+CREATE TABLE IF NOT EXISTS uom (
+  uom_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  uom_name varchar(45) NOT NULL
+);
+
+INSERT OR IGNORE INTO uom (uom_id, uom_name) VALUES (1, 'kg'), (2, 'each');
+
+CREATE TABLE IF NOT EXISTS products (
+  product_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  product_name varchar(255) NOT NULL COLLATE NOCASE,
+  uom_id int DEFAULT NULL REFERENCES uom (uom_id) ON DELETE SET NULL,
+  price_per_unit decimal(10,2) NOT NULL,
+  barcode varchar(255) DEFAULT NULL
+);
+
+CREATE INDEX IF NOT EXISTS products_uom_id ON products (uom_id);
+
+CREATE TABLE IF NOT EXISTS stock (
+  product_id int NOT NULL PRIMARY KEY,
+  quantity_in_stock int NOT NULL,
+  withdrawn bigint NOT NULL DEFAULT 0
+);
+
+-- Append-only stock ledger (see Backend/stock_ledger.py); AUTOINCREMENT keeps
+-- movement ids from being reused after the newest rows are deleted
+CREATE TABLE IF NOT EXISTS stock_movements (
+  movement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  product_id int NOT NULL,
+  quantity int NOT NULL,
+  reason varchar(20) NOT NULL,
+  order_id int DEFAULT NULL,
+  receipt_id varchar(64) DEFAULT NULL,
+  created_at datetime NOT NULL,
+  folded tinyint NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS stock_movements_unfolded ON stock_movements (folded, product_id);
+CREATE INDEX IF NOT EXISTS stock_movements_product ON stock_movements (product_id, movement_id);
+
+CREATE TABLE IF NOT EXISTS orders (
+  order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  customer_name varchar(100) NOT NULL,
+  total double NOT NULL,
+  datetime datetime NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS order_details (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  order_id int NOT NULL REFERENCES orders (order_id) ON DELETE CASCADE,
+  product_id int NOT NULL,
+  quantity double NOT NULL,
+  total_price double NOT NULL,
+  UNIQUE (order_id, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS order_details_product_id ON order_details (product_id);
+
+CREATE TABLE IF NOT EXISTS payments (
+  payment_id char(36) NOT NULL PRIMARY KEY,
+  order_id int NOT NULL REFERENCES orders (order_id) ON DELETE CASCADE,
+  customer_name varchar(255) NOT NULL,
+  date_and_time datetime DEFAULT (datetime('now', 'localtime')),
+  payment_status varchar(50) DEFAULT NULL,
+  payment_mode varchar(20) NOT NULL CHECK (payment_mode IN ('UPI', 'Cash', 'Credit Card')),
+  grand_total decimal(10,2) DEFAULT NULL,
+  razorpay_order_id varchar(100) DEFAULT NULL
+);
+
+CREATE INDEX IF NOT EXISTS payments_order_id ON payments (order_id);
+
+CREATE TABLE IF NOT EXISTS users (
+  user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username varchar(255) NOT NULL,
+  password varchar(255) NOT NULL,
+  role varchar(10) NOT NULL CHECK (role IN ('admin', 'cashier'))
+);
+
+CREATE TABLE IF NOT EXISTS daily_sales (
+  sale_date date NOT NULL PRIMARY KEY,
+  order_count int NOT NULL DEFAULT 0,
+  items_sold double NOT NULL DEFAULT 0,
+  revenue double NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS daily_sales_deltas (
+  delta_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  sale_date date NOT NULL,
+  order_count int NOT NULL,
+  items_sold double NOT NULL,
+  revenue double NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS daily_sales_deltas_sale_date ON daily_sales_deltas (sale_date);
+
+CREATE TABLE IF NOT EXISTS daily_product_sales (
+  sale_date date NOT NULL,
+  product_id int NOT NULL,
+  quantity double NOT NULL DEFAULT 0,
+  revenue double NOT NULL DEFAULT 0,
+  PRIMARY KEY (sale_date, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS daily_product_sales_product_id ON daily_product_sales (product_id);
+
+CREATE TABLE IF NOT EXISTS daily_payment_sales (
+  sale_date date NOT NULL,
+  payment_mode varchar(20) NOT NULL,
+  payment_count int NOT NULL DEFAULT 0,
+  amount decimal(12,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (sale_date, payment_mode)
+);
+
+CREATE TABLE IF NOT EXISTS goods_receipts (
+  receipt_id varchar(64) NOT NULL PRIMARY KEY,
+  received_at datetime NOT NULL,
+  line_count int NOT NULL,
+  lines_hash char(64) NOT NULL,
+  result text NOT NULL
+);